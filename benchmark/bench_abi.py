@@ -0,0 +1,70 @@
+"""
+ABI 解码: 原来的字符串切片与 EthereumAbiCodec 批量解码对比, 以及函数选择器缓存.
+python -m benchmark.bench_abi [items]
+"""
+import sys
+import time
+
+from coin.resolver.eth_abi_codec import EthereumAbiCodec
+from digit import digit
+from sha3 import keccak_256
+
+
+def slice_selector(abi_func: str):
+    """原 EthereumResolver.get_abi, 每次都解析签名并计算 keccak"""
+    abi_func = abi_func.encode()
+    func, args = [i.strip(b')') for i in abi_func.strip().split(b'(')]
+    func_args = b"%s(%s)" % (func, b','.join([i.strip().split(b' ')[0] for i in args.split(b',')]))
+    return keccak_256(func_args).hexdigest()[:8]
+
+
+def slice_string(name_abi):
+    """原 EthereumResolver.parse_abi_name"""
+    return bytes.fromhex(digit.del_0x(name_abi)[128:]).strip(b'\x00').decode()
+
+
+def measure(name, func):
+    start = time.perf_counter()
+    result = func()
+    print('{:<28} {:8.1f}ms'.format(name, (time.perf_counter() - start) * 1000))
+    return result
+
+
+def main(count=100000):
+    signatures = ['balanceOf(address)', 'transfer(address to, uint256 value)', 'decimals()', 'name()']
+    calls = [signatures[i % len(signatures)] for i in range(count)]
+    expect = measure('slice    selector', lambda: [slice_selector(s) for s in calls])
+    result = measure('codec    selector', lambda: [EthereumAbiCodec.selector(s)[2:] for s in calls])
+    assert result == expect
+
+    strings = ['0x' + EthereumAbiCodec.encode(['string'], ['Token {}'.format(i)]).hex() for i in range(count)]
+    expect = measure('slice    string', lambda: [slice_string(s) for s in strings])
+    result = measure('codec    string', lambda: EthereumAbiCodec.decode_many('string', strings))
+    assert result == expect
+
+    uints = ['0x' + EthereumAbiCodec.encode(['uint256'], [i * 10 ** 18]).hex() for i in range(count)]
+    expect = measure('hex_to_int uint256', lambda: [digit.hex_to_int(s) for s in uints])
+    result = measure('codec    uint256', lambda: EthereumAbiCodec.decode_many('uint256', uints))
+    assert result == expect
+
+    # get_contract_info: 构建 4 个调用(选择器) + 解析 4 个返回值
+    def slice_info():
+        selectors = [[slice_selector(s) for s in ('name()', 'symbol()', 'decimals()', 'totalSupply()')]
+                     for _ in range(count // 4)]
+        return selectors, [(slice_string(strings[i]), slice_string(strings[i]), digit.hex_to_int(uints[i]),
+                            digit.hex_to_int(uints[i])) for i in range(count // 4)]
+
+    def codec_info():
+        selectors = [[EthereumAbiCodec.selector(s)[2:] for s in ('name()', 'symbol()', 'decimals()', 'totalSupply()')]
+                     for _ in range(count // 4)]
+        names = EthereumAbiCodec.decode_many('string', strings[:count // 4])
+        numbers = EthereumAbiCodec.decode_many('uint256', uints[:count // 4])
+        return selectors, list(zip(names, names, numbers, numbers))
+
+    expect = measure('slice    contract info', slice_info)
+    result = measure('codec    contract info', codec_info)
+    assert result == expect
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
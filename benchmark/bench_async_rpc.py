@@ -0,0 +1,54 @@
+"""
+同步 EthereumRpc 与 AsyncEthereumRpc 对比.
+python -m benchmark.bench_async_rpc [calls] [delay]
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.stub_node import StubNode, fake_address
+from httplibs.coinrpc.ethrpc import EthereumRpc, AsyncEthereumRpc
+
+
+def run_sync(url, addresses, threads):
+    rpc = EthereumRpc(url, pool_maxsize=threads)
+    start = time.perf_counter()
+    if threads <= 1:
+        result = [rpc.get_balance(address) for address in addresses]
+    else:
+        with ThreadPoolExecutor(threads) as executor:
+            result = list(executor.map(rpc.get_balance, addresses))
+    cost = time.perf_counter() - start
+    rpc.close()
+    return result, cost
+
+
+async def run_async(url, addresses, concurrency):
+    async with AsyncEthereumRpc(url, max_concurrency=concurrency) as rpc:
+        start = time.perf_counter()
+        result = await asyncio.gather(*[rpc.get_balance(address) for address in addresses])
+        return result, time.perf_counter() - start
+
+
+def main(calls=2000, delay=0.005):
+    addresses = [fake_address('bench', i) for i in range(calls)]
+    with StubNode(delay=delay) as node:
+        expect, cost = run_sync(node.url, addresses, 1)
+        print('sync  serial        : {:>6} calls {:8.3f}s {:10.1f} calls/s'.format(calls, cost, calls / cost))
+        for threads in (16, 64):
+            result, cost = run_sync(node.url, addresses, threads)
+            assert result == expect
+            print('sync  {:>3} threads   : {:>6} calls {:8.3f}s {:10.1f} calls/s'.format(
+                threads, calls, cost, calls / cost))
+        for concurrency in (16, 64, 256):
+            result, cost = asyncio.run(run_async(node.url, addresses, concurrency))
+            assert list(result) == expect
+            print('async {:>3} concurrency: {:>6} calls {:8.3f}s {:10.1f} calls/s'.format(
+                concurrency, calls, cost, calls / cost))
+
+
+if __name__ == '__main__':
+    _calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    _delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+    main(_calls, _delay)
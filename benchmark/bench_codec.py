@@ -0,0 +1,56 @@
+"""
+json 编解码对比: 标准库 json 与 orjson, 以及经过 StubNode 的完整批量请求.
+python -m benchmark.bench_codec [items]
+"""
+import sys
+import time
+
+from benchmark.stub_node import StubNode, fake_address
+from httplibs.codec import JsonCodec, get_codec, orjson
+from httplibs.coinrpc.ethrpc import EthereumRpc
+from httplibs.jsonrpc import JsonRpcV2
+
+
+def timeit(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return result, best
+
+
+def main(items=10000):
+    node = StubNode(txs_per_block=100)
+    addresses = [fake_address('bench', i) for i in range(items)]
+    rpc = JsonRpcV2('http://127.0.0.1')
+    request = [{'jsonrpc': '2.0', 'id': k, 'method': 'eth_getBalance', 'params': [address, 'latest']}
+               for k, address in enumerate(addresses)]
+    balances = [{'jsonrpc': '2.0', 'id': k, 'result': node.eth_get_balance(address)}
+                for k, address in enumerate(addresses)]
+    blocks = [{'jsonrpc': '2.0', 'id': k, 'result': node.block(1000 + k)} for k in range(items // 100)]
+    codecs = [JsonCodec()] + ([get_codec('orjson')] if orjson is not None else [])
+    for name, payload in (('balance request', request), ('balance result', balances), ('block result', blocks)):
+        data = JsonCodec().dumps(payload)
+        for codec in codecs:
+            _, encode = timeit(lambda: codec.dumps(payload))
+            decoded, decode = timeit(lambda: codec.loads(data))
+            assert decoded == payload
+            print('{:<6} {:<15}: {:>6} items {:>9} bytes, encode {:7.2f}ms, decode {:7.2f}ms'.format(
+                codec.name, name, len(payload), len(data), encode * 1000, decode * 1000))
+    rpc.close()
+
+    with StubNode() as node:
+        expect = None
+        for codec in codecs:
+            rpc = EthereumRpc(node.url, codec=codec, max_batch_size=None, max_batch_bytes=None)
+            result, cost = timeit(lambda: rpc.get_balance(addresses))
+            expect = expect or result
+            assert result == expect
+            print('{:<6} get_balance batch  : {:>6} items {:8.3f}s'.format(codec.name, items, cost))
+            rpc.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,44 @@
+"""
+logsBloom 预过滤: 逐块获取全部收据与只为 bloom 可能匹配的块获取收据对比.
+python -m benchmark.bench_logs_bloom [blocks] [wallets]
+"""
+import sys
+import time
+
+from benchmark.stub_node import StubNode, fake_address
+from coin.address_index import AddressIndex
+from coin.logs_bloom import LogsBloomFilter
+from coin.resolver.eth_log_resolver import EthereumLogResolver
+from httplibs.coinrpc.ethrpc import EthereumRpc
+
+
+def main(count=200, wallets=20, txs_per_block=100):
+    start_height = 1000
+    with StubNode(txs_per_block=txs_per_block, delay=0.002) as node:
+        # 钱包地址分散在少数块中
+        addresses = [fake_address('receiver', start_height + k * (count // wallets), 3) for k in range(wallets)]
+        index = AddressIndex(addresses)
+        heights = list(range(start_height, start_height + count))
+        rpc = EthereumRpc(node.url)
+
+        calls, start = node.call_count, time.perf_counter()
+        tx_hashes = [tx_hash for block in rpc.get_block_by_number([hex(h) for h in heights], False)
+                     for tx_hash in block['transactions']]
+        receipts = rpc.get_transaction_receipt(tx_hashes)
+        expect = EthereumLogResolver.resolver_receipts(receipts, address_index=index)
+        print('all receipts : {:>6} blocks {:8.3f}s {:>8} calls, {} transfers'.format(
+            count, time.perf_counter() - start, node.call_count - calls, len(expect)))
+
+        log_filter = LogsBloomFilter(addresses=addresses)
+        calls, start = node.call_count, time.perf_counter()
+        result = rpc.get_block_token_transfers(heights, log_filter, index)
+        print('bloom filter : {:>6} blocks {:8.3f}s {:>8} calls, {} transfers, {}'.format(
+            count, time.perf_counter() - start, node.call_count - calls, len(result), log_filter.stats()))
+        assert [t.to_dict() for t in result] == [t.to_dict() for t in expect]
+        rpc.close()
+
+
+if __name__ == '__main__':
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    _wallets = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    main(_count, _wallets)
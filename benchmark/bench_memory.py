@@ -0,0 +1,68 @@
+"""
+每笔交易占用内存对比: 原始 dict, 带 __dict__ 的 Tx, __slots__ Tx, LazyTx, BlockBatch.
+LazyTx 需要保留原始 dict, 实际占用为两者之和; 其他方式解析后原始 dict 可以释放.
+python -m benchmark.bench_memory [blocks] [txs_per_block]
+"""
+import gc
+import sys
+import tracemalloc
+
+from benchmark.stub_node import StubNode
+from coin.coin_tools import BlockBatch, Tx
+from coin.resolver.eth_resolver import EthereumResolver
+
+
+class DictTx(object):
+    """改为 __slots__ 之前的 Tx, 用于对比"""
+
+    def __init__(self, *args):
+        for field, value in zip(Tx.FIELDS, args):
+            setattr(self, field, value)
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, memory
+
+
+def main(count=100, txs_per_block=300):
+    node = StubNode(txs_per_block=txs_per_block)
+    heights = range(1000, 1000 + count)
+    total = count * txs_per_block
+
+    raw, memory = measure(lambda: [node.block(height) for height in heights])
+    print('{:<10}: {:>8} txs {:8.1f} bytes/tx'.format('raw dict', total, memory / total))
+
+    def eager(cls):
+        return [[cls(*[getattr(tx, field) for field in Tx.FIELDS]) for tx in block.transactions]
+                for block in map(EthereumResolver.resolver_block, raw)]
+
+    blocks = [EthereumResolver.resolver_block(block) for block in raw]
+    cases = (
+        ('__dict__', lambda: eager(DictTx)),
+        ('__slots__', lambda: eager(Tx)),
+        ('LazyTx', lambda: [EthereumResolver.resolver_block(block, lazy=True) for block in raw]),
+        ('BlockBatch', lambda: BlockBatch(blocks)),
+    )
+    for name, build in cases:
+        result, memory = measure(build)
+        print('{:<10}: {:>8} txs {:8.1f} bytes/tx'.format(name, total, memory / total))
+        del result
+
+    batch = BlockBatch(blocks)
+    print('BlockBatch columns: {:.1f} bytes/tx'.format(batch.nbytes / total))
+    expect = [tx.to_dict() for block in blocks for tx in block.transactions]
+    assert [row.to_tx().to_dict() for row in batch] == expect
+    assert [tx.to_dict() for block in range(batch.block_count)
+            for tx in batch.get_block(block).transactions] == expect
+
+
+if __name__ == '__main__':
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    _txs = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    main(_count, _txs)
@@ -0,0 +1,29 @@
+"""
+批量代币余额: 逐个 eth_call 与 Multicall 聚合调用对比.
+python -m benchmark.bench_multicall [addresses] [delay]
+"""
+import sys
+import time
+
+from benchmark.stub_node import StubNode, fake_address
+from httplibs.coinrpc.ethrpc import EthereumRpc
+
+
+def main(count=20000, delay=0.005):
+    addresses = [fake_address('bench', i) for i in range(count)]
+    contract = fake_address('token')
+    with StubNode(delay=delay) as node:
+        results = []
+        for name, rpc in (('eth_call', EthereumRpc(node.url)),
+                          ('multicall', EthereumRpc(node.url, multicall=True))):
+            calls, requests = node.call_count, node.request_count
+            start = time.perf_counter()
+            results.append(rpc.get_balance(addresses, contract))
+            print('{:<9} get_balance: {:>6} addresses {:8.3f}s  {:>6} eth_call  {:>4} http requests'.format(
+                name, count, time.perf_counter() - start, node.call_count - calls, node.request_count - requests))
+            rpc.close()
+        assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, float(sys.argv[2]) if len(sys.argv) > 2 else 0.005)
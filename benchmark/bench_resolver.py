@@ -0,0 +1,51 @@
+"""
+resolver_block 逐笔解析与 LazyTx 延迟解析对比.
+python -m benchmark.bench_resolver [blocks] [txs_per_block]
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmark.stub_node import StubNode
+from coin.resolver.eth_resolver import LazyTx, EthereumResolver
+
+
+def receiver_only(block):
+    return [tx.receiver for tx in block.transactions]
+
+
+def all_fields(block):
+    return [tuple(getattr(tx, field) for field in LazyTx.FIELDS) for tx in block.transactions]
+
+
+def measure(blocks, lazy, access):
+    start = time.perf_counter()
+    result = [access(EthereumResolver.resolver_block(block, lazy=lazy)) for block in blocks]
+    cost = time.perf_counter() - start
+    tracemalloc.start()
+    resolved = [EthereumResolver.resolver_block(block, lazy=lazy) for block in blocks]
+    for block in resolved:
+        access(block)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, cost, memory
+
+
+def main(count=50, txs_per_block=300):
+    node = StubNode(txs_per_block=txs_per_block)
+    blocks = [node.block(height) for height in range(1000, 1000 + count)]
+    total = count * txs_per_block
+    for name, access in (('receiver only', receiver_only), ('all fields', all_fields)):
+        expect, cost, memory = measure(blocks, False, access)
+        print('eager {:<13}: {:>6} txs {:8.3f}s {:10.0f} txs/s {:8.1f} KB'.format(
+            name, total, cost, total / cost, memory / 1024))
+        result, cost, memory = measure(blocks, True, access)
+        assert result == expect
+        print('lazy  {:<13}: {:>6} txs {:8.3f}s {:10.0f} txs/s {:8.1f} KB'.format(
+            name, total, cost, total / cost, memory / 1024))
+
+
+if __name__ == '__main__':
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    _txs = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    main(_count, _txs)
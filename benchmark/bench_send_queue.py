@@ -0,0 +1,42 @@
+"""
+原始交易发送: 逐笔 send_raw_transaction 与 SendQueue 批量流水线的 发送数/秒 对比.
+python -m benchmark.bench_send_queue [count] [delay]
+"""
+import sys
+import time
+
+from benchmark.stub_node import StubNode
+from coin.resolver.eth_resolver import EthereumResolver
+from httplibs.coinrpc.ethrpc import EthereumRpc
+from httplibs.coinrpc.send_queue import SendQueue
+from sign.eth_signer import EthereumSigner
+
+
+def measure(name, count, func, node):
+    start, requests = time.perf_counter(), node.request_count
+    result = func()
+    elapsed = time.perf_counter() - start
+    print('{:<20} {:6d} tx {:6d} http {:8.3f}s {:10.0f} tx/s'.format(
+        name, count, node.request_count - requests, elapsed, count / elapsed))
+    return result
+
+
+def main(count=5000, delay=0.005):
+    signer = EthereumSigner(1, [b'\x01' * 32], allow_slow_insecure=True)
+    body = EthereumResolver.get_transfer_body(signer.addresses[0], '0x' + 'ab' * 20, 21000, 10 ** 9, 1)
+    raws = [signed.raw for signed in signer.sign_many([dict(body, nonce=nonce) for nonce in range(count)])]
+    # 逐笔发送太慢, 只发送一部分
+    sample = raws[:max(count // 20, 1)]
+    with StubNode(delay=delay) as node:
+        rpc = EthereumRpc(node.url)
+        expect = measure('one by one', len(sample), lambda: [rpc.send_raw_transaction(raw) for raw in sample], node)
+        node.raw_txs.clear()
+        sender = SendQueue(rpc)
+        result = measure('send queue', count, lambda: [f.result() for f in sender.submit_many(raws)], node)
+        assert result[:len(sample)] == expect
+        print(sender.stats())
+        sender.close()
+
+
+if __name__ == '__main__':
+    main(*[t(arg) for t, arg in zip((int, float), sys.argv[1:])])
@@ -0,0 +1,58 @@
+"""
+离线签名吞吐: 单进程签名、进程池 sign_many 与纯 python 后备实现的 签名数/秒.
+python -m benchmark.bench_signer [count] [processes]
+"""
+import os
+import sys
+import time
+
+from coin.resolver.eth_resolver import EthereumResolver
+import sign.eth_signer as eth_signer
+from sign.eth_signer import EthereumSigner
+
+
+def make_txs(signer: EthereumSigner, count: int) -> list:
+    senders = signer.addresses
+    txs = []
+    for i in range(count):
+        if i % 2:
+            tx = EthereumResolver.get_transfer_body(senders[i % len(senders)], '0x' + '%040x' % i, 60000, 10 ** 9,
+                                                    10 ** 6 * i, contract='0x' + 'ee' * 20)
+        else:
+            tx = EthereumResolver.get_transfer_body(senders[i % len(senders)], '0x' + '%040x' % i, 21000, 10 ** 9,
+                                                    10 ** 15 * i)
+        tx['nonce'] = i
+        txs.append(tx)
+    return txs
+
+
+def measure(name, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print('{:<24} {:6d} tx {:8.3f}s {:10.0f} sig/s'.format(name, count, elapsed, count / elapsed))
+    return result
+
+
+def main(count=20000, processes=None):
+    processes = processes or os.cpu_count()
+    keys = [(i + 1).to_bytes(32, 'big') for i in range(10)]
+    signer = EthereumSigner(1, keys, processes=processes, allow_slow_insecure=True)
+    txs = make_txs(signer, count)
+    print('backend', 'coincurve' if eth_signer.coincurve is not None else 'python', 'processes', processes)
+    expect = measure('single process', count, lambda: [signer.sign_transaction(tx) for tx in txs])
+    # 第一次使用时创建进程池
+    signer.sign_many(txs[:signer._default_pool_threshold])
+    result = measure('sign_many pool', count, lambda: signer.sign_many(txs))
+    assert [s.raw for s in result] == [s.raw for s in expect]
+    signer.close()
+    if eth_signer.coincurve is not None:
+        sample = txs[:200]
+        eth_signer.coincurve, backend = None, eth_signer.coincurve
+        result = measure('python fallback', len(sample), lambda: [signer.sign_transaction(tx) for tx in sample])
+        eth_signer.coincurve = backend
+        assert [s.raw for s in result] == [s.raw for s in expect[:len(sample)]]
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,60 @@
+"""
+大批量返回的流式解析与整体解析对比, 统计客户端峰值内存(StubNode 在子进程中运行, 不计入).
+python -m benchmark.bench_stream [blocks] [txs_per_block]
+"""
+import multiprocessing
+import sys
+import time
+import tracemalloc
+
+from benchmark.stub_node import StubNode
+from coin.resolver.eth_resolver import EthereumResolver
+from httplibs.coinrpc.ethrpc import EthereumRpc
+
+
+def serve(txs_per_block, queue, stop):
+    with StubNode(txs_per_block=txs_per_block) as node:
+        queue.put(node.url)
+        stop.wait()
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    cost = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, cost, peak
+
+
+def main(count=500, txs_per_block=200):
+    queue, stop = multiprocessing.Queue(), multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=(txs_per_block, queue, stop), daemon=True)
+    process.start()
+    try:
+        rpc = EthereumRpc(queue.get(), max_batch_size=None, max_batch_bytes=None)
+        start, end = 1000, 1000 + count - 1
+
+        def whole():
+            blocks = rpc.get_block_by_number([hex(h) for h in range(start, end + 1)], True)
+            return [EthereumResolver.resolver_block(block).hash for block in blocks]
+
+        def stream():
+            return [block.hash for block in rpc.stream_blocks(start, end)]
+
+        expect, cost, peak = measure(whole)
+        print('whole : {:>6} blocks {:8.3f}s peak {:8.1f} MB'.format(count, cost, peak / 1024 / 1024))
+        result, cost, peak = measure(stream)
+        print('stream: {:>6} blocks {:8.3f}s peak {:8.1f} MB'.format(count, cost, peak / 1024 / 1024))
+        assert result == expect
+        rpc.close()
+    finally:
+        stop.set()
+        process.join()
+
+
+if __name__ == '__main__':
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    _txs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    main(_count, _txs)
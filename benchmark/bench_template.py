@@ -0,0 +1,64 @@
+"""
+批量余额查询: dict 构建 + json 编码与预编码请求模板对比.
+python -m benchmark.bench_template [addresses]
+"""
+import sys
+import time
+import tracemalloc
+
+from benchmark.stub_node import StubNode, fake_address
+from coin.resolver.eth_resolver import EthereumResolver
+from httplibs.cache import RpcCache
+from httplibs.coinrpc.ethrpc import EthereumRpc
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    cost = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, cost, peak
+
+
+def main(count=50000):
+    addresses = [fake_address('bench', i) for i in range(count)]
+    contract = fake_address('token')
+    rpc = EthereumRpc('http://127.0.0.1', max_batch_size=None, max_batch_bytes=None)
+    ids = range(count)
+
+    def dict_path():
+        params = rpc.get_params([EthereumResolver.get_balance_body(address=address, contract=contract)
+                                 for address in addresses], 'latest')
+        payload = [{'jsonrpc': "2.0", "id": _id, 'method': 'eth_call', "params": rpc.right_params(p)}
+                   for _id, p in zip(ids, params)]
+        return rpc.codec.dumps(payload)
+
+    def template_path():
+        body = rpc._token_balance_template.render(
+            ids, [EthereumResolver.get_address(address, contract) for address in addresses],
+            contract=EthereumResolver.get_address(contract), block_height='latest')
+        return body
+
+    expect, cost, peak = measure(dict_path)
+    print('dict     encode: {:>6} requests {:8.1f}ms peak {:8.1f} MB'.format(count, cost * 1000, peak / 1024 / 1024))
+    result, cost, peak = measure(template_path)
+    print('template encode: {:>6} requests {:8.1f}ms peak {:8.1f} MB'.format(count, cost * 1000, peak / 1024 / 1024))
+    assert rpc.codec.loads(result) == rpc.codec.loads(expect)
+
+    with StubNode() as node:
+        # 开启缓存时 get_balance 走 dict 路径
+        results = []
+        for name, rpc in (('dict', EthereumRpc(node.url, cache=RpcCache(max_bytes=0))),
+                          ('template', EthereumRpc(node.url))):
+            start = time.perf_counter()
+            results.append(rpc.get_balance(addresses, contract))
+            print('{:<8} get_balance: {:>6} addresses {:8.3f}s'.format(name, count, time.perf_counter() - start))
+            rpc.close()
+        assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,43 @@
+"""
+代币充值扫描: 逐笔获取收据与 eth_getLogs 按范围扫描对比.
+python -m benchmark.bench_token_scan [blocks] [max_log_range]
+"""
+import sys
+import time
+
+from benchmark.stub_node import StubNode, fake_address
+from coin.address_index import AddressIndex
+from httplibs.coinrpc.ethrpc import EthereumRpc
+
+
+def main(count=500, max_log_range=2000, txs_per_block=100):
+    start_height = 1000
+    end_height = start_height + count - 1
+    with StubNode(txs_per_block=txs_per_block, max_log_range=max_log_range) as node:
+        receivers = [fake_address('receiver', height, index)
+                     for height in range(start_height, end_height + 1, 7) for index in (1, 3, 11)]
+        index = AddressIndex(receivers)
+        rpc = EthereumRpc(node.url)
+
+        calls, start = node.call_count, time.perf_counter()
+        blocks = rpc.get_block_by_number([hex(h) for h in range(start_height, end_height + 1)], False)
+        expect = rpc.get_token_transfers([tx_hash for block in blocks for tx_hash in block['transactions']],
+                                         address_index=index)
+        print('receipts      : {:>6} blocks {:8.3f}s {:>8} calls, {} transfers'.format(
+            count, time.perf_counter() - start, node.call_count - calls, len(expect)))
+
+        for name, kwargs in (('getLogs index', {'address_index': index}),
+                             ('getLogs topics', {'receivers': receivers})):
+            calls, start = node.call_count, time.perf_counter()
+            scanner = rpc.scan_token_transfers(start_height, end_height, range_size=100, **kwargs)
+            result = list(scanner)
+            print('{:<14}: {:>6} blocks {:8.3f}s {:>8} calls, {} transfers, shrinks {}'.format(
+                name, count, time.perf_counter() - start, node.call_count - calls, len(result), scanner.shrinks))
+            assert [t.to_dict() for t in result] == [t.to_dict() for t in expect]
+        rpc.close()
+
+
+if __name__ == '__main__':
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    _range = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    main(_count, _range)
@@ -0,0 +1,378 @@
+"""
+本地以太坊节点桩, 只用于 benchmark.
+基于 asyncio 的极简 HTTP/1.1 keep-alive 服务, 在后台线程运行, 返回确定性的假数据.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+from coin.logs_bloom import LogsBloomFilter
+from coin.resolver.eth_multicall import EthereumMulticall
+from coin.resolver.eth_rlp import EthereumRlp
+from digit import digit
+from sha3 import keccak_256
+
+
+def fake_hash(*args) -> str:
+    return '0x' + hashlib.sha256(':'.join(str(a) for a in args).encode()).hexdigest()
+
+
+def fake_address(*args) -> str:
+    return fake_hash(*args)[:42]
+
+
+class StubNode(object):
+    """
+    用法:
+        with StubNode(delay=0.005) as node:
+            rpc = EthereumRpc(node.url)
+    :param delay: 每个 http 请求模拟的网络/节点耗时(秒)
+    :param height: 当前链高度
+    :param txs_per_block: 每个块的交易数
+    :param max_log_range: eth_getLogs 允许的最大块范围, 超出时返回错误
+    :param multicall: 是否在 EthereumMulticall.ADDRESS 部署聚合合约(实现 tryAggregate)
+    """
+    BLOCK_TIME = 13
+    # keccak256('Transfer(address,address,uint256)')
+    TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+    GENESIS_TIME = 1600000000
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0, height=1000000, txs_per_block=100, max_log_range=2000,
+                 multicall=True):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.height = height
+        self.txs_per_block = txs_per_block
+        self.max_log_range = max_log_range
+        self.multicall = multicall
+        # 每个地址已使用的 nonce
+        self.nonces = {}
+        # eth_sendRawTransaction 收到的交易 hash: 打包高度(发送时的下一个块)
+        self.raw_txs = {}
+        self.request_count = 0
+        self.call_count = 0
+        self.handlers = {
+            'eth_blockNumber': lambda: digit.int_to_hex(self.height),
+            'eth_syncing': lambda: False,
+            'eth_gasPrice': lambda: digit.int_to_hex(10 ** 9),
+            'eth_getBalance': self.eth_get_balance,
+            'eth_getBlockByNumber': self.eth_get_block_by_number,
+            'eth_getBlockByHash': self.eth_get_block_by_hash,
+            'eth_getTransactionByHash': self.eth_get_transaction_by_hash,
+            'eth_getTransactionReceipt': self.eth_get_transaction_receipt,
+            'eth_sendRawTransaction': self.eth_send_raw_transaction,
+            'eth_call': self.eth_call,
+            'eth_estimateGas': lambda tx, *args: '0x5208' if tx.get('data', '0x') == '0x' else '0xea60',
+            'eth_getTransactionCount': self.eth_get_transaction_count,
+            'personal_signAndSendTransaction': self.personal_sign_and_send_transaction,
+            'eth_getLogs': self.eth_get_logs,
+        }
+        self._blooms = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    # ---------------- 假数据 ----------------
+    def block_hash(self, height):
+        return fake_hash('block', height)
+
+    def tx_hash(self, height, index):
+        # 前 24 位 hex 编码高度与序号, 便于反查
+        return '0x{:016x}{:08x}'.format(height, index) + fake_hash('tx', height, index)[26:]
+
+    def transaction(self, height, index):
+        sender = fake_address('sender', height, index)
+        receiver = fake_address('receiver', height, index)
+        tx = {
+            "blockHash": self.block_hash(height),
+            "blockNumber": digit.int_to_hex(height),
+            "from": sender,
+            "gas": "0x5208",
+            "gasPrice": digit.int_to_hex(10 ** 9 + index),
+            "hash": self.tx_hash(height, index),
+            "input": "0x",
+            "nonce": digit.int_to_hex(index),
+            "to": receiver,
+            "transactionIndex": digit.int_to_hex(index),
+            "value": digit.int_to_hex(10 ** 16 * (index + 1)),
+            "v": "0x25",
+            "r": fake_hash('r', height, index),
+            "s": fake_hash('s', height, index),
+        }
+        if index % 4 == 3:
+            # 每 4 笔一笔 erc20 transfer
+            tx['to'] = fake_address('contract', index % 3)
+            tx['value'] = '0x0'
+            tx['gas'] = '0x186a0'
+            tx['input'] = '0xa9059cbb' + digit.del_0x(receiver).zfill(64) + digit.int_to_hex(
+                10 ** 6 * (index + 1), has_0x=False).zfill(64)
+        elif index % 8 == 1:
+            # 每 8 笔一笔合约调用(如 router swap), input 中没有收款地址, 代币转账只体现在日志中
+            tx['to'] = fake_address('router')
+            tx['gas'] = '0x30d40'
+            tx['input'] = '0x7ff36ab5' + '0' * 128
+        return tx
+
+    def transfer_log(self, height, index, contract, sender, receiver, value, log_index=0):
+        return {
+            "address": contract,
+            "topics": [self.TRANSFER_TOPIC, '0x' + digit.del_0x(sender).zfill(64),
+                       '0x' + digit.del_0x(receiver).zfill(64)],
+            "data": '0x' + digit.int_to_hex(value, has_0x=False).zfill(64),
+            "blockNumber": digit.int_to_hex(height),
+            "blockHash": self.block_hash(height),
+            "transactionHash": self.tx_hash(height, index),
+            "transactionIndex": digit.int_to_hex(index),
+            "logIndex": digit.int_to_hex(log_index),
+            "removed": False,
+        }
+
+    def logs(self, height, index):
+        """交易产生的 Transfer 日志, erc20 transfer 与合约调用各一条"""
+        receiver = fake_address('receiver', height, index)
+        if index % 4 == 3:
+            return [self.transfer_log(height, index, fake_address('contract', index % 3),
+                                      fake_address('sender', height, index), receiver, 10 ** 6 * (index + 1))]
+        if index % 8 == 1:
+            return [self.transfer_log(height, index, fake_address('contract', index % 3),
+                                      fake_address('pool', index % 3), receiver, 10 ** 6 * (index + 1))]
+        return []
+
+    def block(self, height, details=True):
+        if height > self.height or height < 0:
+            return None
+        count = self.txs_per_block
+        return {
+            "number": digit.int_to_hex(height),
+            "hash": self.block_hash(height),
+            "parentHash": self.block_hash(height - 1),
+            "timestamp": digit.int_to_hex(self.GENESIS_TIME + height * self.BLOCK_TIME),
+            "miner": fake_address('miner', height),
+            "gasLimit": "0xe4e1c0",
+            "gasUsed": digit.int_to_hex(21000 * count),
+            "logsBloom": self.block_bloom(height),
+            "transactions": [self.transaction(height, i) if details else self.tx_hash(height, i)
+                             for i in range(count)],
+        }
+
+    def block_bloom(self, height):
+        bloom = self._blooms.get(height)
+        if bloom is None:
+            bloom = self._blooms[height] = LogsBloomFilter.build(
+                [log for index in range(self.txs_per_block) for log in self.logs(height, index)])
+        return bloom
+
+    def receipt(self, height, index):
+        tx = self.transaction(height, index)
+        logs = self.logs(height, index)
+        return {
+            "blockHash": tx['blockHash'],
+            "blockNumber": tx['blockNumber'],
+            "contractAddress": None,
+            "cumulativeGasUsed": digit.int_to_hex(21000 * (index + 1)),
+            "from": tx['from'],
+            "gasUsed": "0x5208",
+            "logs": logs,
+            "logsBloom": LogsBloomFilter.build(logs),
+            "status": "0x1",
+            "to": tx['to'],
+            "transactionHash": tx['hash'],
+            "transactionIndex": tx['transactionIndex'],
+        }
+
+    @classmethod
+    def parse_tx_hash(cls, tx_hash):
+        h = digit.del_0x(tx_hash)
+        return int(h[:16], 16), int(h[16:24], 16)
+
+    # ---------------- rpc 方法 ----------------
+    def eth_get_balance(self, address, block_height='latest'):
+        return digit.int_to_hex(int(digit.del_0x(address)[-8:], 16))
+
+    def eth_get_block_by_number(self, height, details=True):
+        if height == 'latest':
+            height = self.height
+        return self.block(digit.hex_to_int(height), details)
+
+    def eth_get_block_by_hash(self, block_hash, details=True):
+        return None
+
+    def eth_get_transaction_by_hash(self, tx_hash):
+        height, index = self.parse_tx_hash(tx_hash)
+        return self.transaction(height, index)
+
+    def eth_get_transaction_receipt(self, tx_hash):
+        if tx_hash in self.raw_txs:
+            height = self.raw_txs[tx_hash]
+            if height > self.height:
+                return None
+            return dict(self.receipt(height, 0), transactionHash=tx_hash, logs=[], logsBloom='0x' + '00' * 256)
+        height, index = self.parse_tx_hash(tx_hash)
+        return self.receipt(height, index)
+
+    def contract_call(self, contract, data) -> bytes or None:
+        """假代币合约, 余额为地址最后 8 位 hex, 未知方法返回 None(revert)"""
+        selector, args = data[:8], data[8:]
+        if selector == '70a08231':
+            # balanceOf(address)
+            return int(args[-8:], 16).to_bytes(32, 'big')
+        if selector in ('06fdde03', '95d89b41'):
+            # name() symbol(), ABI string
+            text = ('Stub Token ' if selector == '06fdde03' else 'STB') + contract[-4:]
+            return (32).to_bytes(32, 'big') + len(text).to_bytes(32, 'big') + text.encode().ljust(32, b'\x00')
+        if selector == '313ce567':
+            # decimals()
+            return (18).to_bytes(32, 'big')
+        if selector == '18160ddd':
+            # totalSupply()
+            return (10 ** 27).to_bytes(32, 'big')
+        return None
+
+    def eth_call(self, body, block_height='latest'):
+        data = digit.del_0x(body.get('data') or '')
+        to = (body.get('to') or '').lower()
+        if self.multicall and to == EthereumMulticall.ADDRESS:
+            require_success, calls = EthereumMulticall.decode_calls(data)
+            results = [self.contract_call(target, digit.del_0x(call)) for target, call in calls]
+            if require_success and None in results:
+                raise ValueError('execution reverted: Multicall3: call failed')
+            return EthereumMulticall.encode_results(results)
+        result = self.contract_call(to, data)
+        if result is None:
+            if to == EthereumMulticall.ADDRESS:
+                # 没有部署合约的地址 eth_call 返回空
+                return '0x'
+            raise ValueError('execution reverted')
+        return '0x' + result.hex()
+
+    def eth_get_transaction_count(self, address, block_height='latest'):
+        used = self.nonces.get(address.lower(), ())
+        nonce = 0
+        while nonce in used:
+            nonce += 1
+        return digit.int_to_hex(nonce)
+
+    def eth_send_raw_transaction(self, raw):
+        data = bytes.fromhex(digit.del_0x(raw))
+        # typed 交易以类型字节开头
+        EthereumRlp.decode(data[1:] if data[0] < 0x80 else data)
+        tx_hash = '0x' + keccak_256(data).hexdigest()
+        if tx_hash in self.raw_txs:
+            raise ValueError('already known')
+        self.raw_txs[tx_hash] = self.height + 1
+        return tx_hash
+
+    def personal_sign_and_send_transaction(self, tx, passphrase):
+        sender = tx['from'].lower()
+        nonce = digit.hex_to_int(tx['nonce']) if 'nonce' in tx else digit.hex_to_int(
+            self.eth_get_transaction_count(sender))
+        used = self.nonces.setdefault(sender, set())
+        if nonce in used:
+            raise ValueError('nonce too low')
+        used.add(nonce)
+        return fake_hash('send', sender, nonce)
+
+    def eth_get_logs(self, log_filter):
+        start, end = digit.hex_to_int(log_filter['fromBlock']), digit.hex_to_int(log_filter['toBlock'])
+        if end - start + 1 > self.max_log_range:
+            raise ValueError('block range too large, max {}'.format(self.max_log_range))
+        contracts = log_filter.get('address')
+        contracts = {contracts} if isinstance(contracts, str) else set(contracts or ())
+        topics = list(log_filter.get('topics') or []) + [None] * 3
+        matches = [{t} if isinstance(t, str) else set(t) if t else None for t in topics[:3]]
+        logs = []
+        for height in range(start, min(end, self.height) + 1):
+            for index in range(1, self.txs_per_block, 2):
+                # 只有 index 为奇数的交易有日志
+                for log in self.logs(height, index):
+                    if contracts and log['address'] not in contracts:
+                        continue
+                    if all(m is None or t in m for m, t in zip(matches, log['topics'])):
+                        logs.append(log)
+        return logs
+
+    def dispatch(self, request):
+        self.call_count += 1
+        rsp = {'jsonrpc': '2.0', 'id': request.get('id')}
+        handler = self.handlers.get(request.get('method'))
+        if handler is None:
+            rsp['error'] = {'code': -32601, 'message': 'the method {} does not exist'.format(request.get('method'))}
+            return rsp
+        try:
+            rsp['result'] = handler(*(request.get('params') or []))
+        except Exception as e:
+            rsp['error'] = {'code': -32602, 'message': str(e)}
+        return rsp
+
+    # ---------------- http 服务 ----------------
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                headers = {}
+                for line in head.decode('latin-1').split('\r\n')[1:]:
+                    if ':' in line:
+                        k, v = line.split(':', 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.request_count += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                request = json.loads(body)
+                if isinstance(request, list):
+                    rsp = [self.dispatch(r) for r in request]
+                else:
+                    rsp = self.dispatch(request)
+                data = json.dumps(rsp).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (len(data), data))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            writer.close()
+
+    def _run(self, started):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port, backlog=4096))
+        self.port = self._server.sockets[0].getsockname()[1]
+        started.set()
+        self._loop.run_forever()
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def start(self):
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
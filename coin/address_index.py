@@ -0,0 +1,240 @@
+import math
+import mmap
+import os
+import struct
+import threading
+
+from digit import digit
+
+
+class _IndexState(object):
+    """
+    AddressIndex 的一个版本: 有序地址数组、bloom 与 pending.
+    compact 时构建新的版本后整体替换, 查询在开始时取一次版本, 不会看到合并到一半的状态;
+    旧版本持有的 mmap 在没有查询再引用它之后随对象释放.
+    """
+    __slots__ = ('keys', 'offset', 'count', 'bloom', 'bloom_bits', 'pending', 'mmap')
+
+    def __init__(self, keys, offset, count, bloom, bloom_bits, pending=None, mmap_=None):
+        self.keys = keys
+        self.offset = offset
+        self.count = count
+        self.bloom = bloom
+        self.bloom_bits = bloom_bits
+        self.pending = pending if pending is not None else set()
+        self.mmap = mmap_
+
+    def key_at(self, k) -> bytes:
+        start = self.offset + k * AddressIndex.KEY_LENGTH
+        return self.keys[start:start + AddressIndex.KEY_LENGTH]
+
+
+class AddressIndex(object):
+    """
+    钱包地址集合, 用于充值匹配.
+    地址以 20 字节二进制存放在有序数组中(二分查找), 前面加一层 Bloom 过滤器快速排除不匹配的地址,
+    200 万地址约占 40M + 2.4M 内存, 远小于 hex 字符串 set.
+    新地址先放在 pending 中, 数量较多时调用 compact() 合并进有序数组.
+    可通过 save() 保存到文件, load() 以 mmap 方式加载, 地址数组不需要读入内存.
+    查询不加锁, 可与 add/compact 并发; 写入之间通过锁互斥.
+
+    文件格式: header(magic, 地址数, bloom 位数, hash 数) + 有序地址数组 + bloom 位图
+    """
+    MAGIC = b'WAI1'
+    HEADER = struct.Struct('<4sQQI')
+    KEY_LENGTH = 20
+    _default_bits_per_key = 10
+    _default_hashes = 7
+    _default_compact_size = 100000
+    _mask64 = (1 << 64) - 1
+
+    def __init__(self, addresses=None, capacity=None, bits_per_key=None, hashes=None):
+        """
+        :param addresses: 初始地址, hex 字符串或 20 字节 bytes
+        :param capacity: 预计地址数量, 用于确定 bloom 大小, 实际数量超出后 compact 时会重建 bloom
+        :param bits_per_key: bloom 每个地址占用的位数, 10 位约 1% 误判率
+        :param hashes: bloom hash 函数个数
+        """
+        self._bits_per_key = bits_per_key or self._default_bits_per_key
+        self._hashes = hashes or self._default_hashes
+        self._file = None
+        self._lock = threading.Lock()
+        keys = sorted({self.to_key(address) for address in addresses or ()})
+        self._state = self._build(b''.join(keys), len(keys), capacity)
+
+    @classmethod
+    def to_key(cls, address) -> bytes:
+        if isinstance(address, (bytes, bytearray, memoryview)):
+            key = bytes(address)
+        else:
+            key = bytes.fromhex(digit.del_0x(address).lower())
+        if len(key) != cls.KEY_LENGTH:
+            raise ValueError('地址长度错误: {}'.format(address))
+        return key
+
+    @classmethod
+    def to_address(cls, key: bytes) -> str:
+        return '0x' + key.hex()
+
+    def _build(self, keys, count, capacity=None) -> _IndexState:
+        bloom_bits = max(64, int(max(count, capacity or 0) * self._bits_per_key))
+        state = _IndexState(keys, 0, count, bytearray(math.ceil(bloom_bits / 8)), bloom_bits)
+        for k in range(count):
+            self._bloom_add(state, state.key_at(k))
+        return state
+
+    def _bloom_positions(self, key, bloom_bits):
+        # 双 hash 法, 地址本身就是 keccak 结果, 直接取其中两段作为 hash 值
+        value = int.from_bytes(key, 'little')
+        h1, h2 = value & self._mask64, (value >> 64) | 1
+        return [(h1 + i * h2) % bloom_bits for i in range(self._hashes)]
+
+    def _bloom_add(self, state, key):
+        bloom = state.bloom
+        for position in self._bloom_positions(key, state.bloom_bits):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    def _bloom_contains(self, state, key) -> bool:
+        bloom = state.bloom
+        for position in self._bloom_positions(key, state.bloom_bits):
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @classmethod
+    def _search(cls, state, key) -> bool:
+        keys, offset, length = state.keys, state.offset, cls.KEY_LENGTH
+        lo, hi = 0, state.count
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            start = offset + mid * length
+            value = keys[start:start + length]
+            if value < key:
+                lo = mid + 1
+            elif value > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def _contains(self, state, key) -> bool:
+        if not self._bloom_contains(state, key):
+            return False
+        return key in state.pending or self._search(state, key)
+
+    def contains_key(self, key: bytes) -> bool:
+        """key 为 20 字节地址"""
+        return self._contains(self._state, key)
+
+    def __contains__(self, address) -> bool:
+        try:
+            key = self.to_key(address)
+        except (ValueError, TypeError, AttributeError):
+            return False
+        return self.contains_key(key)
+
+    def __len__(self):
+        state = self._state
+        return state.count + len(state.pending)
+
+    def __iter__(self):
+        state = self._state
+        for k in range(state.count):
+            yield self.to_address(state.key_at(k))
+        for key in list(state.pending):
+            yield self.to_address(key)
+
+    def add(self, address):
+        key = self.to_key(address)
+        with self._lock:
+            state = self._state
+            if self._contains(state, key):
+                return
+            # 先置 bloom 再放入 pending, 查询看到 pending 中的地址时 bloom 一定已包含它
+            self._bloom_add(state, key)
+            state.pending.add(key)
+            if len(state.pending) >= self._default_compact_size:
+                self._compact()
+
+    def update(self, addresses):
+        for address in addresses:
+            self.add(address)
+
+    def _compact(self):
+        state = self._state
+        if not state.pending:
+            return
+        keys = [state.key_at(k) for k in range(state.count)]
+        keys.extend(state.pending)
+        keys.sort()
+        count = len(keys)
+        if count * self._bits_per_key > state.bloom_bits:
+            new = self._build(b''.join(keys), count)
+        else:
+            # bloom 只增加位, 新旧版本可以共用; 新版本的地址都已在其中
+            new = _IndexState(b''.join(keys), 0, count, state.bloom, state.bloom_bits)
+        # 一次赋值切换版本, 旧版本(及其 mmap)在最后一个查询结束后释放
+        self._state = new
+        self._close_file()
+
+    def compact(self):
+        """把 pending 中的新地址合并进有序数组"""
+        with self._lock:
+            self._compact()
+
+    def save(self, path):
+        """合并新地址并原子写入文件"""
+        with self._lock:
+            self._compact()
+            state = self._state
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, state.count, state.bloom_bits, self._hashes))
+                f.write(state.keys[state.offset:state.offset + state.count * self.KEY_LENGTH])
+                f.write(state.bloom)
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        从文件加载, use_mmap 时地址数组直接映射文件, 不读入内存. bloom 位图较小, 复制一份以便增量更新.
+        """
+        index = cls.__new__(cls)
+        index._lock = threading.Lock()
+        index._bits_per_key = cls._default_bits_per_key
+        index._file = open(path, 'rb')
+        mmap_ = None
+        if use_mmap:
+            data = mmap_ = mmap.mmap(index._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = index._file.read()
+        # mmap 不依赖文件对象, 可以直接关闭文件
+        index._close_file()
+        magic, count, bloom_bits, hashes = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            if mmap_ is not None:
+                mmap_.close()
+            raise ValueError('地址索引文件格式错误: {}'.format(path))
+        keys_end = cls.HEADER.size + count * cls.KEY_LENGTH
+        index._hashes = hashes
+        index._state = _IndexState(data, cls.HEADER.size, count,
+                                   bytearray(data[keys_end:keys_end + math.ceil(bloom_bits / 8)]), bloom_bits,
+                                   mmap_=mmap_)
+        return index
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """
+        地址数组复制到内存中, 之后仍可继续使用.
+        mmap 不直接关闭: 并发中的查询可能还在读取, 旧版本在最后一个查询结束后随对象释放并解除映射.
+        """
+        with self._lock:
+            state = self._state
+            if state.mmap is not None:
+                self._state = _IndexState(state.keys[state.offset:state.offset + state.count * self.KEY_LENGTH],
+                                          0, state.count, state.bloom, state.bloom_bits, state.pending)
+            self._close_file()
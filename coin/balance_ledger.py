@@ -0,0 +1,253 @@
+from collections import deque
+import json
+import os
+import threading
+
+from coin.address_index import AddressIndex
+from digit import digit
+
+
+class BalanceLedger(object):
+    """
+    钱包余额账本, 按资产(ETH 为 None, 代币为合约地址)保存每个钱包地址的余额与总额.
+    新块中涉及钱包地址的交易只把相关 (资产, 地址) 标记为待刷新, refresh() 时只查询这些地址的余额并增量更新总额,
+    total() 为 O(1). reconcile() 全量重新查询, 用于定期对账; 资产完成第一次对账之前账本中的总额不可信.
+    地址以 20 字节保存, 不保存 hex 字符串.
+    发送方的余额同样会变化(转出与手续费), 传入的块不能只包含收款地址在钱包中的交易:
+    ChainFollower 设置 address_index 时需要同时设置 match_sender=True, 或者不设置 address_index.
+        ledger = BalanceLedger(address_index, contracts=[usdt])
+        ledger.reconcile(rpc)
+        for event in follower.follow():
+            ledger.apply_event(event)
+            ledger.refresh(rpc)
+        ledger.total(usdt)
+    """
+    ETH = None
+    _default_ring_size = 128
+
+    def __init__(self, address_index, contracts=None, ring_size=None):
+        """
+        :param address_index: coin.address_index.AddressIndex, 钱包地址
+        :param contracts: 需要记账的代币合约地址
+        :param ring_size: 保存最近多少个块涉及的地址, 用于分叉回滚后重新刷新
+        """
+        self.address_index = address_index
+        self.contracts = {self.to_asset(contract) for contract in contracts or ()}
+        self._balances = {self.ETH: {}}
+        self._totals = {self.ETH: 0}
+        for contract in self.contracts:
+            self._balances[contract] = {}
+            self._totals[contract] = 0
+        self._dirty = set()
+        # 已完成全量对账的资产
+        self._reconciled = set()
+        self._recent = deque(maxlen=ring_size or self._default_ring_size)
+        self._lock = threading.Lock()
+        self.height = None
+
+    @classmethod
+    def to_asset(cls, contract):
+        return contract if contract is None else digit.add_0x(contract).lower()
+
+    to_key = AddressIndex.to_key
+    to_address = AddressIndex.to_address
+
+    def tracks(self, contract=None) -> bool:
+        """是否记账该资产"""
+        return self.to_asset(contract) in self._totals
+
+    def is_reconciled(self, contract=None) -> bool:
+        """该资产是否完成过全量对账, 之前账本中的余额与总额不可信"""
+        return self.to_asset(contract) in self._reconciled
+
+    def _asset(self, contract):
+        asset = self.to_asset(contract)
+        if asset not in self._totals:
+            raise ValueError('余额账本未记账该资产: {}'.format(asset))
+        return asset
+
+    def balance(self, address, contract=None) -> int:
+        return self._balances[self._asset(contract)].get(self.to_key(address), 0)
+
+    def total(self, contract=None) -> int:
+        return self._totals[self._asset(contract)]
+
+    def __len__(self):
+        return len(self._balances[self.ETH])
+
+    @property
+    def dirty(self) -> int:
+        """待刷新的 (资产, 地址) 数量"""
+        return len(self._dirty)
+
+    def _touch(self, touched: set, asset, address):
+        if not address:
+            return
+        key = self.to_key(address)
+        if self.address_index.contains_key(key):
+            touched.add((asset, key))
+
+    def touch(self, address, contract=None):
+        """手动标记地址待刷新, 如新生成的地址或外部充值通知"""
+        with self._lock:
+            self._dirty.add((self.to_asset(contract), self.to_key(address)))
+
+    def apply_transactions(self, transactions, height=None):
+        """
+        标记交易涉及的钱包地址. 发送方的 ETH 余额因手续费变化, 代币转账同时标记发送方与接收方的代币余额.
+        :param transactions: Tx / LazyTx / TokenTransfer
+        """
+        touched = set()
+        for tx in transactions:
+            self._touch(touched, self.ETH, tx.sender)
+            contract = self.to_asset(tx.contract)
+            if contract is None:
+                self._touch(touched, self.ETH, tx.receiver)
+            elif contract in self.contracts:
+                self._touch(touched, contract, tx.sender)
+                self._touch(touched, contract, tx.receiver)
+        with self._lock:
+            self._dirty |= touched
+            if height is not None:
+                self._recent.append((height, touched))
+                self.height = height
+
+    def apply_block(self, block):
+        """:param block: coin.coin_tools.Block"""
+        self.apply_transactions(block.transactions, block.height)
+
+    def apply_event(self, event):
+        """
+        处理 ChainFollower 的事件, 回滚时重新刷新该块涉及过的地址
+        :param event: httplibs.coinrpc.follower.ChainEvent
+        """
+        if event.block is not None:
+            self.apply_block(event.block)
+            return
+        with self._lock:
+            while self._recent and self._recent[-1][0] >= event.height:
+                _, touched = self._recent.pop()
+                self._dirty |= touched
+            self.height = event.height - 1
+
+    def _set(self, asset, key, value: int):
+        balances = self._balances[asset]
+        self._totals[asset] += value - balances.get(key, 0)
+        if value:
+            balances[key] = value
+        else:
+            balances.pop(key, None)
+
+    def _query(self, rpc, asset, keys: list, block_height) -> list:
+        return rpc.get_balance([self.to_address(key) for key in keys], asset, block_height)
+
+    def take_dirty(self) -> dict:
+        """
+        取出待刷新的地址, 按资产分组, 查询余额后交给 update()
+        :return: {资产: [20 字节地址]}
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        by_asset = {}
+        for asset, key in dirty:
+            by_asset.setdefault(asset, []).append(key)
+        return by_asset
+
+    def update(self, asset, keys: list, balances: list) -> int:
+        """
+        写入查询到的余额并增量更新总额, 查询失败(None)的地址重新标记为待刷新
+        :param balances: get_balance 返回的 hex 余额, 与 keys 一一对应
+        :return: 更新的地址数
+        """
+        count = 0
+        with self._lock:
+            for key, balance in zip(keys, balances):
+                if not balance:
+                    self._dirty.add((asset, key))
+                    continue
+                self._set(asset, key, digit.hex_to_int(balance))
+                count += 1
+        return count
+
+    def refresh(self, rpc, block_height='latest') -> int:
+        """
+        查询所有待刷新地址的余额并更新总额
+        :param rpc: EthereumRpcBase
+        :return: 刷新的地址数
+        """
+        count = 0
+        for asset, keys in self.take_dirty().items():
+            count += self.update(asset, keys, self._query(rpc, asset, keys, block_height))
+        if self._dirty:
+            rpc.logger.error('余额账本刷新失败 {} 个地址, 下次刷新时重试'.format(len(self._dirty)))
+        return count
+
+    def reconcile(self, rpc, contract=None, addresses=None, block_height='latest') -> int:
+        """
+        全量对账: 重新查询所有钱包地址的余额, 覆盖账本中的记录
+        :param contract: 资产, 默认 ETH
+        :param addresses: 钱包地址, 默认为 address_index 中的全部地址
+        :return: 余额与账本不一致的地址数
+        """
+        asset = self._asset(contract)
+        keys = self.reconcile_keys(addresses)
+        values = self._query(rpc, asset, keys, block_height) if keys else []
+        changed = self.apply_reconcile(asset, keys, values, addresses is None)
+        rpc.logger.info('余额账本对账 {}: {} 个地址, {} 个不一致'.format(asset or 'ETH', len(keys), changed))
+        return changed
+
+    def reconcile_keys(self, addresses=None) -> list:
+        """:return: 对账需要查询的 20 字节地址, 默认为 address_index 中的全部地址"""
+        return [self.to_key(address) for address in (self.address_index if addresses is None else addresses)]
+
+    def apply_reconcile(self, asset, keys: list, values: list, complete=True) -> int:
+        """
+        用查询到的余额覆盖账本中的记录, 查询失败(None)的地址标记为待刷新
+        :param complete: keys 是否为全部钱包地址, 是则该资产标记为已对账
+        :return: 余额与账本不一致的地址数
+        """
+        changed = 0
+        with self._lock:
+            balances = self._balances[asset]
+            for key, value in zip(keys, values):
+                if not value:
+                    self._dirty.add((asset, key))
+                    continue
+                value = digit.hex_to_int(value)
+                if balances.get(key, 0) != value:
+                    changed += 1
+                    self._set(asset, key, value)
+            if complete:
+                self._reconciled.add(asset)
+        return changed
+
+    def save(self, path):
+        """原子写入文件, 余额以 hex 保存"""
+        with self._lock:
+            data = {
+                'height': self.height,
+                'balances': {asset or '': {key.hex(): digit.int_to_hex(value) for key, value in balances.items()}
+                             for asset, balances in self._balances.items()},
+                'dirty': [[asset or '', key.hex()] for asset, key in self._dirty],
+                'reconciled': [asset or '' for asset in self._reconciled],
+            }
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        with self._lock:
+            self.height = data['height']
+            for asset, balances in data['balances'].items():
+                asset = asset or self.ETH
+                self._balances[asset] = {bytes.fromhex(key): digit.hex_to_int(value)
+                                         for key, value in balances.items()}
+                self._totals[asset] = sum(self._balances[asset].values())
+                if asset is not None:
+                    self.contracts.add(asset)
+            self._dirty = {(asset or self.ETH, bytes.fromhex(key)) for asset, key in data['dirty']}
+            self._reconciled = {asset or self.ETH for asset in data.get('reconciled', ())}
+        return self
@@ -1,3 +1,4 @@
+from array import array
 import json
 from digit import digit
 from enumer.coin_enum import TxStatusEnum
@@ -48,6 +49,10 @@ class BlockHeight(object):
 
 
 class Tx(object):
+    FIELDS = ('block_height', 'block_hash', 'tx_hash', 'sender', 'receiver', 'value', 'gas', 'gas_price', 'nonce',
+              'data', 'contract', 'status')
+    __slots__ = FIELDS
+
     def __init__(self, block_height, block_hash, tx_hash, sender, receiver, value, gas, gas_price, nonce, data,
                  contract, status=TxStatusEnum.UNKNOWN.value):
         self.block_height = block_height
@@ -63,8 +68,27 @@ class Tx(object):
         self.contract = contract
         self.status = status
 
+    def to_dict(self) -> dict:
+        return {
+            "blockHeight": self.block_height,
+            "blockHash": self.block_hash,
+            "txHash": self.tx_hash,
+            "sender": self.sender,
+            "receiver": self.receiver,
+            "value": self.value,
+            "gas": self.gas,
+            "gasPrice": self.gas_price,
+            "nonce": self.nonce,
+            "data": self.data,
+            "contract": self.contract,
+            "status": self.status,
+        }
+
 
 class TxReceipt(object):
+    FIELDS = ('block_height', 'block_hash', 'tx_hash', 'sender', 'receiver', 'contract', 'status', 'gas_used')
+    __slots__ = FIELDS
+
     def __init__(self, block_height, block_hash, tx_hash, sender, receiver, contract, status, gas_used):
         self.block_height = block_height
         self.block_hash = block_hash
@@ -75,13 +99,238 @@ class TxReceipt(object):
         self.status = status
         self.gas_used = gas_used
 
+    def to_dict(self) -> dict:
+        return {
+            "blockHeight": self.block_height,
+            "blockHash": self.block_hash,
+            "txHash": self.tx_hash,
+            "sender": self.sender,
+            "receiver": self.receiver,
+            "contract": self.contract,
+            "status": self.status,
+            "gasUsed": self.gas_used,
+        }
+
 
 class Block(object):
-    def __init__(self, height, hash, timestamp, transactions):
+    __slots__ = ('height', 'hash', 'timestamp', 'transactions', 'parent_hash')
+
+    def __init__(self, height, hash, timestamp, transactions, parent_hash=None):
         self.height = height
         self.hash = hash
         self.timestamp = timestamp
         self.transactions = transactions
+        self.parent_hash = parent_hash
+
+
+class BlockBatch(object):
+    """
+    按列存放多个块的交易, 用于回填等需要在内存中保留大量交易的场景.
+    块级字段(高度、hash、时间、父 hash)每块存一份, 交易字段存放在平行数组中:
+    hash 32 字节, 地址 20 字节, value 32 字节(大端), gas/gas_price/nonce 为 uint64, 每笔交易约 150 字节.
+    batch[i] 返回 TxRow 行视图, 不复制数据, 字段在访问时才转换为与 Tx 相同的类型.
+    注意: 地址与 hash 统一转为小写; 合约转账的 data 由 receiver 与 value 重新编码, 不保存原始 input.
+        batch = BlockBatch()
+        batch.extend(scanner)
+        for tx in batch:
+            tx.receiver, tx.value
+    """
+    HASH_LENGTH = 32
+    ADDRESS_LENGTH = 20
+    VALUE_LENGTH = 32
+    TRANSFER_ABI = '0xa9059cbb'
+
+    def __init__(self, blocks=None):
+        """
+        :param blocks: coin.coin_tools.Block 列表, 交易为 Tx 或 LazyTx
+        """
+        # 块级字段
+        self.heights = array('Q')
+        self.hashes = bytearray()
+        self.timestamps = array('Q')
+        self.parent_hashes = bytearray()
+        # 每个块第一笔交易的下标, 最后一个元素为交易总数
+        self.offsets = array('Q', [0])
+        # 交易字段
+        self.block_index = array('I')
+        self.tx_hashes = bytearray()
+        self.senders = bytearray()
+        self.receivers = bytearray()
+        self.contracts = bytearray()
+        self.values = bytearray()
+        self.gas = array('Q')
+        self.gas_prices = array('Q')
+        self.nonces = array('Q')
+        self.statuses = array('b')
+        # 第 k 位为 1 表示第 k 笔交易是合约转账
+        self.contract_flags = bytearray()
+        for block in blocks or ():
+            self.append(block)
+
+    @classmethod
+    def hex_to_bytes(cls, value, length) -> bytes:
+        if value is None:
+            return bytes(length)
+        data = bytes.fromhex(digit.del_0x(value))
+        if len(data) != length:
+            raise ValueError('长度错误, 需要 {} 字节: {}'.format(length, value))
+        return data
+
+    def append(self, block: Block):
+        """追加一个块及其全部交易"""
+        block_index = len(self.heights)
+        self.heights.append(block.height)
+        self.hashes += self.hex_to_bytes(block.hash, self.HASH_LENGTH)
+        self.timestamps.append(block.timestamp)
+        self.parent_hashes += self.hex_to_bytes(block.parent_hash, self.HASH_LENGTH)
+        for tx in block.transactions:
+            k = len(self.block_index)
+            self.block_index.append(block_index)
+            self.tx_hashes += self.hex_to_bytes(tx.tx_hash, self.HASH_LENGTH)
+            self.senders += self.hex_to_bytes(tx.sender, self.ADDRESS_LENGTH)
+            self.receivers += self.hex_to_bytes(tx.receiver, self.ADDRESS_LENGTH)
+            self.contracts += self.hex_to_bytes(tx.contract, self.ADDRESS_LENGTH)
+            self.values += tx.value.to_bytes(self.VALUE_LENGTH, 'big')
+            self.gas.append(tx.gas)
+            self.gas_prices.append(tx.gas_price)
+            self.nonces.append(tx.nonce)
+            self.statuses.append(tx.status)
+            if k % 8 == 0:
+                self.contract_flags.append(0)
+            if tx.contract is not None:
+                self.contract_flags[k >> 3] |= 1 << (k & 7)
+        self.offsets.append(len(self.block_index))
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    @property
+    def block_count(self) -> int:
+        return len(self.heights)
+
+    def __len__(self):
+        return len(self.block_index)
+
+    def __getitem__(self, k) -> 'TxRow':
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError('交易下标越界: {}'.format(k))
+        return TxRow(self, k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield TxRow(self, k)
+
+    def block_transactions(self, block_index: int) -> list:
+        """第 block_index 个块的交易行视图"""
+        return [TxRow(self, k) for k in range(self.offsets[block_index], self.offsets[block_index + 1])]
+
+    def get_block(self, block_index: int) -> Block:
+        """还原为 Block, 交易为 Tx"""
+        return Block(self.heights[block_index], self._hash(self.hashes, block_index), self.timestamps[block_index],
+                     [row.to_tx() for row in self.block_transactions(block_index)],
+                     self._hash(self.parent_hashes, block_index))
+
+    @classmethod
+    def _hash(cls, column, k):
+        return '0x' + column[k * cls.HASH_LENGTH:(k + 1) * cls.HASH_LENGTH].hex()
+
+    @property
+    def nbytes(self) -> int:
+        """各列占用的字节数"""
+        columns = (self.heights, self.hashes, self.timestamps, self.parent_hashes, self.offsets, self.block_index,
+                   self.tx_hashes, self.senders, self.receivers, self.contracts, self.values, self.gas,
+                   self.gas_prices, self.nonces, self.statuses, self.contract_flags)
+        return sum(len(column) * getattr(column, 'itemsize', 1) for column in columns)
+
+
+class TxRow(object):
+    """BlockBatch 的一行, 只保存 batch 与下标, 字段与 Tx 相同, *_bytes 为不复制的 memoryview"""
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch: BlockBatch, index: int):
+        self.batch = batch
+        self.index = index
+
+    def _view(self, column, length) -> memoryview:
+        return memoryview(column)[self.index * length:(self.index + 1) * length]
+
+    @property
+    def is_contract(self) -> bool:
+        return bool(self.batch.contract_flags[self.index >> 3] & (1 << (self.index & 7)))
+
+    @property
+    def tx_hash_bytes(self) -> memoryview:
+        return self._view(self.batch.tx_hashes, BlockBatch.HASH_LENGTH)
+
+    @property
+    def sender_bytes(self) -> memoryview:
+        return self._view(self.batch.senders, BlockBatch.ADDRESS_LENGTH)
+
+    @property
+    def receiver_bytes(self) -> memoryview:
+        return self._view(self.batch.receivers, BlockBatch.ADDRESS_LENGTH)
+
+    @property
+    def value_bytes(self) -> memoryview:
+        return self._view(self.batch.values, BlockBatch.VALUE_LENGTH)
+
+    @property
+    def block_height(self) -> int:
+        return self.batch.heights[self.batch.block_index[self.index]]
+
+    @property
+    def block_hash(self) -> str:
+        return BlockBatch._hash(self.batch.hashes, self.batch.block_index[self.index])
+
+    @property
+    def tx_hash(self) -> str:
+        return '0x' + self.tx_hash_bytes.hex()
+
+    @property
+    def sender(self) -> str:
+        return '0x' + self.sender_bytes.hex()
+
+    @property
+    def receiver(self) -> str:
+        return '0x' + self.receiver_bytes.hex()
+
+    @property
+    def value(self) -> int:
+        return int.from_bytes(self.value_bytes, 'big')
+
+    @property
+    def gas(self) -> int:
+        return self.batch.gas[self.index]
+
+    @property
+    def gas_price(self) -> int:
+        return self.batch.gas_prices[self.index]
+
+    @property
+    def nonce(self) -> int:
+        return self.batch.nonces[self.index]
+
+    @property
+    def status(self) -> int:
+        return self.batch.statuses[self.index]
+
+    @property
+    def contract(self):
+        if not self.is_contract:
+            return None
+        return '0x' + self._view(self.batch.contracts, BlockBatch.ADDRESS_LENGTH).hex()
+
+    @property
+    def data(self):
+        if not self.is_contract:
+            return None
+        return BlockBatch.TRANSFER_ABI + self.receiver_bytes.hex().zfill(64) + self.value_bytes.hex()
+
+    def to_tx(self) -> Tx:
+        return Tx(*[getattr(self, field) for field in Tx.FIELDS])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+
+from digit import digit
+
+
+class ContractInfoCache(object):
+    """
+    合约资料 (name, symbol, decimal, total) 缓存, 线程安全.
+    合约的 name/symbol/decimals 不会变化, totalSupply 可能变化, 可以用 ttl 控制过期.
+    设置 path 时启动即从文件加载(预热), 写入新合约后 save() 原子写回文件, 过期时间按墙上时间保存, 重启后继续有效.
+        cache = ContractInfoCache('/data/contracts.json', ttl=86400)
+        rpc = EthereumRpc(host, contract_cache=cache)
+        infos = rpc.get_contract_info_many(contracts)
+    """
+
+    def __init__(self, path: str = None, ttl: float = None):
+        """
+        :param path: 持久化文件, None 时只在内存中缓存
+        :param ttl: 过期秒数, None 为不过期
+        """
+        self.path = path
+        self.ttl = ttl
+        self._data = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @classmethod
+    def to_key(cls, contract: str) -> str:
+        return digit.add_0x(contract).lower()
+
+    def get(self, contract: str) -> tuple or None:
+        key = self.to_key(contract)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] >= time.time()):
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            return None
+
+    def set(self, contract: str, info: tuple):
+        key = self.to_key(contract)
+        with self._lock:
+            self._data[key] = (tuple(info), None if self.ttl is None else time.time() + self.ttl)
+            self._dirty = True
+
+    def lookup(self, contracts) -> tuple:
+        """
+        :return: ({合约: 资料}, [未缓存或已过期的合约]), 合约均为小写, 去重后保持原顺序
+        """
+        found, missing = {}, []
+        for key in dict.fromkeys(self.to_key(contract) for contract in contracts):
+            info = self.get(key)
+            if info is None:
+                missing.append(key)
+            else:
+                found[key] = info
+        return found, missing
+
+    def __contains__(self, contract):
+        return self.get(contract) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'items': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                'hitRatio': self.hits / total if total else 0}
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        now = time.time()
+        with self._lock:
+            for key, (name, symbol, decimal, total, expires) in data.items():
+                if expires is None or expires >= now:
+                    total = digit.hex_to_int(total) if total is not None else None
+                    self._data[key] = ((name, symbol, decimal, total), expires)
+            self._dirty = False
+
+    def save(self):
+        """有新写入时原子写回文件"""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            data = {key: [name, symbol, decimal, digit.int_to_hex(total) if total is not None else None, expires]
+                    for key, ((name, symbol, decimal, total), expires) in self._data.items()}
+            self._dirty = False
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,101 @@
+import threading
+
+from digit import digit
+from sha3 import keccak_256
+
+
+class LogsBloomFilter(object):
+    """
+    用块头/收据中的 logsBloom(2048 位)预先判断块内是否可能有我们关心的 Transfer 日志,
+    不可能匹配的块不需要获取收据或日志.
+    logsBloom 记录了每条日志的合约地址与每个 topic: 对 keccak256(item) 的前 3 对字节各取低 11 位, 置对应的位.
+    过滤条件(同时满足才需要获取收据):
+    * 包含 Transfer topic
+    * contracts 不为空时, 至少包含一个合约地址
+    * addresses 不为空时, 至少包含一个地址对应的 topic(32 字节左补零)
+    bloom 只会误报不会漏报. addresses 逐个检查, 地址很多时每个块的检查耗时随之增加.
+    """
+    BLOOM_BITS = 2048
+    # keccak256('Transfer(address,address,uint256)')
+    TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+    def __init__(self, contracts=None, addresses=None, topic=None):
+        """
+        :param contracts: 关心的代币合约地址
+        :param addresses: 关心的收款地址, 如钱包地址
+        :param topic: 事件 topic0, 默认为 Transfer
+        """
+        self._topic_mask = self.get_mask(bytes.fromhex(digit.del_0x(topic or self.TRANSFER_TOPIC)))
+        self.contracts = set()
+        self._contract_masks = []
+        self._address_masks = []
+        self._lock = threading.Lock()
+        self._counter = {'checked': 0, 'skipped': 0}
+        for contract in contracts or ():
+            self.add_contract(contract)
+        for address in addresses or ():
+            self.add_address(address)
+
+    @classmethod
+    def get_mask(cls, item: bytes) -> int:
+        """item 在 bloom 中对应的 3 个位, 以 int 表示, 第 k 位对应 bloom 的第 k 位"""
+        h = keccak_256(item).digest()
+        mask = 0
+        for i in (0, 2, 4):
+            mask |= 1 << (((h[i] << 8) | h[i + 1]) & (cls.BLOOM_BITS - 1))
+        return mask
+
+    @classmethod
+    def address_to_bytes(cls, address) -> bytes:
+        if isinstance(address, (bytes, bytearray)):
+            return bytes(address)
+        return bytes.fromhex(digit.del_0x(address))
+
+    @classmethod
+    def build(cls, logs) -> str:
+        """根据日志生成 logsBloom hex"""
+        bloom = 0
+        for log in logs:
+            bloom |= cls.get_mask(cls.address_to_bytes(log['address']))
+            for topic in log['topics']:
+                bloom |= cls.get_mask(bytes.fromhex(digit.del_0x(topic)))
+        return '0x' + bloom.to_bytes(cls.BLOOM_BITS // 8, 'big').hex()
+
+    def add_contract(self, contract):
+        self.contracts.add('0x' + self.address_to_bytes(contract).hex())
+        self._contract_masks.append(self.get_mask(self.address_to_bytes(contract)))
+
+    def add_address(self, address):
+        self._address_masks.append(self.get_mask(self.address_to_bytes(address).rjust(32, b'\x00')))
+
+    @classmethod
+    def _contains_any(cls, bloom: int, masks: list) -> bool:
+        for mask in masks:
+            if bloom & mask == mask:
+                return True
+        return False
+
+    def may_match(self, logs_bloom: str) -> bool:
+        """
+        :param logs_bloom: 块头或收据的 logsBloom hex
+        :return: False 表示一定没有匹配的日志, True 表示可能有
+        """
+        bloom = digit.hex_to_int(logs_bloom)
+        match = (bloom & self._topic_mask == self._topic_mask and
+                 (not self._contract_masks or self._contains_any(bloom, self._contract_masks)) and
+                 (not self._address_masks or self._contains_any(bloom, self._address_masks)))
+        with self._lock:
+            self._counter['checked'] += 1
+            if not match:
+                self._counter['skipped'] += 1
+        return match
+
+    def filter_blocks(self, blocks: list) -> list:
+        """返回可能有匹配日志的块, 空块(None)直接丢弃"""
+        return [block for block in blocks if block and self.may_match(block['logsBloom'])]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counter)
+        stats['skipRatio'] = stats['skipped'] / stats['checked'] if stats['checked'] else 0
+        return stats
@@ -0,0 +1,442 @@
+from functools import lru_cache
+
+from digit import digit
+from sha3 import keccak_256
+
+WORD = 32
+# 单个 string/bytes 返回值的常见前缀: 偏移 0x20, 长度的高 30 字节为 0
+_BYTES_HEX_PREFIX = '0x' + (WORD).to_bytes(WORD, 'big').hex() + '00' * 30
+
+
+def _read_word(data: bytes, pos: int) -> int:
+    end = pos + WORD
+    if end > len(data):
+        raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), end))
+    return int.from_bytes(data[pos:end], 'big')
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b'\x00' * (-len(data) % WORD)
+
+
+class AbiType(object):
+    """
+    ABI 类型. dynamic 为 True 时在头部只写 32 字节偏移, 数据写在尾部; size 为静态类型在头部占用的字节数.
+    encode 返回该类型自身的编码; decode 从 data 的 pos 处解码, pos 为该类型编码的起始位置.
+    """
+    dynamic = False
+    size = WORD
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def encode(self, value) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes, pos: int):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return self.name
+
+
+class AbiUint(AbiType):
+    def __init__(self, name: str, bits=256, signed=False):
+        super().__init__(name)
+        self.bits = bits
+        self.signed = signed
+
+    def encode(self, value) -> bytes:
+        value = int(value)
+        if self.signed:
+            if not -(1 << (self.bits - 1)) <= value < 1 << (self.bits - 1):
+                raise ValueError('{} 超出范围: {}'.format(self.name, value))
+            return value.to_bytes(WORD, 'big', signed=True)
+        if not 0 <= value < 1 << self.bits:
+            raise ValueError('{} 超出范围: {}'.format(self.name, value))
+        return value.to_bytes(WORD, 'big')
+
+    def decode(self, data: bytes, pos: int) -> int:
+        if pos + WORD > len(data):
+            raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), pos + WORD))
+        return int.from_bytes(data[pos:pos + WORD], 'big', signed=self.signed)
+
+
+class AbiBool(AbiType):
+    def encode(self, value) -> bytes:
+        return (1 if value else 0).to_bytes(WORD, 'big')
+
+    def decode(self, data: bytes, pos: int) -> bool:
+        return _read_word(data, pos) != 0
+
+
+class AbiAddress(AbiType):
+    def encode(self, value) -> bytes:
+        if isinstance(value, str):
+            value = bytes.fromhex(digit.del_0x(value))
+        if len(value) != 20:
+            raise ValueError('地址长度错误: {}'.format(value))
+        return b'\x00' * 12 + value
+
+    def decode(self, data: bytes, pos: int) -> str:
+        if pos + WORD > len(data):
+            raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), pos + WORD))
+        return '0x' + data[pos + 12:pos + WORD].hex()
+
+
+class AbiFixedBytes(AbiType):
+    """bytes1 ~ bytes32, 右补零"""
+
+    def __init__(self, name: str, length: int):
+        super().__init__(name)
+        self.length = length
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, str):
+            value = bytes.fromhex(digit.del_0x(value))
+        if len(value) > self.length:
+            raise ValueError('{} 长度错误: {}'.format(self.name, len(value)))
+        return value.ljust(WORD, b'\x00')
+
+    def decode(self, data: bytes, pos: int) -> bytes:
+        if pos + WORD > len(data):
+            raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), pos + WORD))
+        return data[pos:pos + self.length]
+
+
+class AbiBytes(AbiType):
+    """bytes: 32 字节长度 + 右补零的数据"""
+    dynamic = True
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, str):
+            value = bytes.fromhex(digit.del_0x(value))
+        return len(value).to_bytes(WORD, 'big') + _pad(value)
+
+    def decode(self, data: bytes, pos: int) -> bytes:
+        length = _read_word(data, pos)
+        start = pos + WORD
+        if start + length > len(data):
+            raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), start + length))
+        return data[start:start + length]
+
+
+class AbiString(AbiBytes):
+    def encode(self, value) -> bytes:
+        return super().encode(value.encode())
+
+    def decode(self, data: bytes, pos: int) -> str:
+        return super().decode(data, pos).decode(errors='replace')
+
+
+class AbiTuple(AbiType):
+    """元组, 也是函数参数与返回值的编码方式: 静态成员写在头部, 动态成员头部写相对元组起始的偏移"""
+
+    def __init__(self, name: str, types: list):
+        super().__init__(name)
+        self.types = tuple(types)
+        self.dynamic = any(t.dynamic for t in self.types)
+        self.size = WORD if self.dynamic else sum(t.size for t in self.types)
+        self.head_size = sum(WORD if t.dynamic else t.size for t in self.types)
+
+    def encode(self, value) -> bytes:
+        if len(value) != len(self.types):
+            raise ValueError('{} 需要 {} 个值, 实际 {} 个'.format(self.name, len(self.types), len(value)))
+        heads, tails = [], []
+        offset = self.head_size
+        for t, v in zip(self.types, value):
+            encoded = t.encode(v)
+            if t.dynamic:
+                heads.append(offset.to_bytes(WORD, 'big'))
+                tails.append(encoded)
+                offset += len(encoded)
+            else:
+                heads.append(encoded)
+        return b''.join(heads + tails)
+
+    def decode(self, data: bytes, pos: int) -> tuple:
+        values = []
+        head = pos
+        for t in self.types:
+            if t.dynamic:
+                values.append(t.decode(data, pos + _read_word(data, head)))
+                head += WORD
+            else:
+                values.append(t.decode(data, head))
+                head += t.size
+        return tuple(values)
+
+
+class AbiArray(AbiType):
+    """T[] 动态数组(32 字节长度 + 元素) 与 T[k] 定长数组, 元素的编码与元组相同"""
+
+    def __init__(self, name: str, item: AbiType, length: int = None):
+        super().__init__(name)
+        self.item = item
+        self.length = length
+        self.dynamic = length is None or item.dynamic
+        self.size = WORD if self.dynamic else length * item.size
+
+    def encode(self, value) -> bytes:
+        value = list(value)
+        if self.length is not None and len(value) != self.length:
+            raise ValueError('{} 需要 {} 个元素, 实际 {} 个'.format(self.name, self.length, len(value)))
+        item = self.item
+        if item.dynamic:
+            heads, tails = [], []
+            offset = len(value) * WORD
+            for v in value:
+                encoded = item.encode(v)
+                heads.append(offset.to_bytes(WORD, 'big'))
+                tails.append(encoded)
+                offset += len(encoded)
+            body = b''.join(heads + tails)
+        else:
+            body = b''.join([item.encode(v) for v in value])
+        if self.length is None:
+            return len(value).to_bytes(WORD, 'big') + body
+        return body
+
+    def decode(self, data: bytes, pos: int) -> list:
+        if self.length is None:
+            count = _read_word(data, pos)
+            pos += WORD
+        else:
+            count = self.length
+        item, decode = self.item, self.item.decode
+        if item.dynamic:
+            if pos + count * WORD > len(data):
+                raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), pos + count * WORD))
+            return [decode(data, pos + _read_word(data, pos + i * WORD)) for i in range(count)]
+        size = item.size
+        if pos + count * size > len(data):
+            raise ValueError('abi 数据长度不足: {} < {}'.format(len(data), pos + count * size))
+        return [decode(data, pos + i * size) for i in range(count)]
+
+
+def split_types(types: str) -> list:
+    """按顶层逗号拆分类型列表, 括号内的逗号不拆分: 'bool,(address,bytes)[]' -> ['bool', '(address,bytes)[]']"""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(types):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(types[start:i].strip())
+            start = i + 1
+    last = types[start:].strip()
+    if last or parts:
+        parts.append(last)
+    return parts
+
+
+class EthereumAbiCodec(object):
+    """
+    以太坊 ABI 编解码, 支持 address, uintN/intN, bool, bytesN, bytes, string, 元组, T[] 与 T[k].
+    类型字符串解析、函数选择器与事件 topic 都用 LRU 缓存, 重复使用时不再解析与计算 keccak.
+    解码直接读取 bytes, hex 字符串只在入口转换一次.
+        data = EthereumAbiCodec.encode_call('transfer(address,uint256)', receiver, value)
+        name, = EthereumAbiCodec.decode(['string'], rsp)
+        balances = EthereumAbiCodec.decode_many('uint256', rsp_list)
+    """
+    _cache_size = 1024
+
+    @classmethod
+    @lru_cache(maxsize=_cache_size)
+    def get_type(cls, name: str) -> AbiType:
+        """解析类型字符串, 如 'uint256' '(address,bytes)[]' 'string[3]'"""
+        name = name.strip()
+        if name.endswith(']'):
+            start = name.rindex('[')
+            item = cls.get_type(name[:start])
+            length = name[start + 1:-1]
+            return AbiArray(name, item, int(length) if length else None)
+        if name.startswith('('):
+            if not name.endswith(')'):
+                raise ValueError('abi 类型错误: {}'.format(name))
+            return AbiTuple(name, [cls.get_type(t) for t in split_types(name[1:-1])])
+        if name == 'address':
+            return AbiAddress(name)
+        if name == 'bool':
+            return AbiBool(name)
+        if name == 'string':
+            return AbiString(name)
+        if name == 'bytes':
+            return AbiBytes(name)
+        if name.startswith('bytes'):
+            length = int(name[5:])
+            if not 0 < length <= WORD:
+                raise ValueError('abi 类型错误: {}'.format(name))
+            return AbiFixedBytes(name, length)
+        for prefix, signed in (('uint', False), ('int', True)):
+            if name.startswith(prefix):
+                bits = int(name[len(prefix):] or 256)
+                if bits % 8 or not 0 < bits <= 256:
+                    raise ValueError('abi 类型错误: {}'.format(name))
+                return AbiUint(name, bits, signed)
+        raise ValueError('不支持的 abi 类型: {}'.format(name))
+
+    @classmethod
+    def get_types(cls, types: str or list or tuple) -> AbiTuple:
+        """参数/返回值的类型列表, 作为元组编解码"""
+        if isinstance(types, str):
+            return cls.get_type('({})'.format(types))
+        return cls.get_type('({})'.format(','.join(types)))
+
+    @classmethod
+    @lru_cache(maxsize=_cache_size)
+    def normalize_signature(cls, signature: str) -> str:
+        """去掉参数名与空格: 'transfer(address to, uint256 value)' -> 'transfer(address,uint256)'"""
+        signature = signature.strip()
+        start = signature.index('(')
+        if not signature.endswith(')'):
+            raise ValueError('abi 签名错误: {}'.format(signature))
+        args = [arg.split()[0] for arg in split_types(signature[start + 1:-1])]
+        return '{}({})'.format(signature[:start].strip(), ','.join(args))
+
+    @classmethod
+    def signature_types(cls, signature: str) -> list:
+        signature = cls.normalize_signature(signature)
+        return split_types(signature[signature.index('(') + 1:-1])
+
+    @classmethod
+    @lru_cache(maxsize=_cache_size)
+    def selector(cls, signature: str) -> str:
+        """函数选择器 '0x' + 8 位 hex"""
+        return '0x' + keccak_256(cls.normalize_signature(signature).encode()).hexdigest()[:8]
+
+    @classmethod
+    @lru_cache(maxsize=_cache_size)
+    def topic(cls, event: str) -> str:
+        """事件 topic0 '0x' + 64 位 hex"""
+        return '0x' + keccak_256(cls.normalize_signature(event).encode()).hexdigest()
+
+    @classmethod
+    def to_bytes(cls, data: str or bytes) -> bytes:
+        if isinstance(data, str):
+            return bytes.fromhex(digit.del_0x(data))
+        return bytes(data)
+
+    @classmethod
+    def encode(cls, types: str or list, values) -> bytes:
+        return cls.get_types(types).encode(values)
+
+    @classmethod
+    def encode_call(cls, signature: str, *args) -> str:
+        """函数调用数据 hex: 选择器 + 参数编码"""
+        return cls.selector(signature) + cls.get_types(cls.signature_types(signature)).encode(args).hex()
+
+    @classmethod
+    def decode(cls, types: str or list, data: str or bytes) -> tuple:
+        """
+        :param types: 'uint256,string' or ['uint256', 'string']
+        :param data: eth_call 返回的 hex 或 bytes
+        :return: 解码的值, 与 types 一一对应
+        """
+        return cls.get_types(types).decode(cls.to_bytes(data), 0)
+
+    @classmethod
+    def decode_text(cls, data: str or bytes) -> str:
+        """string 返回值; 部分老合约(如 MKR)的 name/symbol 返回 bytes32, 去掉右侧补零后解码"""
+        data = cls.to_bytes(data)
+        if len(data) == WORD:
+            return data.rstrip(b'\x00').decode(errors='replace')
+        return cls.decode(['string'], data)[0]
+
+    @classmethod
+    def decode_many(cls, types: str or list, datas: list) -> list:
+        """
+        批量解码, 类型只解析一次. 单个类型时每条结果为该值, 多个类型时为元组.
+        空结果('0x' or None)与解码失败为 None.
+        单个 uintN/intN 与 string/bytes 在循环内直接解码, 不经过逐层的类型对象, 用于几千上万条 eth_call 结果.
+        """
+        abi_type = cls.get_types(types)
+        item = abi_type.types[0] if len(abi_type.types) == 1 else None
+        if isinstance(item, AbiUint):
+            return cls._decode_uint_many(item, datas)
+        if isinstance(item, AbiBytes):
+            return cls._decode_bytes_many(item, datas)
+        if item is not None:
+            # 单个静态类型的值就在第 0 字节, 动态类型的第一个字为偏移
+            decode = (lambda data: item.decode(data, _read_word(data, 0))) if item.dynamic else (
+                lambda data: item.decode(data, 0))
+        else:
+            decode = lambda data: abi_type.decode(data, 0)
+        results = []
+        fromhex = bytes.fromhex
+        for data in datas:
+            if not data or data == '0x':
+                results.append(None)
+                continue
+            try:
+                results.append(decode(fromhex(data[2:] if data[:2] == '0x' else data)
+                                      if isinstance(data, str) else data))
+            except (ValueError, TypeError):
+                results.append(None)
+        return results
+
+    @classmethod
+    def _decode_uint_many(cls, item: AbiUint, datas: list) -> list:
+        """hex 结果直接取第一个字转换, 不需要先转为 bytes"""
+        results = []
+        append = results.append
+        signed, half, limit = item.signed, 1 << 255, 1 << 256
+        for data in datas:
+            if isinstance(data, str):
+                word = data[2:66] if data[:2] == '0x' else data[:64]
+                if len(word) != 64:
+                    append(None)
+                    continue
+                try:
+                    value = int(word, 16)
+                except ValueError:
+                    append(None)
+                    continue
+            elif data and len(data) >= WORD:
+                value = int.from_bytes(data[:WORD], 'big')
+            else:
+                append(None)
+                continue
+            append(value - limit if signed and value >= half else value)
+        return results
+
+    @classmethod
+    def _decode_bytes_many(cls, item: AbiBytes, datas: list) -> list:
+        """
+        返回值几乎都是偏移 0x20、长度小于 65536 的形式, hex 前缀匹配时只把长度与数据部分转为 bytes,
+        其他情况按完整的规则解码
+        """
+        results = []
+        append = results.append
+        fromhex = bytes.fromhex
+        text = isinstance(item, AbiString)
+        prefix, skip = _BYTES_HEX_PREFIX, len(_BYTES_HEX_PREFIX)
+        for data in datas:
+            if not data or data == '0x':
+                append(None)
+                continue
+            try:
+                if isinstance(data, str):
+                    if data.startswith(prefix):
+                        raw = fromhex(data[skip:])
+                        end = 2 + (raw[0] << 8 | raw[1])
+                        value = raw[2:end] if end <= len(raw) else None
+                        append(None if value is None else value.decode(errors='replace') if text else value)
+                        continue
+                    data = fromhex(data[2:] if data[:2] == '0x' else data)
+                offset = int.from_bytes(data[:WORD], 'big')
+                start = offset + WORD
+                if len(data) < 2 * WORD or start > len(data):
+                    append(None)
+                    continue
+                end = start + int.from_bytes(data[offset:start], 'big')
+                if end > len(data):
+                    append(None)
+                    continue
+                value = bytes(data[start:end])
+            except (ValueError, IndexError):
+                append(None)
+                continue
+            append(value.decode(errors='replace') if text else value)
+        return results
@@ -0,0 +1,123 @@
+from coin.coin_tools import Tx
+from coin.resolver.eth_abi_codec import EthereumAbiCodec
+from digit import digit
+from enumer.coin_enum import TxStatusEnum
+
+
+class TokenTransfer(Tx):
+    """
+    从 Transfer 事件日志解析出的代币转账, 字段与 Tx 兼容, contract 为代币合约地址.
+    日志不包含 gas/gas_price/nonce, 这三个字段为 None; data 为日志的 data.
+    一笔交易可能产生多条转账, 用 (tx_hash, log_index) 区分.
+    """
+    FIELDS = Tx.FIELDS + ('log_index', 'removed')
+    __slots__ = ('log_index', 'removed')
+
+    def __init__(self, block_height, block_hash, tx_hash, log_index, sender, receiver, value, contract, data,
+                 removed=False):
+        super().__init__(block_height, block_hash, tx_hash, sender, receiver, value, None, None, None, data, contract,
+                         TxStatusEnum.VALID.value)
+        self.log_index = log_index
+        self.removed = removed
+
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data['logIndex'] = self.log_index
+        data['removed'] = self.removed
+        return data
+
+
+class EthereumLogResolver(object):
+    """
+    事件日志解析. 按 (topic0, topics 数量) 查分发表找到解析函数, 不匹配的日志直接跳过.
+    ERC-20 与 ERC-721 的 Transfer 签名相同, ERC-721 的 tokenId 也是 indexed, 通过 topics 数量区分.
+    用法:
+        transfers = EthereumLogResolver.resolver_receipts(receipts, address_index=index)
+    """
+    TRANSFER_EVENT = b'Transfer(address,address,uint256)'
+    TRANSFER_TOPIC = EthereumAbiCodec.topic(TRANSFER_EVENT.decode())
+    # topic 为 32 字节左补零的地址, '0x' + 24 个 0 之后为 40 位地址
+    TOPIC_ADDRESS_START = 2 + 24
+
+    _handlers = {}
+
+    @classmethod
+    def get_topic(cls, event: bytes or str) -> str:
+        """事件签名的 topic0, 如 Transfer(address,address,uint256)"""
+        if isinstance(event, bytes):
+            event = event.decode()
+        return EthereumAbiCodec.topic(event)
+
+    @classmethod
+    def register(cls, topic: str, topics_count: int, handler):
+        """
+        注册事件解析函数
+        :param topic: topic0, 小写 hex
+        :param topics_count: topics 数量, 包括 topic0
+        :param handler: handler(log) -> 记录 or None
+        """
+        cls._handlers[(topic, topics_count)] = handler
+
+    @classmethod
+    def topic_to_address(cls, topic: str) -> str:
+        return '0x' + topic[cls.TOPIC_ADDRESS_START:]
+
+    @classmethod
+    def address_to_topic(cls, address: str) -> str:
+        return '0x' + digit.del_0x(address).lower().zfill(64)
+
+    @classmethod
+    def resolver_transfer_log(cls, log) -> TokenTransfer:
+        _, sender, receiver = log['topics']
+        start = cls.TOPIC_ADDRESS_START
+        return TokenTransfer(digit.hex_to_int(log['blockNumber']), log['blockHash'], log['transactionHash'],
+                             digit.hex_to_int(log['logIndex']), '0x' + sender[start:], '0x' + receiver[start:],
+                             digit.hex_to_int(log['data']), log['address'], log['data'], log.get('removed', False))
+
+    @classmethod
+    def resolver_log(cls, log):
+        """解析一条日志, 分发表中没有对应解析函数时返回 None"""
+        topics = log['topics']
+        if not topics:
+            return None
+        handler = cls._handlers.get((topics[0], len(topics)))
+        return handler(log) if handler is not None else None
+
+    @classmethod
+    def resolver_logs(cls, logs, contracts=None, address_index=None) -> list:
+        """
+        批量解析日志
+        :param logs: eth_getLogs 返回或收据中的 logs
+        :param contracts: 只保留这些合约的日志, 小写地址集合
+        :param address_index: coin.address_index.AddressIndex, 只保留收款地址在其中的转账
+        :return: 解析结果列表, 如 TokenTransfer
+        """
+        handlers = cls._handlers
+        records = []
+        for log in logs:
+            topics = log['topics']
+            if not topics:
+                continue
+            handler = handlers.get((topics[0], len(topics)))
+            if handler is None or (contracts is not None and log['address'] not in contracts):
+                continue
+            record = handler(log)
+            if record is None or (address_index is not None and record.receiver not in address_index):
+                continue
+            records.append(record)
+        return records
+
+    @classmethod
+    def resolver_receipts(cls, receipts, contracts=None, address_index=None) -> list:
+        """
+        批量解析收据中的日志, 失败的交易(status 为 0)没有日志, 直接跳过
+        :param receipts: eth_getTransactionReceipt 返回列表
+        """
+        logs = []
+        for receipt in receipts:
+            if receipt and receipt.get('status') != '0x0':
+                logs.extend(receipt['logs'])
+        return cls.resolver_logs(logs, contracts, address_index)
+
+
+EthereumLogResolver.register(EthereumLogResolver.TRANSFER_TOPIC, 3, EthereumLogResolver.resolver_transfer_log)
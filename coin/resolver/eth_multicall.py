@@ -0,0 +1,95 @@
+from coin.resolver.eth_abi_codec import EthereumAbiCodec
+from coin.resolver.eth_resolver import EthereumResolver
+from digit import digit
+
+
+class EthereumMulticall(object):
+    """
+    Multicall3 聚合合约的 ABI 编解码. 多个只读调用打包进一次 eth_call, 返回数据解码为每个调用的结果.
+    使用 tryAggregate(bool requireSuccess, (address target, bytes callData)[] calls)
+        returns ((bool success, bytes returnData)[]),
+    单个调用失败不影响其他调用, 失败的结果为 None.
+    用法:
+        data = EthereumMulticall.encode_calls([EthereumMulticall.balance_call(usdt, addr) for addr in addresses])
+        results = EthereumMulticall.decode_results(rpc_result)
+    """
+    # 主流 EVM 链上 Multicall3 的部署地址相同
+    ADDRESS = '0xca11bde05977b3631167028862be2a173976ca11'
+    # keccak256('tryAggregate(bool,(address,bytes)[])')[:4]
+    TRY_AGGREGATE_ABI = '0xbce38bd7'
+    CALLS_TYPES = ('bool', '(address,bytes)[]')
+    RESULTS_TYPES = ('(bool,bytes)[]',)
+
+    @classmethod
+    def encode_calls(cls, calls: list, require_success=False) -> str:
+        """
+        :param calls: [(合约地址, hex 调用数据)]
+        :param require_success: True 时任一调用失败整个 eth_call 失败
+        :return: tryAggregate 的 hex 调用数据
+        """
+        return cls.TRY_AGGREGATE_ABI + EthereumAbiCodec.encode(cls.CALLS_TYPES, (require_success, calls)).hex()
+
+    @classmethod
+    def decode_calls(cls, data: str) -> tuple:
+        """
+        encode_calls 的逆运算, 用于实现聚合合约的桩
+        :return: (require_success, [(合约地址, hex 调用数据)])
+        """
+        data = digit.del_0x(data)
+        if not data.startswith(digit.del_0x(cls.TRY_AGGREGATE_ABI)):
+            raise ValueError('不是 tryAggregate 调用: {}'.format(data[:8]))
+        require_success, calls = EthereumAbiCodec.decode(cls.CALLS_TYPES, data[8:])
+        return require_success, [(target, '0x' + call.hex()) for target, call in calls]
+
+    @classmethod
+    def encode_results(cls, results: list) -> str:
+        """
+        :param results: [bytes or None], None 表示调用失败
+        :return: tryAggregate 的 hex 返回数据
+        """
+        return '0x' + EthereumAbiCodec.encode(
+            cls.RESULTS_TYPES, ([(result is not None, result or b'') for result in results],)).hex()
+
+    @classmethod
+    def decode_results(cls, data: str) -> list:
+        """
+        :param data: eth_call 返回的 hex
+        :return: [bytes or None], 与调用一一对应, 调用失败为 None
+        """
+        results, = EthereumAbiCodec.decode(cls.RESULTS_TYPES, data)
+        return [result if success else None for success, result in results]
+
+    @classmethod
+    def split(cls, calls: list, size: int) -> list:
+        return [calls[i:i + size] for i in range(0, len(calls), size)]
+
+    @classmethod
+    def balance_call(cls, contract: str, address: str) -> tuple:
+        """balanceOf(address)"""
+        return (contract, EthereumResolver.GET_BALANCE_ABI + EthereumResolver.get_address(address, contract))
+
+    @classmethod
+    def contract_info_calls(cls, contract: str) -> list:
+        """name() symbol() decimals() totalSupply()"""
+        return [(contract, '0x' + abi) for abi in (EthereumResolver.get_name_abi(), EthereumResolver.get_symbol_abi(),
+                                                   EthereumResolver.get_decimal_abi(),
+                                                   EthereumResolver.get_total_abi())]
+
+    @classmethod
+    def decode_contract_info(cls, results: list) -> tuple:
+        """
+        :param results: contract_info_calls 的结果
+        :return: (str name, str symbol, int decimal, int total), 调用失败的字段为 None
+        """
+        name, symbol, decimal, total = results
+        decimal, total = EthereumAbiCodec.decode_many('uint256', [decimal, total])
+        return cls._decode_text(name), cls._decode_text(symbol), decimal, total
+
+    @classmethod
+    def _decode_text(cls, result: bytes) -> str or None:
+        if not result:
+            return None
+        try:
+            return EthereumAbiCodec.decode_text(result)
+        except ValueError:
+            return None
@@ -1,9 +1,9 @@
 import re
 
 from coin.coin_tools import Tx, TxReceipt, Block
+from coin.resolver.eth_abi_codec import EthereumAbiCodec
 from digit import digit
 from enumer.coin_enum import TxStatusEnum
-from sha3 import keccak_256
 
 
 class EthereumResolver(object):
@@ -66,13 +66,10 @@ class EthereumResolver(object):
 
     @classmethod
     def get_abi(cls, abi_func: bytes or str):
-        if isinstance(abi_func, str):
-            abi_func = abi_func.encode()
-        func, args = [i.strip(b')') for i in abi_func.strip().split(b'(')]
-        func_args = b"%s(%s)" % (
-            func, b','.join([i.strip().split(b' ')[0] for i in args.split(b',')])
-        )
-        return keccak_256(func_args).hexdigest()[:8]
+        """函数选择器, 不带 0x, 结果由 EthereumAbiCodec 缓存"""
+        if isinstance(abi_func, bytes):
+            abi_func = abi_func.decode()
+        return EthereumAbiCodec.selector(abi_func)[2:]
 
     @classmethod
     def get_name_abi(cls):
@@ -90,23 +87,28 @@ class EthereumResolver(object):
     def get_total_abi(cls):
         return cls.get_abi('totalSupply()')
 
+    @classmethod
+    def is_empty_abi(cls, data) -> bool:
+        """eth_call 返回不足一个 abi 字(32 字节), 如地址没有合约代码或合约已自毁"""
+        if not data:
+            return True
+        return len(data) < 32 if isinstance(data, bytes) else len(digit.del_0x(data)) < 64
+
     @classmethod
     def parse_abi_name(cls, name_abi):
-        name_abi_no0x = digit.del_0x(name_abi)
-        return bytes.fromhex(name_abi_no0x[128:]).strip(b'\x00').decode()
+        return '' if cls.is_empty_abi(name_abi) else EthereumAbiCodec.decode_text(name_abi)
 
     @classmethod
     def parse_abi_symbol(cls, symbol_abi):
-        symbol_abi_no0x = digit.del_0x(symbol_abi)
-        return bytes.fromhex(symbol_abi_no0x[128:]).strip(b'\x00').decode()
+        return '' if cls.is_empty_abi(symbol_abi) else EthereumAbiCodec.decode_text(symbol_abi)
 
     @classmethod
     def parse_abi_decimal(cls, decimal_abi):
-        return digit.hex_to_int(decimal_abi)
+        return 0 if cls.is_empty_abi(decimal_abi) else EthereumAbiCodec.decode(['uint8'], decimal_abi)[0]
 
     @classmethod
     def parse_abi_total(cls, total_abi):
-        return digit.hex_to_int(total_abi)
+        return 0 if cls.is_empty_abi(total_abi) else EthereumAbiCodec.decode(['uint256'], total_abi)[0]
 
     @classmethod
     def get_estimate_gas_body(cls, contract=None):
@@ -173,6 +175,15 @@ class EthereumResolver(object):
         return Tx(block_height, block_hash, tx_hash, sender, receiver, value, gas, gas_price, nonce, data, contract,
                   status)
 
+    @classmethod
+    def get_receiver(cls, tx) -> str or None:
+        """不构建 Tx, 只取出收款地址, erc20 transfer 取 input 中的地址"""
+        _input = tx['input']
+        if _input.startswith(cls.TRANSFER_ABI):
+            start = len(cls.TRANSFER_ABI) + cls.ADDRESS_FILL_LENGTH
+            return _input[start:start + cls.ADDRESS_LENGTH]
+        return tx['to']
+
     @classmethod
     def resolver_receipt(cls, receipt):
         block_height = digit.hex_to_int(receipt['blockNumber'])
@@ -186,17 +197,101 @@ class EthereumResolver(object):
         return TxReceipt(block_height, block_hash, tx_hash, sender, receiver, contract, status, gas_used)
 
     @classmethod
-    def resolver_block(cls, block, detail=True):
-        """不包含交易"""
+    def resolver_transactions(cls, txs: list, block_height: int = None) -> list:
+        """
+        批量解析交易, 返回 LazyTx, 字段在第一次访问时才解码, 结果与 resolver_transaction 一致.
+        :param txs: 同一个块中的交易
+        :param block_height: 块高度, 传入时所有交易共用, 不再逐个解码 blockNumber
+        """
+        return [LazyTx(tx, block_height) for tx in txs]
+
+    @classmethod
+    def resolver_block(cls, block, detail=True, address_index=None, lazy=False, match_sender=False):
+        """
+        :param block: 块数据
+        :param detail: 是否解析交易
+        :param address_index: coin.address_index.AddressIndex, 只解析收款地址在其中的交易
+        :param lazy: 交易解析为 LazyTx, 字段在访问时才解码, 适合大量交易只读取少数字段的场景
+        :param match_sender: 发送地址在 address_index 中的交易同样解析, 用于跟踪钱包的转出与手续费
+        """
         block_height = digit.hex_to_int(block['number'])
         block_hash = block['hash']
         block_time = digit.hex_to_int(block['timestamp'])
         if detail:
-            transactions = [cls.resolver_transaction(tx) for tx in block['transactions']]
+            txs = block['transactions']
+            if address_index is not None:
+                txs = [tx for tx in txs if cls.get_receiver(tx) in address_index
+                       or (match_sender and tx['from'] in address_index)]
+            if lazy:
+                transactions = cls.resolver_transactions(txs, block_height)
+            else:
+                transactions = [cls.resolver_transaction(tx) for tx in txs]
         else:
             transactions = []
 
-        return Block(height=block_height, hash=block_hash, timestamp=block_time, transactions=transactions)
+        return Block(height=block_height, hash=block_hash, timestamp=block_time, transactions=transactions,
+                     parent_hash=block.get('parentHash'))
+
+
+class LazyTx(object):
+    """
+    延迟解码的交易, 字段与 coin.coin_tools.Tx 相同, 值与 EthereumResolver.resolver_transaction 一致.
+    只保存原始交易 dict 的引用, 字段在第一次访问时解码并写入同名 slot, 之后的访问直接读 slot;
+    不访问的字段不产生任何对象.
+    """
+    FIELDS = Tx.FIELDS
+    __slots__ = ('_tx', '_transfer') + FIELDS
+
+    def __init__(self, tx: dict, block_height: int = None):
+        self._tx = tx
+        self._transfer = tx['input'].startswith(EthereumResolver.TRANSFER_ABI)
+        if block_height is not None:
+            self.block_height = block_height
+
+    def __getattr__(self, name):
+        # 只有 slot 未赋值时才会进入这里
+        try:
+            decoder = self._decoders[name]
+        except KeyError:
+            raise AttributeError(name)
+        value = decoder(self._tx, self._transfer)
+        setattr(self, name, value)
+        return value
+
+    @staticmethod
+    def _get_receiver(tx, transfer):
+        if transfer:
+            return '0x' + EthereumResolver.get_receiver(tx)
+        return EthereumResolver.get_address(tx['to'])
+
+    @staticmethod
+    def _get_value(tx, transfer):
+        if transfer:
+            return digit.hex_to_int(tx['input'][len(EthereumResolver.TRANSFER_ABI) +
+                                                EthereumResolver.ADDRESS_FULL_LENGTH:])
+        return digit.hex_to_int(tx['value'])
+
+    _decoders = {
+        'block_height': lambda tx, transfer: digit.hex_to_int(tx['blockNumber']),
+        'block_hash': lambda tx, transfer: tx['blockHash'],
+        'tx_hash': lambda tx, transfer: tx['hash'],
+        'sender': lambda tx, transfer: EthereumResolver.get_address(tx['from']),
+        'receiver': _get_receiver.__func__,
+        'value': _get_value.__func__,
+        'gas': lambda tx, transfer: digit.hex_to_int(tx['gas']),
+        'gas_price': lambda tx, transfer: digit.hex_to_int(tx['gasPrice']),
+        'nonce': lambda tx, transfer: digit.hex_to_int(tx['nonce']),
+        'data': lambda tx, transfer: tx['input'] if transfer else None,
+        'contract': lambda tx, transfer: tx['to'] if transfer else None,
+        'status': lambda tx, transfer: TxStatusEnum.UNKNOWN.value,
+    }
+
+    @property
+    def raw(self) -> dict:
+        return self._tx
+
+    def to_tx(self) -> Tx:
+        return Tx(*[getattr(self, field) for field in self.FIELDS])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,87 @@
+from digit import digit
+
+
+class EthereumRlp(object):
+    """
+    RLP 编解码, 用于交易序列化.
+    编码支持 bytes, int(大端最短编码, 0 为空串), hex str(字节串, '0x' 为空串), None(空串) 与 list/tuple(嵌套列表).
+    解码返回 bytes 与 list.
+        EthereumRlp.encode([nonce, gas_price, gas, to, value, data])
+    """
+
+    @classmethod
+    def to_bytes(cls, value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, int):
+            if value < 0:
+                raise ValueError('rlp 不支持负数: {}'.format(value))
+            return value.to_bytes((value.bit_length() + 7) // 8, 'big')
+        if isinstance(value, str):
+            # hex str 按字节串编码, 数值字段需要先转为 int 或使用 encode_int
+            value = digit.del_0x(value)
+            if len(value) % 2:
+                value = '0' + value
+            return bytes.fromhex(value)
+        if value is None:
+            return b''
+        raise ValueError('rlp 不支持的类型: {}'.format(type(value)))
+
+    @classmethod
+    def _length(cls, length: int, offset: int) -> bytes:
+        if length < 56:
+            return bytes((offset + length,))
+        length = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+        return bytes((offset + 55 + len(length),)) + length
+
+    @classmethod
+    def encode(cls, item) -> bytes:
+        if isinstance(item, (list, tuple)):
+            payload = b''.join(cls.encode(i) for i in item)
+            return cls._length(len(payload), 0xc0) + payload
+        item = cls.to_bytes(item)
+        if len(item) == 1 and item[0] < 0x80:
+            return item
+        return cls._length(len(item), 0x80) + item
+
+    @classmethod
+    def encode_int(cls, value) -> bytes:
+        """hex 数值字段('0x0', '0x01') 去掉前导 0 后编码, 与 int 的编码一致"""
+        if isinstance(value, str):
+            value = digit.hex_to_int(value)
+        return cls.encode(value or 0)
+
+    @classmethod
+    def _decode(cls, data: bytes, pos: int) -> tuple:
+        if pos >= len(data):
+            raise ValueError('rlp 数据长度不足: {}'.format(len(data)))
+        prefix = data[pos]
+        if prefix < 0x80:
+            return data[pos:pos + 1], pos + 1
+        is_list = prefix >= 0xc0
+        short = prefix - (0xc0 if is_list else 0x80)
+        if short < 56:
+            start, length = pos + 1, short
+        else:
+            size = short - 55
+            start = pos + 1 + size
+            length = int.from_bytes(data[pos + 1:start], 'big')
+        end = start + length
+        if end > len(data):
+            raise ValueError('rlp 数据长度不足: {} < {}'.format(len(data), end))
+        if not is_list:
+            return data[start:end], end
+        items = []
+        while start < end:
+            item, start = cls._decode(data, start)
+            items.append(item)
+        return items, end
+
+    @classmethod
+    def decode(cls, data: bytes or str):
+        if isinstance(data, str):
+            data = bytes.fromhex(digit.del_0x(data))
+        item, end = cls._decode(data, 0)
+        if end != len(data):
+            raise ValueError('rlp 数据有多余的字节: {} > {}'.format(len(data), end))
+        return item
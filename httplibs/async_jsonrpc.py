@@ -0,0 +1,139 @@
+import asyncio
+import traceback
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from exceptions import JsonRpcError
+from httplibs.jsonrpc import BatchOrder, JsonRpcV2
+from httplibs.jsonstream import JsonArrayStream
+
+
+class AsyncJsonRpcV2(JsonRpcV2):
+    """
+    asyncio 版本的 JsonRpcV2, 基于 aiohttp.
+    _single_post / _many_post / _diff_post 与同步版本用法一致, 返回值需要 await, 结果与同步版本相同.
+    同一个事件循环内可并发成千上万个请求, 实际同时在途的请求数由 max_concurrency 限制.
+    """
+    _default_max_concurrency = 100
+    _default_keepalive_timeout = 60
+
+    def __init__(self, host, **kwargs):
+        if aiohttp is None:
+            raise ImportError("AsyncJsonRpcV2 依赖 aiohttp, 请先安装: pip install aiohttp")
+        super().__init__(host, **kwargs)
+        self._max_concurrency = kwargs.get('max_concurrency', self._default_max_concurrency)
+        self._keepalive_timeout = kwargs.get('keepalive_timeout', self._default_keepalive_timeout)
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        """aiohttp 的 session 必须在事件循环中创建, 所以在第一次请求时才初始化"""
+        if self._client is None or self._client.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_concurrency,
+                                             keepalive_timeout=self._keepalive_timeout)
+            if isinstance(self._timeout, tuple):
+                timeout = aiohttp.ClientTimeout(sock_connect=self._timeout[0], sock_read=self._timeout[1])
+            else:
+                timeout = aiohttp.ClientTimeout(total=self._timeout)
+            auth = aiohttp.BasicAuth(*self._basic_auth) if self._basic_auth else None
+            self._client = aiohttp.ClientSession(connector=connector, timeout=timeout, auth=auth,
+                                                 headers=self.get_headers())
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
+        self._client = None
+        super().close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _fetch(self, params):
+        client = self._get_client()
+        async with self._semaphore:
+            data, _ = self.format_params(params)
+            async with client.post(self.host, data=data) as rsp:
+                body = await rsp.read()
+                try:
+                    return self._codec.loads(body)
+                except ValueError as e:
+                    self.logger.warning("rsp json decode error: {}".format(e))
+                return await rsp.text()
+
+    async def _send_data(self, params, processor):
+        response = None
+        if self._cache is not None and isinstance(params, dict):
+            response = self._cache.get_response(params)
+        if response is not None:
+            return processor(response)
+        try:
+            rsp_result = await self._fetch(params)
+        except Exception as e:
+            rsp_result = {'error': {"code": 0, "message": "不可预知的错误: {}".format(e)}}
+            self.logger.warning(traceback.format_exc())
+        if self._cache is not None and isinstance(params, dict):
+            self._cache.set_response(params, rsp_result)
+        return processor(rsp_result)
+
+    async def _send_template_chunk(self, template, values: list, fixed: dict):
+        ids = self._id.take(len(values))
+        body = template.render(ids, values, **fixed)
+        return self.merge_ids(ids, await self._send_data(body, lambda data: data))
+
+    async def _template_post(self, template, values: list, ignore_err=True, **fixed):
+        values = list(values)
+        responses = await asyncio.gather(*[self._send_template_chunk(template, chunk, fixed)
+                                           for chunk in self.split_values(template, values, **fixed)])
+        return self._get_batch_processor(ignore_err)([d for response in responses for d in response])
+
+    async def _fetch_stream(self, params):
+        client = self._get_client()
+        stream = JsonArrayStream(self._codec.loads)
+        data, _ = self.format_params(params)
+        async with self._semaphore:
+            async with client.post(self.host, data=data) as rsp:
+                async for chunk in rsp.content.iter_chunked(self._default_stream_chunk_size):
+                    for item in stream.feed(chunk):
+                        yield item
+        stream.close()
+
+    async def _stream_chunk(self, chunk, processor):
+        order = BatchOrder(chunk)
+        try:
+            async for data in self._fetch_stream(chunk):
+                for response in order.push(data):
+                    yield processor(response)
+        except JsonRpcError:
+            raise
+        except Exception as e:
+            self.logger.warning(traceback.format_exc())
+            order.fail({"code": 0, "message": "不可预知的错误: {}".format(e)})
+        for response in order.finish():
+            yield processor(response)
+
+    async def _send_stream(self, payload: list, processor):
+        """async for result in rpc._many_post(method, params, stream=True)"""
+        for chunk in self.split_batch(payload):
+            async for result in self._stream_chunk(chunk, processor):
+                yield result
+
+    async def _send_chunk(self, chunk):
+        return self.merge_batch(chunk, await self._send_data(chunk, lambda data: data))
+
+    async def _send_batch(self, payload: list, processor):
+        """拆分后的批次在事件循环中并发发送, 并发数同样受 max_concurrency 限制, 有缓存时只请求未命中的部分"""
+        if self._cache is not None:
+            responses, payload = self._cache.lookup(payload)
+        responses_chunks = await asyncio.gather(*[self._send_chunk(chunk) for chunk in self.split_batch(payload)])
+        fetched = [d for response in responses_chunks for d in response]
+        if self._cache is not None:
+            fetched = self._cache.store(payload, fetched, responses)
+        return processor(fetched)
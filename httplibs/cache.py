@@ -0,0 +1,272 @@
+from collections import OrderedDict
+import json
+import threading
+import time
+
+from digit import digit
+
+
+def request_key(method: str, params) -> str:
+    """(method, params) 的唯一 key, 参数顺序敏感, dict 按 key 排序"""
+    return method + json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+
+class LruCache(object):
+    """
+    按占用字节数淘汰的 LRU 缓存, 线程安全.
+    占用字节数按 value 的 json 长度估算.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_items=None):
+        self._max_bytes = max_bytes
+        self._max_items = max_items
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_size(cls, value) -> int:
+        return len(json.dumps(value, separators=(',', ':')))
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size: int = None):
+        if size is None:
+            size = self.get_size(value)
+        if self._max_bytes is not None and size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and ((self._max_bytes is not None and self._bytes > self._max_bytes) or
+                                  (self._max_items is not None and len(self._data) > self._max_items)):
+                _, (_, evict_size) = self._data.popitem(last=False)
+                self._bytes -= evict_size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TtlCache(object):
+    """按 key 过期的缓存, 线程安全. 超过 max_items 时淘汰最早写入的 key."""
+
+    def __init__(self, max_items=10000):
+        self._max_items = max_items
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time.monotonic():
+                self._data.pop(key)
+                return default
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + ttl, value)
+            while self._max_items is not None and len(self._data) > self._max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RpcCache(object):
+    """
+    按最终性分层的 jsonrpc 结果缓存, 通过 JsonRpcV2(host, cache=RpcCache()) 使用.
+    * 不可变结果: 按 hash 获取的块, 以及确认数达到 confirmations 的交易、收据、按高度获取的块与历史余额,
+      放入按字节数淘汰的 LRU.
+    * 易变结果: ttl 中配置的方法(eth_gasPrice, eth_blockNumber, latest 余额等), 缓存 ttl 秒.
+    结果为 null 或者请求返回 error 时不缓存.
+    结果以 json 文本保存, 每次命中解码出新的对象, 调用方修改返回的结果不会影响缓存.
+    链高度从 eth_blockNumber / eth_syncing / 块数据的返回中获取, 高度未知时不缓存依赖确认数的结果.
+    """
+    IMMUTABLE = 'immutable'
+    VOLATILE = 'volatile'
+
+    _default_ttl = {
+        'eth_gasPrice': 3,
+        'eth_blockNumber': 1,
+        'eth_syncing': 1,
+        'eth_getBalance': 2,
+    }
+    # 方法 -> 块高参数所在位置, 块高为数字且已确认时结果不可变, 否则按 ttl 缓存
+    _block_param_index = {
+        'eth_getBalance': 1,
+        'eth_call': 1,
+        'eth_getBlockByNumber': 0,
+    }
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, confirmations=12, ttl: dict = None, max_volatile_items=10000):
+        """
+        :param max_bytes: 不可变结果缓存最大占用字节数
+        :param confirmations: 确认数达到多少后视为不可变
+        :param ttl: {method: seconds}, 会覆盖默认的 ttl 配置, seconds 为 None 或 0 表示不缓存该方法
+        :param max_volatile_items: 易变结果最大缓存条数
+        """
+        self.confirmations = confirmations
+        self.ttl = dict(self._default_ttl)
+        self.ttl.update(ttl or {})
+        self.immutable = LruCache(max_bytes=max_bytes)
+        self.volatile = TtlCache(max_items=max_volatile_items)
+        self.head = None
+        self._counter = {'hits': 0, 'misses': 0, 'immutableHits': 0, 'volatileHits': 0, 'stores': 0}
+        self._method_counter = {}
+        self._lock = threading.Lock()
+
+    def _count(self, method, name):
+        with self._lock:
+            self._counter[name] += 1
+            counter = self._method_counter.setdefault(method, {'hits': 0, 'misses': 0})
+            if name in counter:
+                counter[name] += 1
+
+    def update_head(self, height: int):
+        if height is not None and (self.head is None or height > self.head):
+            self.head = height
+
+    def is_confirmed(self, height) -> bool:
+        if height is None or self.head is None:
+            return False
+        if isinstance(height, str):
+            if not height.startswith('0x'):
+                return False
+            height = digit.hex_to_int(height)
+        return self.head - height >= self.confirmations
+
+    def tier(self, method: str, params: list, result):
+        """根据方法、参数与结果判断缓存层级, None 表示不缓存"""
+        if result is None:
+            return None
+        if method == 'eth_getBlockByHash':
+            return self.IMMUTABLE
+        if method in ('eth_getTransactionByHash', 'eth_getTransactionReceipt'):
+            return self.IMMUTABLE if isinstance(result, dict) and self.is_confirmed(
+                result.get('blockNumber')) else None
+        index = self._block_param_index.get(method)
+        if index is not None and len(params) > index and self.is_confirmed(params[index]):
+            return self.IMMUTABLE
+        if index is not None and len(params) > index and params[index] not in ('latest', 'pending'):
+            # 未确认的具体高度不缓存
+            return None
+        if self.ttl.get(method):
+            return self.VOLATILE
+        return None
+
+    def _track_head(self, method, result):
+        if method == 'eth_blockNumber' and isinstance(result, str):
+            self.update_head(digit.hex_to_int(result))
+        elif method == 'eth_syncing' and isinstance(result, dict):
+            self.update_head(digit.hex_to_int(result['currentBlock']))
+        elif method in ('eth_getBlockByNumber', 'eth_getBlockByHash') and isinstance(result, dict) \
+                and result.get('number'):
+            self.update_head(digit.hex_to_int(result['number']))
+
+    @classmethod
+    def freeze(cls, result) -> str:
+        return json.dumps(result, separators=(',', ':'))
+
+    @classmethod
+    def thaw(cls, frozen: str):
+        return json.loads(frozen)
+
+    def get(self, method: str, params: list) -> tuple:
+        """
+        :return: (是否命中, 结果), 结果为缓存的副本
+        """
+        key = request_key(method, params)
+        frozen = self.immutable.get(key)
+        if frozen is not None:
+            self._count(method, 'hits')
+            self._count(method, 'immutableHits')
+            return True, self.thaw(frozen)
+        frozen = self.volatile.get(key)
+        if frozen is not None:
+            self._count(method, 'hits')
+            self._count(method, 'volatileHits')
+            return True, self.thaw(frozen)
+        self._count(method, 'misses')
+        return False, None
+
+    def set(self, method: str, params: list, result):
+        self._track_head(method, result)
+        tier = self.tier(method, params, result)
+        if tier is None:
+            return
+        key = request_key(method, params)
+        frozen = self.freeze(result)
+        if tier == self.IMMUTABLE:
+            self.immutable.set(key, frozen, len(frozen))
+        else:
+            self.volatile.set(key, frozen, self.ttl[method])
+        self._count(method, 'stores')
+
+    def get_response(self, request: dict):
+        """命中时返回构造好的 jsonrpc 返回体, 未命中返回 None"""
+        hit, result = self.get(request['method'], request['params'])
+        if not hit:
+            return None
+        return {'jsonrpc': "2.0", 'id': request['id'], 'result': result}
+
+    def set_response(self, request: dict, response):
+        if isinstance(response, dict) and response.get('error') is None and 'result' in response:
+            self.set(request['method'], request['params'], response['result'])
+
+    def lookup(self, payload: list) -> tuple:
+        """
+        批量查询缓存
+        :return: (responses, misses) responses 中未命中的位置为 None, misses 为未命中的请求
+        """
+        responses = [self.get_response(request) for request in payload]
+        misses = [request for request, response in zip(payload, responses) if response is None]
+        return responses, misses
+
+    def store(self, misses: list, fetched: list, responses: list) -> list:
+        """缓存未命中请求的返回, 并按顺序填回 responses"""
+        for request, response in zip(misses, fetched):
+            self.set_response(request, response)
+        fetched = iter(fetched)
+        return [response if response is not None else next(fetched) for response in responses]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counter)
+            stats['methods'] = {k: dict(v) for k, v in self._method_counter.items()}
+        total = stats['hits'] + stats['misses']
+        stats['hitRatio'] = stats['hits'] / total if total else 0
+        stats['immutableItems'] = len(self.immutable)
+        stats['immutableBytes'] = self.immutable.bytes
+        stats['volatileItems'] = len(self.volatile)
+        stats['head'] = self.head
+        return stats
+
+    def clear(self):
+        self.immutable.clear()
+        self.volatile.clear()
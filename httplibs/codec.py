@@ -0,0 +1,53 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec(object):
+    """
+    标准库 json 编解码. 请求编码为 bytes, 返回体直接从 bytes 解码, 不经过中间的 str.
+    """
+    name = 'json'
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    def loads(self, data: bytes or str):
+        """解码失败抛出 ValueError(json.JSONDecodeError)"""
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    orjson 编解码, 比标准库快数倍.
+    orjson 不支持超过 64 位的整数: 编码时退回标准库; 解码时会转为 float.
+    以太坊 jsonrpc 的数值都是 hex 字符串, 不受影响, 节点返回大整数数字时请使用 JsonCodec.
+    """
+    name = 'orjson'
+
+    def dumps(self, obj) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, data: bytes or str):
+        return orjson.loads(data)
+
+
+def get_codec(name: str = None) -> JsonCodec:
+    """
+    :param name: 'orjson' or 'json', 默认为标准库; orjson 需要显式指定, 它会改变超过 64 位整数的解码结果
+    """
+    if name is None:
+        name = 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise ImportError("OrjsonCodec 依赖 orjson, 请先安装: pip install orjson")
+        return OrjsonCodec()
+    if name == 'json':
+        return JsonCodec()
+    raise ValueError('不支持的 json 编解码: {}'.format(name))
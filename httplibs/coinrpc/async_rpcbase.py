@@ -0,0 +1,232 @@
+from coin.coin_tools import BlockHeight
+from coin.contract_cache import ContractInfoCache
+from coin.resolver.eth_log_resolver import EthereumLogResolver
+from coin.resolver.eth_multicall import EthereumMulticall
+from coin.resolver.eth_resolver import EthereumResolver
+from digit import digit
+from exceptions import JsonRpcError
+from httplibs.async_jsonrpc import AsyncJsonRpcV2
+from httplibs.coinrpc.rpcbase import EthereumRpcBase
+from httplibs.coinrpc.scanner import AsyncBlockScanner, AsyncTransferScanner
+
+
+class AsyncEthereumRpcBase(EthereumRpcBase, AsyncJsonRpcV2):
+    """
+    EthereumRpcBase 的 asyncio 版本, 所有方法都需要 await.
+    只转发请求的方法(get_block_by_number, get_balance, get_transaction_by_hash, send_raw_transaction ...)
+    直接继承同步版本, 底层 _send_data 为协程, 所以返回值可直接 await;
+    需要对结果二次处理的方法在这里重写.
+    """
+
+    async def get_block_height(self):
+        sync_method = 'eth_syncing'
+        number_method = 'eth_blockNumber'
+        sync, number = await self._diff_post([sync_method, number_method], [None, None])
+        if sync:
+            block_height = BlockHeight(digit.hex_to_int(sync['currentBlock']),
+                                       digit.hex_to_int(sync['highestBlock']))
+        elif number:
+            block_height = BlockHeight(digit.hex_to_int(number), digit.hex_to_int(number))
+        else:
+            self.logger.error(
+                'get_block_height 请求, 两个方式均未获取到正常拿. sync: {} number: {}'.format(sync, number))
+            raise JsonRpcError(code=1,
+                               message='get_block_height 请求, 两个方式均未获取到正常拿. sync: {} number: {}'
+                               .format(sync, number))
+        return block_height
+
+    async def scan_blocks(self, start: int, end: int = None, detail=True, batch_size=None,
+                          window=None, address_index=None, lazy=False, match_sender=False) -> AsyncBlockScanner:
+        """
+        用法: async for block in await rpc.scan_blocks(start, end)
+        参数见 EthereumRpcBase.scan_blocks
+        """
+        if end is None:
+            end = (await self.get_block_height()).current_height
+        return AsyncBlockScanner(self, start, end, detail, batch_size, window, address_index, lazy, match_sender)
+
+    async def scan_token_transfers(self, start: int, end: int = None, contracts=None, receivers=None,
+                                   address_index=None, range_size=None, max_range_size=None,
+                                   max_receivers=None) -> AsyncTransferScanner:
+        """
+        用法: async for transfer in await rpc.scan_token_transfers(start, end, contracts=[usdt])
+        参数见 EthereumRpcBase.scan_token_transfers
+        """
+        if end is None:
+            end = (await self.get_block_height()).current_height
+        return AsyncTransferScanner(self, start, end, contracts, receivers, address_index, range_size,
+                                    max_range_size, max_receivers)
+
+    async def stream_blocks(self, start: int, end: int, detail=True, address_index=None, lazy=False,
+                            match_sender=False):
+        """
+        用法: async for block in rpc.stream_blocks(start, end)
+        参数见 EthereumRpcBase.stream_blocks
+        """
+        heights = [digit.int_to_hex(height) for height in range(start, end + 1)]
+        k = 0
+        async for block in self._many_post('eth_getBlockByNumber', self.get_params(heights, detail),
+                                           ignore_err=False, stream=True):
+            if not block:
+                raise JsonRpcError(code=1, message='区块 {} 未找到'.format(digit.hex_to_int(heights[k])))
+            k += 1
+            yield EthereumResolver.resolver_block(block, detail, address_index, lazy, match_sender)
+
+    async def get_token_transfers(self, tx_hash: str or list, contracts=None, address_index=None) -> list:
+        receipts = await self.get_transaction_receipt(tx_hash)
+        if not isinstance(tx_hash, (list, set, tuple)):
+            receipts = [receipts]
+        return EthereumLogResolver.resolver_receipts(receipts, contracts, address_index)
+
+    async def get_block_token_transfers(self, block_height: int or list, log_filter, address_index=None) -> list:
+        heights = block_height if isinstance(block_height, (list, tuple, range)) else [block_height]
+        blocks = await self._many_post('eth_getBlockByNumber',
+                                       self.get_params([digit.int_to_hex(height) for height in heights], False))
+        tx_hashes = [tx_hash for block in log_filter.filter_blocks(blocks) for tx_hash in block['transactions']]
+        if not tx_hashes:
+            return []
+        return await self.get_token_transfers(tx_hashes, log_filter.contracts or None, address_index)
+
+    async def open_wallet(self, passphrase, timeout=None, address=None) -> bool:
+        method = 'personal_unlockAccount'
+        result = await self._single_post(method, [address, passphrase, None])
+        if result:
+            return True
+        return False
+
+    async def send_transaction(self, sender: str, receiver: str, value: int, passphrase: str,
+                               gas: int = None,
+                               gas_price: int = None, fee: int = None,
+                               contract: str = None, comment: str = None, **kwargs):
+        method = 'personal_signAndSendTransaction'
+        if gas is None:
+            gas = 21000
+        if gas_price is None:
+            # 预言机只读快照, 过期时直接查询节点, 不在事件循环中同步刷新
+            if self.gas_oracle is not None:
+                gas_price = self.gas_oracle.cached()
+            if gas_price is None:
+                gas_price = digit.hex_to_int(await self.gas_price())
+        params = EthereumResolver.get_transfer_body(sender, receiver, int(gas), int(gas_price),
+                                                    value, contract)
+        manager = self.nonce_manager
+        signer = self.signer if self.signer is not None and sender in self.signer else None
+        if signer is not None:
+            method = 'eth_sendRawTransaction'
+            if manager is None:
+                params['nonce'] = await self.get_transaction_count(sender)
+                return await self._single_post(method, [signer.sign_transaction(params).raw], ignore_err=False)
+        elif manager is None:
+            payload = self.get_params(params, passphrase)
+            return await self._single_post(method, payload, ignore_err=False)
+        if manager.needs_sync(sender):
+            manager.sync(sender, digit.hex_to_int(await self.get_transaction_count(sender)))
+        with manager.nonce(sender) as nonce:
+            if signer is not None:
+                params['nonce'] = nonce
+                return await self._single_post(method, [signer.sign_transaction(params).raw], ignore_err=False)
+            params['nonce'] = digit.int_to_hex(nonce)
+            return await self._single_post(method, self.get_params(params, passphrase), ignore_err=False)
+
+    async def get_smart_fee(self, confirm_height="latest", contract=None):
+        oracle = self.gas_oracle
+        gas = oracle.cached_estimate(contract) if oracle is not None else None
+        if gas is not None:
+            return digit.int_to_hex(gas)
+        if contract is None:
+            return digit.int_to_hex(21000)
+        gas = await self._single_post('eth_estimateGas', EthereumResolver.get_transfer_body(contract=contract))
+        if oracle is not None and gas:
+            oracle.set_estimate(contract, digit.hex_to_int(gas))
+        return gas
+
+    async def new_address(self, passphrase, count=1):
+        method = 'personal_newAccount'
+        func = self.choice_post_func(count)
+        addresses = await func(method, [passphrase] if count <= 1 else [passphrase] * count)
+        self.logger.info('生成地址 {} 个, 结果为：{}'.format(count, addresses))
+        self._index_addresses(addresses)
+        return addresses
+
+    async def get_wallet_balance(self, contract=None, block_height='latest', *, exclude: list = None):
+        ledger = self.balance_ledger
+        if ledger is not None and block_height == 'latest' and not exclude and ledger.tracks(contract):
+            if not ledger.is_reconciled(contract):
+                asset, keys = ledger.to_asset(contract), ledger.reconcile_keys()
+                ledger.apply_reconcile(asset, keys, await self.get_balance(
+                    [ledger.to_address(key) for key in keys], asset) if keys else [])
+            for asset, keys in ledger.take_dirty().items():
+                balances = await self.get_balance([ledger.to_address(key) for key in keys], asset)
+                ledger.update(asset, keys, balances)
+            return ledger.total(contract)
+        if exclude is None:
+            exclude = set()
+        else:
+            exclude = set(exclude)
+        addresses = await self.personal_list_accounts()
+        if isinstance(addresses, list):
+            addresses = set(addresses)
+        else:
+            self.logger.warning(
+                "personal_listAccounts address list not is list, it's {}".format(addresses))
+            return 0
+        check_addresses = list((exclude ^ addresses) & addresses)
+        balance = 0
+        # 批量请求由 _many_post 按 max_batch_size 自动拆分并发发送
+        balances = await self.get_balance(check_addresses, contract, block_height) if check_addresses else []
+        for _ in balances:
+            if _:
+                balance += digit.hex_to_int(_)
+            else:
+                self.logger.error("地址获取余额错误： {}".format(_))
+        return balance
+
+    async def multicall(self, calls: list, block_height='latest') -> list:
+        chunks = EthereumMulticall.split(list(calls), self._multicall_size)
+        rsp = await self._many_post('eth_call', self.get_multicall_params(calls, block_height)) if chunks else []
+        results = []
+        for chunk, data in zip(chunks, rsp):
+            decoded = self._decode_multicall(chunk, data)
+            if decoded is None:
+                decoded = self._call_results(
+                    await self._many_post('eth_call', self.get_call_params(chunk, block_height)))
+            results.extend(decoded)
+        return results
+
+    async def call_many(self, calls: list, block_height='latest') -> list:
+        if self._multicall:
+            return await self.multicall(calls, block_height)
+        return self._call_results(await self._many_post('eth_call', self.get_call_params(calls, block_height)))
+
+    async def _multicall_balances(self, address: list, contract, block_height):
+        results = await self.multicall([EthereumMulticall.balance_call(contract, addr) for addr in address],
+                                       block_height)
+        return ['0x' + r.hex() if r is not None else None for r in results]
+
+    async def get_contract_info_many(self, contracts: list) -> list:
+        contracts = list(contracts)
+        infos, missing = self._lookup_contract_infos(contracts)
+        if missing:
+            calls = [call for contract in missing for call in EthereumMulticall.contract_info_calls(contract)]
+            infos.update(self._store_contract_infos(missing, await self.call_many(calls)))
+        return [infos.get(ContractInfoCache.to_key(contract)) for contract in contracts]
+
+    async def get_contract_info(self, contract) -> tuple:
+        if self._multicall or self._contract_cache is not None:
+            return (await self.get_contract_info_many([contract]))[0]
+        method = 'eth_call'
+        name = EthereumResolver.get_transfer_template(data=EthereumResolver.get_name_abi(),
+                                                      contract=contract)
+        symbol = EthereumResolver.get_transfer_template(data=EthereumResolver.get_symbol_abi(),
+                                                        contract=contract)
+        decimal = EthereumResolver.get_transfer_template(data=EthereumResolver.get_decimal_abi(),
+                                                         contract=contract)
+        total = EthereumResolver.get_transfer_template(data=EthereumResolver.get_total_abi(),
+                                                       contract=contract)
+        payload = self.get_params([name, symbol, decimal, total], "latest")
+        rsp = await self._many_post(method, payload)
+        # name, symbol, decimal, total
+        return (EthereumResolver.parse_abi_name(rsp[0]),
+                EthereumResolver.parse_abi_symbol(rsp[1]),
+                EthereumResolver.parse_abi_decimal(rsp[2]),
+                EthereumResolver.parse_abi_total(rsp[3]))
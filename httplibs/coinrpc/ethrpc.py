@@ -1,3 +1,4 @@
+from httplibs.coinrpc.async_rpcbase import AsyncEthereumRpcBase
 from httplibs.coinrpc.rpcbase import EthereumRpcBase
 
 
@@ -5,3 +6,7 @@ class EthereumRpc(EthereumRpcBase):
     """完成从父类获取方法即可使用"""
     pass
 
+
+class AsyncEthereumRpc(AsyncEthereumRpcBase):
+    """EthereumRpc 的 asyncio 版本, 方法均需 await"""
+    pass
@@ -0,0 +1,165 @@
+from collections import deque
+import json
+import os
+import threading
+
+from digit import digit
+from exceptions import SyncError
+
+
+class ChainEvent(object):
+    """
+    ChainFollower 产生的事件.
+    NEW: 新块(或回滚后重新发出的块), block 为 coin.coin_tools.Block
+    ROLLBACK: 该高度的块被分叉废弃, 需要回滚该块产生的数据, block 为 None
+    """
+    NEW = 'new'
+    ROLLBACK = 'rollback'
+
+    def __init__(self, type, height, hash, block=None):
+        self.type = type
+        self.height = height
+        self.hash = hash
+        self.block = block
+
+    def __str__(self):
+        return '{} {} {}'.format(self.type, self.height, self.hash)
+
+
+class ChainFollower(object):
+    """
+    跟随链高度增量扫块, 能识别分叉回滚.
+    保存最近 ring_size 个块的 (height, hash), 新块的 parentHash 与上一个块 hash 不一致时判定为分叉,
+    向前对比节点上的块 hash 找到分叉点, 只回滚分叉点之后的块(发出 ROLLBACK 事件), 再从分叉点重新扫块.
+    checkpoint 文件保存最近的 (height, hash), 重启后从断点继续, 不需要重新扫描.
+    用法:
+        follower = ChainFollower(rpc, '/var/tmp/eth.checkpoint', start=5000000)
+        for event in follower.follow():
+            if event.type == ChainEvent.NEW:
+                ...
+            else:
+                ...
+    """
+    _default_ring_size = 128
+    _default_poll_interval = 3
+    _default_max_blocks = 1000
+
+    def __init__(self, rpc, checkpoint: str = None, start: int = None, confirmations=0, detail=True,
+                 ring_size=None, batch_size=None, window=None, max_blocks=None, address_index=None,
+                 match_sender=False):
+        """
+        :param rpc: EthereumRpcBase
+        :param checkpoint: 断点文件路径, None 表示不持久化
+        :param start: 没有断点时的起始高度, 默认为当前高度
+        :param confirmations: 只跟随到 当前高度 - confirmations
+        :param detail: 是否获取并解析交易
+        :param ring_size: 保存最近多少个块用于识别分叉, 分叉深度超过该值时抛出 SyncError
+        :param max_blocks: 每次 poll 最多处理的块数
+        :param address_index: coin.address_index.AddressIndex, 只解析收款地址在其中的交易
+        :param match_sender: 发送地址在 address_index 中的交易同样解析, 配合 BalanceLedger 使用时需要设置
+        """
+        self.rpc = rpc
+        self.checkpoint = checkpoint
+        self.start = start
+        self.confirmations = confirmations
+        self.detail = detail
+        self.batch_size = batch_size
+        self.window = window
+        self.max_blocks = max_blocks or self._default_max_blocks
+        self.address_index = address_index
+        self.match_sender = match_sender
+        self.ring = deque(maxlen=ring_size or self._default_ring_size)
+        self.rollbacks = 0
+        self._stop = threading.Event()
+        self.load()
+
+    @property
+    def height(self):
+        """最近处理完成的高度"""
+        return self.ring[-1][0] if self.ring else None
+
+    def load(self):
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint) as f:
+            data = json.load(f)
+        self.ring.clear()
+        self.ring.extend((height, block_hash) for height, block_hash in data['ring'])
+        self.rpc.logger.info('从断点 {} 恢复, 高度: {}'.format(self.checkpoint, self.height))
+
+    def save(self):
+        if self.checkpoint is None:
+            return
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'height': self.height, 'ring': list(self.ring)}, f)
+        os.replace(tmp, self.checkpoint)
+
+    def find_fork(self) -> int:
+        """
+        对比 ring 与节点上的块 hash, 返回分叉点高度(双方一致的最高块)
+        """
+        ring = list(self.ring)
+        heights = [digit.int_to_hex(height) for height, _ in ring]
+        blocks = self.rpc.get_block_by_number(heights, False) if len(heights) > 1 else [
+            self.rpc.get_block_by_number(heights[0], False)]
+        for (height, block_hash), block in zip(reversed(ring), reversed(blocks)):
+            if block and block['hash'] == block_hash:
+                return height
+        raise SyncError('分叉深度超过 {} 个块, 无法找到分叉点, 最早记录高度: {}'.format(len(ring), ring[0][0]))
+
+    def rollback(self):
+        """
+        回滚到分叉点, 逐个发出被废弃块的 ROLLBACK 事件, 高度从高到低.
+        每个事件被消费后才从 ring 中移除并写入断点, 中途退出重启后会继续回滚.
+        """
+        fork_height = self.find_fork()
+        self.rollbacks += 1
+        self.rpc.logger.warning('检测到分叉, 分叉点: {}, 回滚 {} 个块'.format(
+            fork_height, self.height - fork_height))
+        while self.ring and self.ring[-1][0] > fork_height:
+            height, block_hash = self.ring[-1]
+            yield ChainEvent(ChainEvent.ROLLBACK, height, block_hash)
+            self.ring.pop()
+            self.save()
+
+    def poll(self):
+        """处理到当前可跟随的最高块为止(最多 max_blocks 个), 每个事件被消费后才更新断点"""
+        tip = self.rpc.get_block_height().current_height - self.confirmations
+        if self.height is None:
+            start = self.start if self.start is not None else tip
+        else:
+            start = self.height + 1
+        end = min(tip, start + self.max_blocks - 1)
+        if start > end:
+            return
+        for block in self.rpc.scan_blocks(start, end, self.detail, self.batch_size, self.window,
+                                          self.address_index, match_sender=self.match_sender):
+            if self.ring and (block.height != self.height + 1 or block.parent_hash != self.ring[-1][1]):
+                yield from self.rollback()
+                # 剩余的块属于旧的扫描范围, 从分叉点重新扫描
+                return
+            self.ring.append((block.height, block.hash))
+            yield ChainEvent(ChainEvent.NEW, block.height, block.hash, block)
+            self.save()
+
+    def follow(self, poll_interval=None):
+        """
+        持续跟随链高度, 调用 stop() 后退出.
+        事件被消费(请求下一个事件)后才写入断点, 中途退出时最后一个事件可能在重启后再次发出.
+        """
+        poll_interval = self._default_poll_interval if poll_interval is None else poll_interval
+        self._stop.clear()
+        while not self._stop.is_set():
+            count, rollbacks = 0, self.rollbacks
+            for event in self.poll():
+                if self._stop.is_set():
+                    return
+                count += 1
+                yield event
+            # 已追上最新高度且没有发生回滚时, 等待下一次轮询
+            if count < self.max_blocks and rollbacks == self.rollbacks:
+                self._stop.wait(poll_interval)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,176 @@
+from collections import deque
+import threading
+import time
+
+from coin.resolver.eth_resolver import EthereumResolver
+from digit import digit
+from exceptions import JsonRpcError
+
+
+class GasPriceOracle(object):
+    """
+    gas price 预言机, 后台线程定时刷新, send_transaction / get_smart_fee 直接读取 O(1) 的快照, 不再每次请求节点.
+    每次刷新只获取上次之后的新块, 对最近 blocks 个块的交易 gas price 取分位数得到 low/standard/fast 三档,
+    standard 与 fast 不低于节点 eth_gasPrice; 没有交易时三档都为 eth_gasPrice.
+    快照超过 max_age 秒时 get() 会先同步刷新, 保证读到的价格不会比 max_age 更旧.
+    eth_estimateGas 的结果按合约缓存 estimate_ttl 秒.
+    刷新与估算使用 rpc 的同步请求, rpc 必须是同步客户端; asyncio 客户端只通过 cached / cached_estimate 读取缓存,
+    不会在事件循环中发出阻塞请求.
+    用法:
+        oracle = GasPriceOracle(rpc).start()
+        rpc.gas_oracle = oracle
+        oracle.get(GasPriceOracle.FAST)
+    """
+    LOW = 'low'
+    STANDARD = 'standard'
+    FAST = 'fast'
+    ETH_TRANSFER_GAS = 21000
+    # 各档对应的分位数
+    _default_tiers = {LOW: 30, STANDARD: 60, FAST: 90}
+    _default_blocks = 20
+    _default_interval = 5
+    _default_max_age = 30
+    _default_estimate_ttl = 600
+
+    def __init__(self, rpc, blocks=None, interval=None, max_age=None, tiers=None, estimate_ttl=None):
+        """
+        :param rpc: EthereumRpcBase, 需要同步客户端, 后台线程使用
+        :param blocks: 统计最近多少个块, 默认 20
+        :param interval: 后台刷新间隔秒数, 默认 5
+        :param max_age: 快照最长有效秒数, 默认 30
+        :param tiers: {档位: 分位数}, 默认 low 30, standard 60, fast 90
+        :param estimate_ttl: eth_estimateGas 缓存秒数, 默认 600
+        """
+        self.rpc = rpc
+        self.blocks = blocks or self._default_blocks
+        self.interval = interval or self._default_interval
+        self.max_age = max_age or self._default_max_age
+        self.tiers = tiers or dict(self._default_tiers)
+        self.estimate_ttl = estimate_ttl or self._default_estimate_ttl
+        # 最近 blocks 个块的 (height, [gas price])
+        self._window = deque(maxlen=self.blocks)
+        # (更新时间, 高度, {档位: 价格})
+        self._snapshot = None
+        self._estimates = {}
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.refreshes = 0
+        self.errors = 0
+
+    @classmethod
+    def percentile(cls, values: list, percent) -> int:
+        """values 已排序, 最近秩法"""
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
+
+    def _fetch_blocks(self, height: int) -> list:
+        last = self._window[-1][0] if self._window else None
+        start = max(height - self.blocks + 1, 0 if last is None else last + 1)
+        if start > height:
+            return []
+        heights = [digit.int_to_hex(h) for h in range(start, height + 1)]
+        blocks = self.rpc.get_block_by_number(heights, True) if len(heights) > 1 else [
+            self.rpc.get_block_by_number(heights[0], True)]
+        result = []
+        for h, block in zip(range(start, height + 1), blocks):
+            if not block:
+                raise JsonRpcError(message='gas price 预言机获取区块 {} 失败'.format(h))
+            block = EthereumResolver.resolver_block(block, lazy=True)
+            result.append((h, [tx.gas_price for tx in block.transactions]))
+        return result
+
+    def refresh(self) -> dict:
+        """获取新块与 eth_gasPrice, 重新计算各档价格"""
+        with self._refresh_lock:
+            height, node_price = self.rpc._diff_post(['eth_blockNumber', 'eth_gasPrice'], [None, None])
+            if not height or not node_price:
+                raise JsonRpcError(message='gas price 预言机获取高度与 eth_gasPrice 失败: {} {}'.format(
+                    height, node_price))
+            height, node_price = digit.hex_to_int(height), digit.hex_to_int(node_price)
+            if self._window and height < self._window[-1][0]:
+                # 回滚或切换到落后的节点, 重新统计
+                self._window.clear()
+            self._window.extend(self._fetch_blocks(height))
+            prices = sorted(p for _, block_prices in self._window for p in block_prices)
+            tiers = {}
+            for tier, percent in sorted(self.tiers.items(), key=lambda item: item[1]):
+                price = self.percentile(prices, percent) if prices else node_price
+                if tier != self.LOW:
+                    price = max(price, node_price)
+                # 高档位不低于低档位
+                tiers[tier] = max([price] + list(tiers.values()))
+            self._snapshot = (time.monotonic(), height, tiers)
+            self.refreshes += 1
+            return tiers
+
+    def cached(self, tier=STANDARD) -> int or None:
+        """只读取快照, 不请求节点, 快照不存在或超过 max_age 时返回 None"""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot[0] > self.max_age:
+            return None
+        return snapshot[2][tier]
+
+    def get(self, tier=STANDARD) -> int:
+        """当前档位价格(wei), 快照过期时同步刷新"""
+        price = self.cached(tier)
+        return self.refresh()[tier] if price is None else price
+
+    def cached_estimate(self, contract: str = None) -> int or None:
+        """只读取 eth_estimateGas 缓存, 不请求节点, 没有缓存或超过 estimate_ttl 时返回 None"""
+        if contract is None:
+            return self.ETH_TRANSFER_GAS
+        item = self._estimates.get(digit.add_0x(contract).lower())
+        if item is not None and time.monotonic() - item[0] <= self.estimate_ttl:
+            return item[1]
+        return None
+
+    def set_estimate(self, contract: str, gas: int):
+        """写入 eth_estimateGas 缓存, asyncio 客户端自己查询后调用"""
+        self._estimates[digit.add_0x(contract).lower()] = (time.monotonic(), gas)
+
+    def estimate_gas(self, contract: str = None) -> int:
+        """转账的 eth_estimateGas, 按合约缓存, ETH 转账固定 21000"""
+        gas = self.cached_estimate(contract)
+        if gas is not None:
+            return gas
+        item = self._estimates.get(digit.add_0x(contract).lower())
+        gas = self.rpc._single_post('eth_estimateGas', EthereumResolver.get_transfer_body(contract=contract))
+        if not gas:
+            if item is not None:
+                self.rpc.logger.warning('{} eth_estimateGas 失败, 使用缓存的结果'.format(contract))
+                return item[1]
+            raise JsonRpcError(message='{} eth_estimateGas 失败'.format(contract))
+        gas = digit.hex_to_int(gas)
+        self.set_estimate(contract, gas)
+        return gas
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.errors += 1
+                self.rpc.logger.error('gas price 预言机刷新异常: {}'.format(e))
+
+    def start(self):
+        """立即刷新一次并启动后台线程"""
+        if self._thread is None:
+            self.refresh()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='gas-price-oracle', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {'height': snapshot[1] if snapshot else None,
+                'age': time.monotonic() - snapshot[0] if snapshot else None,
+                'prices': dict(snapshot[2]) if snapshot else None,
+                'refreshes': self.refreshes, 'errors': self.errors, 'estimates': len(self._estimates)}
@@ -0,0 +1,234 @@
+import asyncio
+from contextlib import contextmanager
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from digit import digit
+from exceptions import JsonRpcError
+
+
+class NonceManager(object):
+    """
+    本地 nonce 分配, 同一地址可以多线程、多进程并发发送交易, 不再依赖节点串行选择 nonce.
+    每个地址一个状态文件, 分配时 线程锁 + fcntl 文件锁(与 lock.ProcessLock 相同) 内读改写, 多进程共享同一个目录即可.
+    状态:
+        next: 下一个新 nonce
+        free: 发送失败归还的 nonce, 优先分配最小的, 填补空缺
+        leases: 已分配还未确认发送结果的 nonce, 超过 lease_timeout 视为进程异常退出, 归还
+        marks: 每次校准时的 (时间, next), 用于判断哪些 nonce 已经分配超过 lease_timeout
+        refilled: 从 free 重新分配的 nonce 与分配时间, lease_timeout 内同样不参与空缺检测
+    sync() 用 eth_getTransactionCount(pending) 校准: 链上已使用的 nonce 丢弃, 外部发送的交易推进 next,
+    pending 计数停在第一个缺失的 nonce, 之后的 nonce 可能仍在节点队列中, 所以只有链上 pending nonce 本身
+    分配超过 lease_timeout 且不在在途时视为空缺(交易被丢弃), 加入 free 重新分配, 之后的 nonce 等它上链后再检测;
+    刚发送的 nonce 节点 pending 计数可能还没更新, 不参与空缺检测.
+    用法:
+        rpc.nonce_manager = NonceManager(rpc, '/var/tmp/nonce')
+        rpc.send_transaction(...)   # 自动分配 nonce, 节点明确拒绝时归还, 超时等结果未知时不归还
+        with manager.nonce(address) as nonce:
+            rpc.send_raw_transaction(sign(tx, nonce))
+    """
+    _default_lease_timeout = 120
+    _default_sync_interval = 30
+    # 节点返回这些错误时 nonce 已被占用, 不能归还
+    _used_errors = ('nonce too low', 'already known', 'known transaction', 'replacement transaction underpriced')
+    # JsonRpcV1 把超时、连接断开等网络错误转为 code 0, 此时无法确定节点是否已收到交易
+    _ambiguous_code = 0
+
+    def __init__(self, rpc=None, path='/var/tmp/nonce', lease_timeout=None, sync_interval=None):
+        """
+        :param rpc: EthereumRpcBase, 用于 eth_getTransactionCount; asyncio 客户端需要自己调用 sync(address, count)
+        :param path: 状态文件目录
+        :param lease_timeout: 分配后多少秒没有 commit/release 视为丢失, 默认 120
+        :param sync_interval: 每个地址距离上次校准超过多少秒时, allocate 前自动校准, 默认 30, 0 为只在首次使用时校准
+        """
+        self.rpc = rpc
+        self.path = path
+        self.lease_timeout = lease_timeout or self._default_lease_timeout
+        self.sync_interval = sync_interval if sync_interval is not None else self._default_sync_interval
+        self.logger = rpc.logger if rpc is not None else logging
+        os.makedirs(path, exist_ok=True)
+        self._files = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def to_key(cls, address: str) -> str:
+        return digit.add_0x(address).lower()
+
+    def _get_file(self, key: str) -> tuple:
+        with self._lock:
+            if key not in self._files:
+                fn = os.path.join(self.path, '{}.nonce'.format(key))
+                fd = os.open(fn, os.O_RDWR | os.O_CREAT, 0o644)
+                self._files[key] = open(fd, 'r+b')
+                self._locks[key] = threading.Lock()
+            return self._files[key], self._locks[key]
+
+    @classmethod
+    def new_state(cls) -> dict:
+        return {'next': None, 'free': [], 'leases': {}, 'marks': [], 'refilled': {}, 'synced': 0}
+
+    @contextmanager
+    def _state(self, address: str):
+        """线程锁 + 文件锁内读取状态, 退出时写回"""
+        f, lock = self._get_file(self.to_key(address))
+        with lock:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                data = f.read()
+                state = json.loads(data) if data else self.new_state()
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state, separators=(',', ':')).encode())
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_state(self, address: str) -> dict:
+        with self._state(address) as state:
+            return dict(state)
+
+    def needs_sync(self, address: str) -> bool:
+        with self._state(address) as state:
+            return self._needs_sync(state)
+
+    def _needs_sync(self, state: dict) -> bool:
+        return state['next'] is None or (self.sync_interval and time.time() - state['synced'] > self.sync_interval)
+
+    def _chain_nonce(self, address: str) -> int:
+        count = self.rpc.get_transaction_count(address, 'pending')
+        if not count:
+            raise ValueError('获取 {} 的 nonce 失败: {}'.format(address, count))
+        return digit.hex_to_int(count)
+
+    def _sync(self, address: str, state: dict, chain_nonce: int):
+        now = time.time()
+        leases = {int(n): t for n, t in state['leases'].items()}
+        refilled = {int(n): t for n, t in state['refilled'].items() if int(n) >= chain_nonce and
+                    now - t < self.lease_timeout}
+        free = {n for n in state['free'] if n >= chain_nonce}
+        for nonce, t in list(leases.items()):
+            if nonce < chain_nonce:
+                del leases[nonce]
+            elif now - t > self.lease_timeout:
+                # 分配后进程异常退出, 没有发送结果
+                del leases[nonce]
+                free.add(nonce)
+        local = state['next'] if state['next'] is not None else chain_nonce
+        if chain_nonce > local:
+            self.logger.info('{} 链上 nonce {} 大于本地 {}, 可能有外部发送的交易'.format(address, chain_nonce, local))
+        # 超过 lease_timeout 之前的 next, 之前分配的 nonce 应该已经在节点的 pending 中
+        old = [mark for mark in state['marks'] if now - mark[0] >= self.lease_timeout]
+        settled = min(old[-1][1], local) if old else chain_nonce
+        # 只能确定第一个缺失的 nonce, 后面的交易可能在节点队列中等待, 重新分配会被替换或报 underpriced
+        gaps = [n for n in range(chain_nonce, min(chain_nonce + 1, settled))
+                if n not in leases and n not in free and n not in refilled]
+        if gaps:
+            self.logger.warning('{} nonce 空缺 {}, 重新分配'.format(address, gaps))
+            free.update(gaps)
+        state['next'] = max(local, chain_nonce)
+        state['free'] = sorted(free)
+        state['leases'] = {str(n): t for n, t in leases.items()}
+        state['refilled'] = {str(n): t for n, t in refilled.items()}
+        state['marks'] = old[-1:] + [mark for mark in state['marks'] if now - mark[0] < self.lease_timeout] + [
+            [now, state['next']]]
+        state['synced'] = now
+        return gaps
+
+    def sync(self, address: str, chain_nonce: int = None) -> list:
+        """
+        用链上 pending nonce 校准
+        :param chain_nonce: eth_getTransactionCount(address, 'pending'), None 时通过 rpc 查询
+        :return: 发现的空缺 nonce
+        """
+        if chain_nonce is None:
+            chain_nonce = self._chain_nonce(address)
+        with self._state(address) as state:
+            return self._sync(address, state, chain_nonce)
+
+    def _allocate(self, address: str, state: dict) -> int:
+        if state['next'] is None:
+            raise ValueError('{} 的 nonce 还没有校准, 请先调用 sync(address, chain_nonce)'.format(address))
+        if state['free']:
+            nonce = state['free'].pop(0)
+            state['refilled'][str(nonce)] = time.time()
+        else:
+            nonce = state['next']
+            state['next'] += 1
+        state['leases'][str(nonce)] = time.time()
+        return nonce
+
+    def allocate(self, address: str) -> int:
+        """分配一个 nonce, 优先复用空缺; 需要校准时先查询链上 nonce, 查询在文件锁外进行"""
+        with self._state(address) as state:
+            if self.rpc is None or not self._needs_sync(state):
+                return self._allocate(address, state)
+        self.sync(address)
+        with self._state(address) as state:
+            return self._allocate(address, state)
+
+    def commit(self, address: str, nonce: int):
+        """交易已发送"""
+        with self._state(address) as state:
+            state['leases'].pop(str(nonce), None)
+
+    def release(self, address: str, nonce: int):
+        """交易没有发送成功, 归还 nonce. 归还的是最后一个时直接回退 next, 否则留作空缺优先分配"""
+        with self._state(address) as state:
+            state['leases'].pop(str(nonce), None)
+            free = set(state['free'])
+            free.add(nonce)
+            while state['next'] - 1 in free and str(state['next'] - 1) not in state['leases']:
+                state['next'] -= 1
+                free.discard(state['next'])
+            state['free'] = sorted(free)
+
+    def is_used_error(self, error: Exception) -> bool:
+        message = str(error).lower()
+        return any(keyword in message for keyword in self._used_errors)
+
+    @classmethod
+    def is_ambiguous_error(cls, error: BaseException) -> bool:
+        """超时、连接断开、协程被取消等错误, 交易可能已经到达节点"""
+        if isinstance(error, JsonRpcError):
+            return error.code == cls._ambiguous_code
+        return isinstance(error, (OSError, asyncio.TimeoutError, asyncio.CancelledError))
+
+    def consume(self, address: str, nonce: int):
+        """
+        nonce 已被其他交易占用(如外部发送)或不确定是否已发送, 不再分配, 下次分配前重新校准.
+        交易实际没有到达节点时, 超过 lease_timeout 后由 sync 的空缺检测重新分配
+        """
+        with self._state(address) as state:
+            state['leases'].pop(str(nonce), None)
+            state['synced'] = 0
+        self.logger.warning('{} nonce {} 已被占用或发送结果未知, 重新校准'.format(address, nonce))
+
+    @contextmanager
+    def nonce(self, address: str):
+        """
+        with 块内正常结束为 commit; 抛出异常为 release.
+        节点报 nonce 已被占用, 或网络错误无法确定节点是否收到交易时不归还, 避免同一个 nonce 再次分配
+        """
+        nonce = self.allocate(address)
+        try:
+            yield nonce
+        except BaseException as e:
+            if self.is_used_error(e) or self.is_ambiguous_error(e):
+                self.consume(address, nonce)
+            else:
+                self.release(address, nonce)
+            raise
+        self.commit(address, nonce)
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
@@ -1,10 +1,15 @@
 from abc import ABCMeta, abstractmethod
 
 from coin.coin_tools import BlockHeight
+from coin.contract_cache import ContractInfoCache
+from coin.resolver.eth_log_resolver import EthereumLogResolver
+from coin.resolver.eth_multicall import EthereumMulticall
 from coin.resolver.eth_resolver import EthereumResolver
 from digit import digit
 from exceptions import JsonRpcError
+from httplibs.coinrpc.scanner import BlockScanner, TransferScanner
 from httplibs.jsonrpc import JsonRpcV2
+from httplibs.template import RequestTemplate
 
 
 class RpcBase(metaclass=ABCMeta):
@@ -68,6 +73,39 @@ class RpcBase(metaclass=ABCMeta):
 
 
 class EthereumRpcBase(RpcBase, JsonRpcV2):
+    _balance_template = RequestTemplate('eth_getBalance', [RequestTemplate.slot('address'),
+                                                           RequestTemplate.slot('block_height')])
+    _token_balance_template = RequestTemplate('eth_call', [
+        dict(EthereumResolver.get_balance_body(EthereumResolver.ZERO_ADDRESS, EthereumResolver.ZERO_ADDRESS),
+             to=RequestTemplate.slot('contract'),
+             data=EthereumResolver.GET_BALANCE_ABI + RequestTemplate.slot('address')),
+        RequestTemplate.slot('block_height')])
+    _default_multicall_size = 1000
+
+    def __init__(self, host, **kwargs):
+        """
+        :param address_index: coin.address_index.AddressIndex, 钱包地址索引, new_address 生成的地址会自动加入
+        :param balance_ledger: coin.balance_ledger.BalanceLedger, 设置后 get_wallet_balance 从账本读取总额
+        :param multicall: 聚合合约地址, True 为 Multicall3 的默认地址, 设置后代币余额与合约资料通过聚合合约查询
+        :param multicall_size: 每个聚合 eth_call 包含的调用数, 默认 1000
+        :param contract_cache: coin.contract_cache.ContractInfoCache, 合约资料缓存
+        :param nonce_manager: httplibs.coinrpc.nonce_manager.NonceManager, 设置后 send_transaction 使用本地分配的 nonce
+        :param gas_oracle: httplibs.coinrpc.gas_oracle.GasPriceOracle, 设置后 send_transaction 与 get_smart_fee
+            从预言机读取 gas price 与 eth_estimateGas, 不再每次请求节点
+        :param signer: sign.eth_signer.EthereumSigner, 发送地址的私钥在其中时 send_transaction 本地签名后
+            eth_sendRawTransaction 发送, 不再使用 personal_signAndSendTransaction
+        """
+        super().__init__(host, **kwargs)
+        self.address_index = kwargs.get('address_index')
+        self.balance_ledger = kwargs.get('balance_ledger')
+        multicall = kwargs.get('multicall')
+        self._multicall = EthereumMulticall.ADDRESS if multicall is True else multicall
+        self._multicall_size = kwargs.get('multicall_size', self._default_multicall_size)
+        self._contract_cache = kwargs.get('contract_cache')
+        self.nonce_manager = kwargs.get('nonce_manager')
+        self.gas_oracle = kwargs.get('gas_oracle')
+        self.signer = kwargs.get('signer')
+
     def get_block_height(self):
         sync_method = 'eth_syncing'
         number_method = 'eth_blockNumber'
@@ -101,6 +139,72 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         func = self.choice_post_func(block_height)
         return func(method, params=self.get_params(block_height, details))
 
+    def scan_blocks(self, start: int, end: int = None, detail=True, batch_size=None, window=None,
+                    address_index=None, lazy=False, match_sender=False) -> BlockScanner:
+        """
+        按高度顺序遍历区块, 返回可迭代的 BlockScanner, 迭代得到 coin.coin_tools.Block
+        :param start: 起始高度
+        :param end: 结束高度(包含), 默认为当前高度
+        :param detail: 是否获取并解析交易
+        :param batch_size: 每个批量请求的块数
+        :param window: 同时在途的批量请求数
+        :param address_index: coin.address_index.AddressIndex, 只解析收款地址在其中的交易
+        :param lazy: 交易解析为 LazyTx, 字段在访问时才解码
+        :param match_sender: 发送地址在 address_index 中的交易同样解析
+        :return: BlockScanner, 扫描速度见 scanner.stats
+        """
+        if end is None:
+            end = self.get_block_height().current_height
+        return BlockScanner(self, start, end, detail, batch_size, window, address_index, lazy, match_sender)
+
+    def stream_blocks(self, start: int, end: int, detail=True, address_index=None, lazy=False, match_sender=False):
+        """
+        流式获取 [start, end] 的区块, 边接收边解析, 每解析完一个块立即产出 Block, 内存只占用约一个块.
+        适合单个批量返回很大(如上千个带交易详情的块)的场景, 批量大小由 max_batch_size 控制.
+        :param start: 起始高度
+        :param end: 结束高度(包含)
+        :param detail: 是否获取并解析交易
+        :param address_index: coin.address_index.AddressIndex, 只解析收款地址在其中的交易
+        :param lazy: 交易解析为 LazyTx
+        :param match_sender: 发送地址在 address_index 中的交易同样解析
+        """
+        heights = [digit.int_to_hex(height) for height in range(start, end + 1)]
+        blocks = self._many_post('eth_getBlockByNumber', self.get_params(heights, detail), ignore_err=False,
+                                 stream=True)
+        for height, block in zip(heights, blocks):
+            if not block:
+                raise JsonRpcError(code=1, message='区块 {} 未找到'.format(digit.hex_to_int(height)))
+            yield EthereumResolver.resolver_block(block, detail, address_index, lazy, match_sender)
+
+    def get_logs(self, log_filter: dict or list):
+        """
+        eth_getLogs, 传入 list 时批量请求
+        :param log_filter: {"fromBlock": hex, "toBlock": hex, "address": [...], "topics": [...]}
+        """
+        method = 'eth_getLogs'
+        func = self.choice_post_func(log_filter)
+        return func(method, self.get_params(log_filter))
+
+    def scan_token_transfers(self, start: int, end: int = None, contracts=None, receivers=None, address_index=None,
+                             range_size=None, max_range_size=None, max_receivers=None) -> TransferScanner:
+        """
+        用 eth_getLogs 按块范围扫描代币转账, 返回可迭代的 TransferScanner, 迭代得到 TokenTransfer,
+        比逐笔获取交易与收据少得多的请求. 块范围按节点的限制自动缩小/放大.
+        :param start: 起始高度
+        :param end: 结束高度(包含), 默认为当前高度
+        :param contracts: 代币合约地址, None 表示所有合约
+        :param receivers: 收款地址, 由节点按 topics 过滤
+        :param address_index: coin.address_index.AddressIndex, 本地按收款地址过滤
+        :param range_size: 初始块范围
+        :param max_range_size: 最大块范围
+        :param max_receivers: 每个请求的收款地址数量上限
+        :return: TransferScanner, 统计见 scanner.stats
+        """
+        if end is None:
+            end = self.get_block_height().current_height
+        return TransferScanner(self, start, end, contracts, receivers, address_index, range_size, max_range_size,
+                               max_receivers)
+
     def get_transaction_by_hash(self, tx_hash, details=True):
         """
         details 表示是否获取收据, 可以一次获取很多个, 但如果结果会是 [tx, tx, tx, receipt, receipt, receipt ...]
@@ -128,6 +232,36 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         method = 'eth_getTransactionReceipt'
         return func(method, self.get_params(tx_hash))
 
+    def get_token_transfers(self, tx_hash: str or list, contracts=None, address_index=None) -> list:
+        """
+        批量获取收据并解析其中的 Transfer 日志, 能找到 transferFrom、router、多签等 input 中看不到的代币转账
+        :param tx_hash: 一个或多个交易 hash
+        :param contracts: 只保留这些合约的转账, 小写地址集合
+        :param address_index: coin.address_index.AddressIndex, 只保留收款地址在其中的转账
+        :return: [TokenTransfer, ...]
+        """
+        receipts = self.get_transaction_receipt(tx_hash)
+        if not isinstance(tx_hash, (list, set, tuple)):
+            receipts = [receipts]
+        return EthereumLogResolver.resolver_receipts(receipts, contracts, address_index)
+
+    def get_block_token_transfers(self, block_height: int or list, log_filter, address_index=None) -> list:
+        """
+        获取块头(不含交易详情), logsBloom 不可能匹配的块直接跳过, 只为通过的块批量获取收据并解析 Transfer 日志.
+        跳过比例见 log_filter.stats()
+        :param block_height: 一个或多个块高度
+        :param log_filter: coin.logs_bloom.LogsBloomFilter
+        :param address_index: coin.address_index.AddressIndex, 只保留收款地址在其中的转账
+        :return: [TokenTransfer, ...]
+        """
+        heights = block_height if isinstance(block_height, (list, tuple, range)) else [block_height]
+        blocks = self._many_post('eth_getBlockByNumber',
+                                 self.get_params([digit.int_to_hex(height) for height in heights], False))
+        tx_hashes = [tx_hash for block in log_filter.filter_blocks(blocks) for tx_hash in block['transactions']]
+        if not tx_hashes:
+            return []
+        return self.get_token_transfers(tx_hashes, log_filter.contracts or None, address_index)
+
     def get_transactions(self, count, offset=True):
         """
         这个方法是为了兼容比特币的, 所以这个方法在 eth 中 count 改为 tx_hash, offset 改为 details
@@ -158,22 +292,109 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         if gas is None:
             gas = 21000
         if gas_price is None:
-            gas_price = digit.hex_to_int(self.gas_price())
+            gas_price = self.gas_oracle.get() if self.gas_oracle is not None else digit.hex_to_int(self.gas_price())
         params = EthereumResolver.get_transfer_body(sender, receiver, int(gas), int(gas_price),
                                                     value, contract)
-        payload = self.get_params(params, passphrase)
-        return self._single_post(method, payload, ignore_err=False)
+        if self.signer is not None and sender in self.signer:
+            # 本地签名, 不需要解锁节点账户
+            method = 'eth_sendRawTransaction'
+            if self.nonce_manager is None:
+                params['nonce'] = self.get_transaction_count(sender)
+                return self._single_post(method, [self.signer.sign_transaction(params).raw], ignore_err=False)
+            with self.nonce_manager.nonce(sender) as nonce:
+                params['nonce'] = nonce
+                return self._single_post(method, [self.signer.sign_transaction(params).raw], ignore_err=False)
+        if self.nonce_manager is None:
+            payload = self.get_params(params, passphrase)
+            return self._single_post(method, payload, ignore_err=False)
+        # 本地分配 nonce, 发送失败时归还
+        with self.nonce_manager.nonce(sender) as nonce:
+            params['nonce'] = digit.int_to_hex(nonce)
+            return self._single_post(method, self.get_params(params, passphrase), ignore_err=False)
+
+    def get_transaction_count(self, address: str or list, block_height='pending'):
+        method = 'eth_getTransactionCount'
+        func = self.choice_post_func(address)
+        return func(method, self.get_params(address, block_height))
 
     def new_address(self, passphrase, count=1):
         method = 'personal_newAccount'
         func = self.choice_post_func(count)
         addresses = func(method, [passphrase] if count <= 1 else [passphrase] * count)
         self.logger.info('生成地址 {} 个, 结果为：{}'.format(count, addresses))
+        self._index_addresses(addresses)
         return addresses
 
+    def _index_addresses(self, addresses):
+        if self.address_index is None or not addresses:
+            return
+        self.address_index.update(a for a in ([addresses] if isinstance(addresses, str) else addresses) if a)
+
+    def get_multicall_params(self, calls: list, block_height='latest') -> list:
+        """每 multicall_size 个调用打包为一个聚合 eth_call 的参数"""
+        return [[{'to': self._multicall, 'data': EthereumMulticall.encode_calls(chunk)}, block_height]
+                for chunk in EthereumMulticall.split(calls, self._multicall_size)]
+
+    def get_call_params(self, calls: list, block_height='latest') -> list:
+        return [[{'to': target, 'data': data}, block_height] for target, data in calls]
+
+    @classmethod
+    def _call_results(cls, rsp: list) -> list:
+        return [bytes.fromhex(digit.del_0x(r)) if r else None for r in rsp]
+
+    def _decode_multicall(self, chunk: list, data) -> list or None:
+        if data:
+            try:
+                return EthereumMulticall.decode_results(data)
+            except ValueError as e:
+                self.logger.warning('multicall 返回数据解码失败: {}'.format(e))
+        self.logger.warning('multicall 聚合调用失败, 逐个调用 {} 个: {}'.format(len(chunk), data))
+        return None
+
+    def multicall(self, calls: list, block_height='latest') -> list:
+        """
+        通过聚合合约批量执行只读调用, 所有聚合 eth_call 在一个批量请求中发送.
+        聚合调用失败(如节点没有部署聚合合约)时, 该部分退回为逐个 eth_call.
+        :param calls: [(合约地址, hex 调用数据)]
+        :return: [bytes or None], 与 calls 一一对应, 调用失败为 None
+        """
+        chunks = EthereumMulticall.split(list(calls), self._multicall_size)
+        rsp = self._many_post('eth_call', self.get_multicall_params(calls, block_height)) if chunks else []
+        results = []
+        for chunk, data in zip(chunks, rsp):
+            decoded = self._decode_multicall(chunk, data)
+            if decoded is None:
+                decoded = self._call_results(self._many_post('eth_call', self.get_call_params(chunk, block_height)))
+            results.extend(decoded)
+        return results
+
+    def call_many(self, calls: list, block_height='latest') -> list:
+        """
+        批量只读调用, 设置 multicall 时通过聚合合约, 否则为一个批量 eth_call 请求
+        :param calls: [(合约地址, hex 调用数据)]
+        :return: [bytes or None]
+        """
+        if self._multicall:
+            return self.multicall(calls, block_height)
+        return self._call_results(self._many_post('eth_call', self.get_call_params(calls, block_height)))
+
+    def _multicall_balances(self, address: list, contract, block_height):
+        results = self.multicall([EthereumMulticall.balance_call(contract, addr) for addr in address], block_height)
+        return ['0x' + r.hex() if r is not None else None for r in results]
+
     def get_balance(self, address, contract=None, block_height='latest'):
         eth_method = 'eth_getBalance'
         contract_method = 'eth_call'
+        if isinstance(address, (list, tuple, set)) and contract is not None and self._multicall:
+            # 代币余额通过聚合合约查询, 一个 eth_call 包含 multicall_size 个 balanceOf
+            return self._multicall_balances(list(address), contract, block_height)
+        if isinstance(address, (list, tuple, set)) and self._cache is None and self._single_flight is None:
+            # 批量查询使用预编码模板, 只写入地址与 id
+            if contract is None:
+                return self._template_post(self._balance_template, address, block_height=block_height)
+            return self._template_post(self._token_balance_template,
+                                       [EthereumResolver.get_address(addr, contract) for addr in address],
+                                       contract=EthereumResolver.get_address(contract), block_height=block_height)
         func = self.choice_post_func(address)
         if contract is None:
             method = eth_method
@@ -194,6 +415,13 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         return self._single_post(method)
 
     def get_wallet_balance(self, contract=None, block_height='latest', *, exclude: list = None):
+        ledger = self.balance_ledger
+        if ledger is not None and block_height == 'latest' and not exclude and ledger.tracks(contract):
+            # 第一次使用前全量对账, 之后只刷新新块涉及的地址, 总额由账本增量维护
+            if not ledger.is_reconciled(contract):
+                ledger.reconcile(self, contract)
+            ledger.refresh(self)
+            return ledger.total(contract)
         if exclude is None:
             exclude = set()
         else:
@@ -207,19 +435,19 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
             return 0
         check_addresses = list((exclude ^ addresses) & addresses)
         balance = 0
-        offset = 100
-        for s in range(0, len(check_addresses), offset):
-            batch_address = check_addresses[s:s + offset]
-            balances = self.get_balance(batch_address, contract, block_height)
-            for _ in balances:
-                if _:
-                    balance += digit.hex_to_int(_)
-                else:
-                    self.logger.error("地址获取余额错误： {}".format(_))
+        # 批量请求由 _many_post 按 max_batch_size 自动拆分并发发送
+        balances = self.get_balance(check_addresses, contract, block_height) if check_addresses else []
+        for _ in balances:
+            if _:
+                balance += digit.hex_to_int(_)
+            else:
+                self.logger.error("地址获取余额错误： {}".format(_))
         return balance
 
     def get_smart_fee(self, confirm_height="latest", contract=None):
         method = 'eth_estimateGas'
+        if self.gas_oracle is not None:
+            return digit.int_to_hex(self.gas_oracle.estimate_gas(contract))
         if contract is None:
             return digit.int_to_hex(21000)
         payload = EthereumResolver.get_transfer_body(contract=contract)
@@ -233,6 +461,27 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         func = self.choice_post_func(raw)
         return func(method, self.get_params(raw))
 
+    def send_raw_transactions(self, raws: list) -> list:
+        """
+        批量发送原始交易, 每笔单独返回结果, 一笔失败不影响其他
+        :return: [(tx_hash, None) 或 (None, JsonRpcError)], 与 raws 一一对应
+        """
+        payload = [{'jsonrpc': "2.0", "id": next(self.get_id()), 'method': 'eth_sendRawTransaction',
+                    "params": [raw]} for raw in raws]
+        return self._send_batch(payload, self._raw_transaction_results)
+
+    @classmethod
+    def _raw_transaction_results(cls, data: list) -> list:
+        results = []
+        for d in data:
+            err = d.get('error')
+            if err or not d.get('result'):
+                err = err or {}
+                results.append((None, JsonRpcError(code=err.get('code', -32603), message=err.get('message', ''))))
+            else:
+                results.append((d['result'], None))
+        return results
+
     # def eth_call(self, sender: str, receiver: str, value: int, passphrase: str, gas: int = None,
     #              gas_price: int = None, fee: int = None,
     #              contract: str = None, comment: str = None, **kwargs):
@@ -246,6 +495,8 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         :param contract:
         :return: (str name, str, symbol, int decimal, int total)
         """
+        if self._multicall or self._contract_cache is not None:
+            return self.get_contract_info_many([contract])[0]
         method = 'eth_call'
         name = EthereumResolver.get_transfer_template(data=EthereumResolver.get_name_abi(),
                                                       contract=contract)
@@ -259,9 +510,41 @@ class EthereumRpcBase(RpcBase, JsonRpcV2):
         rsp = self._many_post(method, payload)
         # name, symbol, decimal, total
         return (EthereumResolver.parse_abi_name(rsp[0]),
-                EthereumResolver.parse_abi_name(rsp[1]),
-                EthereumResolver.parse_abi_name(rsp[2]),
-                EthereumResolver.parse_abi_name(rsp[3]))
+                EthereumResolver.parse_abi_symbol(rsp[1]),
+                EthereumResolver.parse_abi_decimal(rsp[2]),
+                EthereumResolver.parse_abi_total(rsp[3]))
+
+    def _lookup_contract_infos(self, contracts) -> tuple:
+        if self._contract_cache is None:
+            return {}, list(dict.fromkeys(ContractInfoCache.to_key(contract) for contract in contracts))
+        return self._contract_cache.lookup(contracts)
+
+    def _store_contract_infos(self, contracts: list, results: list) -> dict:
+        """解析合约资料并写入缓存, decimals 查询失败的合约不缓存"""
+        infos = {}
+        for i, contract in enumerate(contracts):
+            info = EthereumMulticall.decode_contract_info(results[i * 4:i * 4 + 4])
+            if info[2] is None:
+                self.logger.warning('获取合约资料失败: {} {}'.format(contract, info))
+                continue
+            infos[contract] = info
+            if self._contract_cache is not None:
+                self._contract_cache.set(contract, info)
+        if self._contract_cache is not None:
+            self._contract_cache.save()
+        return infos
+
+    def get_contract_info_many(self, contracts: list) -> list:
+        """
+        批量获取合约资料, 只查询缓存未命中的合约, 全部调用在一个批量请求中发送
+        :return: [(str name, str symbol, int decimal, int total) or None], 与 contracts 一一对应, 查询失败为 None
+        """
+        contracts = list(contracts)
+        infos, missing = self._lookup_contract_infos(contracts)
+        if missing:
+            calls = [call for contract in missing for call in EthereumMulticall.contract_info_calls(contract)]
+            infos.update(self._store_contract_infos(missing, self.call_many(calls)))
+        return [infos.get(ContractInfoCache.to_key(contract)) for contract in contracts]
 
 
 if __name__ == '__main__':
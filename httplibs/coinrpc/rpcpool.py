@@ -0,0 +1,284 @@
+import threading
+import time
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from exceptions import JsonRpcError
+from httplibs.coinrpc.rpcbase import EthereumRpcBase
+
+
+class RpcEndpoint(object):
+    """
+    节点池中的单个节点及其状态.
+    latency 为请求耗时的 EWMA(秒), height 为最近一次健康检查得到的节点高度.
+    """
+
+    def __init__(self, rpc, ewma_alpha=0.3):
+        self.rpc = rpc
+        self.ewma_alpha = ewma_alpha
+        self.latency = None
+        self.height = None
+        self.in_flight = 0
+        self.errors = 0
+        self.ejected = False
+        self.eject_reason = None
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def host(self):
+        return self.rpc.host
+
+    def record_latency(self, latency):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency
+
+    def score(self) -> float:
+        """越小越优先, 未测过延迟的节点优先被尝试"""
+        return (self.latency or 0) * (self.in_flight + 1)
+
+    def eject(self, reason):
+        self.ejected = True
+        self.eject_reason = reason
+
+    def reinstate(self):
+        self.ejected = False
+        self.eject_reason = None
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "host": self.host,
+            "latency": self.latency,
+            "height": self.height,
+            "inFlight": self.in_flight,
+            "errors": self.errors,
+            "ejected": self.ejected,
+            "ejectReason": self.eject_reason,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class EthereumRpcPool(EthereumRpcBase):
+    """
+    多节点 EthereumRpc, 方法与 EthereumRpc 完全一致, 每次请求(批量请求拆分后的每一批)路由到当前最优节点.
+    路由规则:
+        1. 排除被剔除的节点, 以及高度落后最高节点超过 max_lag 的节点
+        2. 在剩余节点中选择 EWMA 延迟 * (在途请求数 + 1) 最小的节点
+        3. 请求失败时自动切换到下一个节点, 连续失败 max_errors 次的节点被剔除;
+           发送交易、生成地址等非幂等请求只在连接阶段失败(请求一定没有发出)时切换, 其他错误直接返回, 避免重复发送
+    健康检查(check_health)通过 eth_syncing/eth_blockNumber 更新各节点高度, 被剔除的节点在检查通过后恢复.
+    health_interval 不为 None 时, 第一次请求后会启动后台线程定时检查.
+
+    hosts 可以是 host 字符串, 或者 {"host": host, ...} 形式的 dict, dict 中的其他值作为该节点单独的初始化参数.
+    """
+    _default_max_lag = 3
+    _default_max_errors = 3
+    _default_health_interval = 10
+    _default_ewma_alpha = 0.3
+    # 节点收到后重复执行会产生副作用的方法
+    _non_idempotent_methods = frozenset(('personal_signAndSendTransaction', 'personal_sendTransaction',
+                                         'eth_sendTransaction', 'personal_newAccount'))
+
+    def __init__(self, hosts: list, **kwargs):
+        if not hosts:
+            raise ValueError('节点池至少需要一个节点')
+        self._endpoints = []
+        for host in hosts:
+            endpoint_kwargs = dict(kwargs)
+            if isinstance(host, dict):
+                endpoint_kwargs.update(host)
+                host = endpoint_kwargs.pop('host')
+            self._endpoints.append(RpcEndpoint(EthereumRpcBase(host, **endpoint_kwargs),
+                                               kwargs.get('ewma_alpha', self._default_ewma_alpha)))
+        super().__init__(self._endpoints[0].host, **kwargs)
+        self._max_lag = kwargs.get('max_lag', self._default_max_lag)
+        self._max_errors = kwargs.get('max_errors', self._default_max_errors)
+        self._health_interval = kwargs.get('health_interval', self._default_health_interval)
+        self._pool_lock = threading.Lock()
+        self._health_thread = None
+        self._health_stop = threading.Event()
+
+    @property
+    def endpoints(self) -> list:
+        return self._endpoints
+
+    @property
+    def best_height(self):
+        heights = [e.height for e in self._endpoints if e.height is not None and not e.ejected]
+        return max(heights) if heights else None
+
+    def choice_endpoint(self, exclude=()) -> RpcEndpoint or None:
+        with self._pool_lock:
+            candidates = [e for e in self._endpoints if e not in exclude]
+            if not candidates:
+                return None
+            best_height = self.best_height
+            healthy = [e for e in candidates if not e.ejected and (
+                    best_height is None or e.height is None or best_height - e.height <= self._max_lag)]
+            # 所有节点都不可用时, 仍然尝试剩下的节点, 而不是直接失败
+            endpoint = min(healthy or candidates, key=RpcEndpoint.score)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint, latency=None, error=None):
+        with self._pool_lock:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.errors = 0
+                endpoint.record_latency(latency)
+                return
+            endpoint.errors += 1
+            endpoint.failures += 1
+            if endpoint.errors >= self._max_errors and not endpoint.ejected:
+                endpoint.eject('连续失败 {} 次: {}'.format(endpoint.errors, error))
+                self.logger.warning('节点 {} 被剔除, 原因: {}'.format(endpoint.host, endpoint.eject_reason))
+
+    def _next_endpoint(self, tried: list) -> RpcEndpoint:
+        endpoint = self.choice_endpoint(exclude=tried)
+        if endpoint is None:
+            raise JsonRpcError(code=0, message='所有节点请求均失败: {}'.format(
+                [e.host for e in tried]))
+        tried.append(endpoint)
+        return endpoint
+
+    def _should_failover(self, endpoint, params, error) -> bool:
+        self._release(endpoint, error=error)
+        if not self.can_retry(params, error):
+            self.logger.error('节点 {} 非幂等请求失败, 请求可能已被执行, 不切换节点. 原因: {}'.format(
+                endpoint.host, error))
+            return False
+        self.logger.warning('节点 {} 请求失败, 切换节点. 原因: {}'.format(endpoint.host, error))
+        return True
+
+    def _fetch(self, params):
+        self._start_health_check()
+        tried = []
+        while True:
+            endpoint = self._next_endpoint(tried)
+            start = time.monotonic()
+            try:
+                result = endpoint.rpc._fetch(params)
+                if not isinstance(result, (dict, list)):
+                    raise JsonRpcError(code=0, message='节点返回数据错误: {}'.format(result))
+            except Exception as e:
+                if self._should_failover(endpoint, params, e):
+                    continue
+                raise
+            self._release(endpoint, latency=time.monotonic() - start)
+            return result
+
+    def _fetch_stream(self, params):
+        """
+        流式请求同样按节点选择与失败切换路由; 已经产出数据后失败不能再切换节点(调用方已经消费了部分结果), 直接抛出
+        """
+        self._start_health_check()
+        tried = []
+        while True:
+            endpoint = self._next_endpoint(tried)
+            start = time.monotonic()
+            received = False
+            try:
+                for data in endpoint.rpc._fetch_stream(params):
+                    received = True
+                    yield data
+            except GeneratorExit:
+                # 调用方提前结束迭代, 不算节点失败
+                self._release(endpoint, latency=time.monotonic() - start)
+                raise
+            except Exception as e:
+                if not received and self._should_failover(endpoint, params, e):
+                    continue
+                if received:
+                    self._release(endpoint, error=e)
+                raise
+            self._release(endpoint, latency=time.monotonic() - start)
+            return
+
+    @classmethod
+    def is_connect_error(cls, error: Exception) -> bool:
+        """连接阶段的错误, 请求还没有发出"""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+            reason = getattr(error.args[0], 'reason', None)
+            return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+        return False
+
+    def can_retry(self, params, error: Exception) -> bool:
+        """只读请求总是可以换节点重试, 包含非幂等方法的请求只在连接失败时重试"""
+        requests_ = params if isinstance(params, list) else [params]
+        if any(isinstance(r, dict) and r.get('method') in self._non_idempotent_methods for r in requests_):
+            return self.is_connect_error(error)
+        return True
+
+    def check_endpoint(self, endpoint: RpcEndpoint):
+        """对单个节点做健康检查, 返回节点高度, 失败返回 None"""
+        start = time.monotonic()
+        try:
+            height = endpoint.rpc.get_block_height()
+        except Exception as e:
+            self.logger.warning('节点 {} 健康检查失败: {}'.format(endpoint.host, e))
+            with self._pool_lock:
+                endpoint.height = None
+                if not endpoint.ejected:
+                    endpoint.eject('健康检查失败: {}'.format(e))
+            return None
+        with self._pool_lock:
+            endpoint.record_latency(time.monotonic() - start)
+            # 同步中的节点以当前高度参与比较
+            endpoint.height = height.current_height
+        return endpoint.height
+
+    def check_health(self):
+        """检查所有节点, 剔除落后或异常的节点, 恢复已追上的节点"""
+        for endpoint in self._endpoints:
+            self.check_endpoint(endpoint)
+        with self._pool_lock:
+            heights = [e.height for e in self._endpoints if e.height is not None]
+            if not heights:
+                return
+            best_height = max(heights)
+            for endpoint in self._endpoints:
+                if endpoint.height is None:
+                    continue
+                lag = best_height - endpoint.height
+                if lag > self._max_lag:
+                    if not endpoint.ejected:
+                        endpoint.eject('高度落后 {} 块'.format(lag))
+                        self.logger.warning('节点 {} 被剔除, 原因: {}'.format(endpoint.host, endpoint.eject_reason))
+                elif endpoint.ejected:
+                    self.logger.info('节点 {} 健康检查通过, 恢复使用'.format(endpoint.host))
+                    endpoint.reinstate()
+
+    def _health_loop(self):
+        while not self._health_stop.wait(self._health_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                self.logger.error('节点健康检查异常: {}'.format(e))
+
+    def _start_health_check(self):
+        if self._health_interval is None or self._health_thread is not None:
+            return
+        with self._pool_lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name='rpc-pool-health',
+                                                   daemon=True)
+            self._health_thread.start()
+
+    def stats(self) -> list:
+        with self._pool_lock:
+            return [e.to_dict() for e in self._endpoints]
+
+    def close(self):
+        self._health_stop.set()
+        for endpoint in self._endpoints:
+            endpoint.rpc.close()
+        super().close()
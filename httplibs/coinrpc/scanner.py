@@ -0,0 +1,325 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from coin.resolver.eth_log_resolver import EthereumLogResolver
+from coin.resolver.eth_resolver import EthereumResolver
+from digit import digit
+from exceptions import JsonRpcError
+
+
+class ScanStats(object):
+    """扫块统计"""
+
+    def __init__(self):
+        self.blocks = 0
+        self.transactions = 0
+        self.requests = 0
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.start_time is None:
+            return 0
+        return (self.end_time or time.monotonic()) - self.start_time
+
+    @property
+    def blocks_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.blocks / elapsed if elapsed else 0
+
+    def __str__(self):
+        return 'blocks: {}, transactions: {}, requests: {}, elapsed: {:.3f}s, {:.1f} blocks/s'.format(
+            self.blocks, self.transactions, self.requests, self.elapsed, self.blocks_per_second)
+
+    def to_dict(self) -> dict:
+        return {
+            "blocks": self.blocks,
+            "transactions": self.transactions,
+            "requests": self.requests,
+            "elapsed": self.elapsed,
+            "blocksPerSecond": self.blocks_per_second,
+        }
+
+
+class BlockScanner(object):
+    """
+    按高度顺序遍历 [start, end] 的区块, 迭代得到解析后的 coin.coin_tools.Block.
+    同时保持 window 个 batch_size 大小的 eth_getBlockByNumber 批量请求在途, 内存占用上限为 window * batch_size 个块.
+    用法:
+        scanner = rpc.scan_blocks(100, 200)
+        for block in scanner:
+            ...
+        print(scanner.stats)
+    """
+    _default_batch_size = 10
+    _default_window = 4
+
+    def __init__(self, rpc, start: int, end: int, detail=True, batch_size=None, window=None, address_index=None,
+                 lazy=False, match_sender=False):
+        """
+        :param rpc: EthereumRpcBase
+        :param start: 起始高度
+        :param end: 结束高度(包含)
+        :param detail: 是否获取并解析交易
+        :param batch_size: 每个批量请求的块数
+        :param window: 同时在途的批量请求数
+        :param address_index: coin.address_index.AddressIndex, 只解析收款地址在其中的交易
+        :param lazy: 交易解析为 LazyTx, 字段在访问时才解码
+        :param match_sender: 发送地址在 address_index 中的交易同样解析
+        """
+        self.rpc = rpc
+        self.start = start
+        self.end = end
+        self.detail = detail
+        self.batch_size = batch_size or self._default_batch_size
+        self.window = window or self._default_window
+        self.address_index = address_index
+        self.lazy = lazy
+        self.match_sender = match_sender
+        self.stats = ScanStats()
+
+    def batches(self):
+        for s in range(self.start, self.end + 1, self.batch_size):
+            yield [digit.int_to_hex(height) for height in range(s, min(s + self.batch_size, self.end + 1))]
+
+    def _fetch(self, heights: list) -> list:
+        return self.rpc._many_post('eth_getBlockByNumber', self.rpc.get_params(heights, self.detail))
+
+    def resolve(self, heights: list, blocks: list):
+        self.stats.requests += 1
+        for height, block in zip(heights, blocks):
+            if not block:
+                raise JsonRpcError(code=1, message='区块 {} 未找到'.format(digit.hex_to_int(height)))
+            self.stats.transactions += len(block['transactions'])
+            block = EthereumResolver.resolver_block(block, self.detail, self.address_index, self.lazy,
+                                                   self.match_sender)
+            self.stats.blocks += 1
+            yield block
+
+    def __iter__(self):
+        self.stats.start_time = time.monotonic()
+        batches = self.batches()
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.window, thread_name_prefix='block-scanner') as executor:
+            try:
+                for heights in batches:
+                    pending.append((heights, executor.submit(self._fetch, heights)))
+                    if len(pending) >= self.window:
+                        break
+                while pending:
+                    heights, future = pending.popleft()
+                    blocks = future.result()
+                    # 取走一批后立刻补充一批, 保证在途请求数
+                    for next_heights in batches:
+                        pending.append((next_heights, executor.submit(self._fetch, next_heights)))
+                        break
+                    yield from self.resolve(heights, blocks)
+            finally:
+                for _, future in pending:
+                    future.cancel()
+                self.stats.end_time = time.monotonic()
+                self.rpc.logger.info('扫块 {} - {} 结束, {}'.format(self.start, self.end, self.stats))
+
+
+class AsyncBlockScanner(BlockScanner):
+    """
+    BlockScanner 的 asyncio 版本, rpc 为 AsyncEthereumRpcBase.
+        async for block in await rpc.scan_blocks(100, 200):
+            ...
+    """
+
+    async def __aiter__(self):
+        self.stats.start_time = time.monotonic()
+        batches = self.batches()
+        pending = deque()
+        try:
+            for heights in batches:
+                pending.append((heights, asyncio.ensure_future(self._fetch(heights))))
+                if len(pending) >= self.window:
+                    break
+            while pending:
+                heights, future = pending.popleft()
+                blocks = await future
+                for next_heights in batches:
+                    pending.append((next_heights, asyncio.ensure_future(self._fetch(next_heights))))
+                    break
+                for block in self.resolve(heights, blocks):
+                    yield block
+        finally:
+            for _, future in pending:
+                future.cancel()
+            self.stats.end_time = time.monotonic()
+            self.rpc.logger.info('扫块 {} - {} 结束, {}'.format(self.start, self.end, self.stats))
+
+    def __iter__(self):
+        raise TypeError('AsyncBlockScanner 请使用 async for 遍历')
+
+
+class TransferScanner(object):
+    """
+    用 eth_getLogs 按块范围获取 Transfer 日志, 迭代得到 TokenTransfer(与 Tx 兼容), 按 (高度, logIndex) 排序.
+    每次请求的块范围自适应: 节点返回范围过大/结果过多时减半重试, 成功后逐步放大,
+    直到 max_range_size; 失败过之后不再超过失败范围的一半, 避免反复失败.
+    receivers 较多时按 max_receivers 分组作为 topics 条件, 同一范围的多组请求放在一个批量请求中.
+    用法:
+        scanner = rpc.scan_token_transfers(5000000, 5006500, contracts=[usdt], receivers=addresses)
+        for transfer in scanner:
+            ...
+        print(scanner.stats)
+    """
+    _default_range_size = 1000
+    _default_max_range_size = 10000
+    _default_max_receivers = 500
+    # 各节点对范围过大/结果过多的报错, 如 geth/infura 的 query returned more than 10000 results,
+    # alchemy 的 Log response size exceeded, bsc 的 exceed maximum block range: 5000
+    _range_errors = ('query returned more than', 'response size exceeded', 'exceed maximum block range',
+                     'block range is too', 'block range too', 'range too large', 'range is too large',
+                     'too many blocks', 'too many results', 'is limited to a', 'query timeout exceeded')
+    # 传输层错误(连接失败、读超时)在 JsonRpcV1._send_data 中转换为 code 0
+    _transport_error_code = 0
+    _default_recover_after = 10
+
+    def __init__(self, rpc, start: int, end: int, contracts=None, receivers=None, address_index=None,
+                 range_size=None, max_range_size=None, max_receivers=None):
+        """
+        :param rpc: EthereumRpcBase
+        :param start: 起始高度
+        :param end: 结束高度(包含)
+        :param contracts: 代币合约地址, None 表示所有合约
+        :param receivers: 收款地址, 作为 topics 条件由节点过滤, None 表示不限
+        :param address_index: coin.address_index.AddressIndex, 本地再按收款地址过滤一次
+        :param range_size: 初始块范围
+        :param max_range_size: 最大块范围
+        :param max_receivers: 每个请求的收款地址数量上限
+        """
+        self.rpc = rpc
+        self.start = start
+        self.end = end
+        self.contracts = [digit.add_0x(contract).lower() for contract in contracts] if contracts else None
+        self.address_index = address_index
+        self.max_range_size = max_range_size or self._default_max_range_size
+        self.range_size = min(range_size or self._default_range_size, self.max_range_size)
+        max_receivers = max_receivers or self._default_max_receivers
+        topics = [EthereumLogResolver.address_to_topic(receiver) for receiver in receivers] if receivers else []
+        self.receiver_groups = [topics[k:k + max_receivers] for k in range(0, len(topics), max_receivers)] or [None]
+        self.stats = ScanStats()
+        self.shrinks = 0
+        # 曾经失败的最小范围, 连续成功 recover_after 次后翻倍
+        self._failed_size = None
+        self._successes = 0
+
+    def get_filter(self, from_block: int, to_block: int, receivers=None) -> dict:
+        params = {
+            "fromBlock": digit.int_to_hex(from_block),
+            "toBlock": digit.int_to_hex(to_block),
+            "topics": [EthereumLogResolver.TRANSFER_TOPIC, None, receivers],
+        }
+        if self.contracts:
+            params['address'] = self.contracts
+        return params
+
+    def get_payload(self, from_block: int, to_block: int) -> list:
+        return [[self.get_filter(from_block, to_block, receivers)] for receivers in self.receiver_groups]
+
+    @classmethod
+    def is_range_error(cls, error: JsonRpcError) -> bool:
+        if error.code == cls._transport_error_code:
+            return False
+        message = str(error.message).lower()
+        return any(keyword in message for keyword in cls._range_errors)
+
+    def shrink(self, from_block: int, to_block: int, error: JsonRpcError):
+        if to_block == from_block or not self.is_range_error(error):
+            raise error
+        self.shrinks += 1
+        self._successes = 0
+        size = to_block - from_block + 1
+        self._failed_size = size if self._failed_size is None else min(self._failed_size, size)
+        self.range_size = max(1, size // 2)
+        self.rpc.logger.warning('eth_getLogs {} - {} 失败: {}, 块范围缩小为 {}'.format(
+            from_block, to_block, error, self.range_size))
+
+    def resolve(self, from_block: int, to_block: int, results: list) -> list:
+        self.stats.requests += 1
+        self.stats.blocks += to_block - from_block + 1
+        logs = [log for result in results for log in result or ()]
+        transfers = EthereumLogResolver.resolver_logs(logs, self.contracts, self.address_index)
+        if len(results) > 1:
+            transfers.sort(key=lambda t: (t.block_height, t.log_index))
+        self.stats.transactions += len(transfers)
+        # 成功后放大范围
+        self._successes += 1
+        if self._failed_size is not None and self._successes >= self._default_recover_after:
+            self._successes = 0
+            self._failed_size *= 2
+            if self._failed_size > self.max_range_size * 2:
+                self._failed_size = None
+        limit = self.max_range_size if self._failed_size is None else self._failed_size // 2
+        self.range_size = max(1, min(self.range_size * 2, limit))
+        return transfers
+
+    @classmethod
+    def processor(cls, data: list) -> list:
+        # eth_getLogs 正常结果可能是空列表, 不能用 _many_post 的 ignore_err=False 判断错误
+        for d in data:
+            err = d.get('error')
+            if err:
+                raise JsonRpcError(code=err.get('code', -32603), message=err.get('message', ''))
+        return [d.get('result') for d in data]
+
+    def _fetch(self, from_block: int, to_block: int) -> list:
+        rpc = self.rpc
+        payload = [{'jsonrpc': "2.0", "id": next(rpc.get_id()), 'method': 'eth_getLogs',
+                    "params": rpc.right_params(p)} for p in self.get_payload(from_block, to_block)]
+        return rpc._send_batch(payload, self.processor)
+
+    def __iter__(self):
+        self.stats.start_time = time.monotonic()
+        from_block = self.start
+        try:
+            while from_block <= self.end:
+                to_block = min(from_block + self.range_size - 1, self.end)
+                try:
+                    results = self._fetch(from_block, to_block)
+                except JsonRpcError as e:
+                    self.shrink(from_block, to_block, e)
+                    continue
+                yield from self.resolve(from_block, to_block, results)
+                from_block = to_block + 1
+        finally:
+            self.stats.end_time = time.monotonic()
+            self.rpc.logger.info('扫描转账日志 {} - {} 结束, {}, 缩小范围 {} 次'.format(
+                self.start, self.end, self.stats, self.shrinks))
+
+
+class AsyncTransferScanner(TransferScanner):
+    """
+    TransferScanner 的 asyncio 版本, rpc 为 AsyncEthereumRpcBase.
+        async for transfer in await rpc.scan_token_transfers(5000000, 5006500, contracts=[usdt]):
+            ...
+    """
+
+    async def __aiter__(self):
+        self.stats.start_time = time.monotonic()
+        from_block = self.start
+        try:
+            while from_block <= self.end:
+                to_block = min(from_block + self.range_size - 1, self.end)
+                try:
+                    results = await self._fetch(from_block, to_block)
+                except JsonRpcError as e:
+                    self.shrink(from_block, to_block, e)
+                    continue
+                for transfer in self.resolve(from_block, to_block, results):
+                    yield transfer
+                from_block = to_block + 1
+        finally:
+            self.stats.end_time = time.monotonic()
+            self.rpc.logger.info('扫描转账日志 {} - {} 结束, {}, 缩小范围 {} 次'.format(
+                self.start, self.end, self.stats, self.shrinks))
+
+    def __iter__(self):
+        raise TypeError('AsyncTransferScanner 请使用 async for 遍历')
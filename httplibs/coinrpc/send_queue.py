@@ -0,0 +1,273 @@
+from collections import deque
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+from coin.resolver.eth_resolver import EthereumResolver
+from exceptions import JsonRpcError
+
+
+class ReceiptTracker(object):
+    """
+    交易确认跟踪. track(tx_hash) 返回 Future, 后台线程每 interval 秒用一次批量 eth_getTransactionReceipt
+    查询所有未确认的交易, 收据所在块达到 confirmations 个确认后 Future 的结果为 TxReceipt(status 为 0 表示执行失败).
+    超过 timeout 秒仍没有收据的交易 Future 抛出 TimeoutError, 交易可能被丢弃或 gas price 太低.
+        tracker = ReceiptTracker(rpc, confirmations=12).start()
+        receipt = tracker.track(tx_hash).result()
+    """
+    _default_interval = 2
+    _default_confirmations = 1
+
+    def __init__(self, rpc, interval=None, confirmations=None, timeout=None):
+        """
+        :param rpc: EthereumRpcBase, 需要同步客户端, 后台线程使用
+        :param interval: 查询间隔秒数, 默认 2
+        :param confirmations: 确认数, 收据所在块算 1 个, 默认 1
+        :param timeout: 超过多少秒没有收据视为失败, None 为一直等待
+        """
+        self.rpc = rpc
+        self.interval = interval or self._default_interval
+        self.confirmations = confirmations or self._default_confirmations
+        self.timeout = timeout
+        # tx_hash: (Future, 开始跟踪的时间)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.confirmed = 0
+        self.reverted = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def track(self, tx_hash: str) -> Future:
+        """同一个 hash 多次 track 返回同一个 Future"""
+        with self._lock:
+            item = self._pending.get(tx_hash)
+            if item is None:
+                item = self._pending[tx_hash] = (Future(), time.monotonic())
+            return item[0]
+
+    def __len__(self):
+        return len(self._pending)
+
+    def poll(self) -> int:
+        """查询一次所有未确认交易的收据, 返回本次确认的数量"""
+        with self._lock:
+            hashes = list(self._pending)
+        if not hashes:
+            return 0
+        receipts = self.rpc.get_transaction_receipt(hashes)
+        height = self.rpc.get_block_height().current_height if self.confirmations > 1 else None
+        now, done = time.monotonic(), 0
+        for tx_hash, receipt in zip(hashes, receipts):
+            with self._lock:
+                future, started = self._pending[tx_hash]
+                if receipt:
+                    receipt = EthereumResolver.resolver_receipt(receipt)
+                    if height is not None and height - receipt.block_height + 1 < self.confirmations:
+                        continue
+                    del self._pending[tx_hash]
+                elif self.timeout is not None and now - started > self.timeout:
+                    del self._pending[tx_hash]
+                else:
+                    continue
+            if receipt:
+                done += 1
+                self.confirmed += 1
+                self.reverted += receipt.status == 0
+                future.set_result(receipt)
+            else:
+                self.timeouts += 1
+                future.set_exception(TimeoutError('{} 超过 {} 秒没有收据'.format(tx_hash, self.timeout)))
+        return done
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.errors += 1
+                self.rpc.logger.error('交易确认查询异常: {}'.format(e))
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='receipt-tracker', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {'pending': len(self._pending), 'confirmed': self.confirmed, 'reverted': self.reverted,
+                'timeouts': self.timeouts, 'errors': self.errors}
+
+
+class SendQueue(object):
+    """
+    原始交易批量发送流水线.
+    submit(raw) 把签名后的原始交易放入有界队列并返回 Future; workers 个后台线程各自从队列取出最多 batch_size 笔,
+    用一次批量 eth_sendRawTransaction 发送, 每笔的结果(tx_hash 或 JsonRpcError)写回各自的 Future.
+    每个线程同时只有一个批次在途, 节点变慢时队列积压, 队列满后 submit 阻塞(背压), timeout 到期抛出 queue.Full.
+    设置 tracker 时, 节点接受的交易 hash 自动交给 ReceiptTracker 跟踪确认, tracker.track(hash) 取得收据的 Future.
+        tracker = ReceiptTracker(rpc).start()
+        sender = SendQueue(rpc, tracker=tracker)
+        futures = [sender.submit(signed.raw) for signed in signer.sign_many(txs)]
+        receipts = [tracker.track(f.result()).result() for f in futures]
+        sender.close()
+    """
+    _default_batch_size = 100
+    _default_max_pending = 10000
+    _default_workers = 2
+    # 取到第一笔后最多等待多少秒凑满一批
+    _default_linger = 0.005
+    # 发送速率统计的时间窗口(秒)
+    _default_rate_window = 10
+
+    def __init__(self, rpc, batch_size=None, max_pending=None, workers=None, linger=None, tracker=None):
+        """
+        :param rpc: EthereumRpcBase, 需要同步客户端
+        :param batch_size: 每批最多多少笔, 默认 100
+        :param max_pending: 队列容量, 默认 10000, 满后 submit 阻塞
+        :param workers: 发送线程数, 即最多同时在途的批次数, 默认 2
+        :param linger: 取到第一笔后最多等待多少秒凑满一批, 默认 0.005
+        :param tracker: ReceiptTracker, 节点接受的交易自动跟踪确认
+        """
+        self.rpc = rpc
+        self.batch_size = batch_size or self._default_batch_size
+        self.max_pending = max_pending or self._default_max_pending
+        self.linger = self._default_linger if linger is None else linger
+        self.tracker = tracker
+        self._queue = queue.Queue(self.max_pending)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._closed = False
+        # 已退出的发送线程数, close 后全部退出时晚到的交易由 submit 自己失败
+        self._exited = 0
+        # 最近 rate_window 秒内完成的批次 (完成时间, 接受的笔数)
+        self._recent = deque()
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.in_flight = 0
+        self.latency = None
+        self._started = time.monotonic()
+        self._threads = [threading.Thread(target=self._worker, name='send-queue-{}'.format(i), daemon=True)
+                         for i in range(workers or self._default_workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, raw: str, timeout: float = None) -> Future:
+        """
+        :param raw: 签名后的原始交易 hex
+        :param timeout: 队列满时最多等待多少秒, None 为一直等待, 到期抛出 queue.Full
+        :return: Future, 结果为 tx_hash, 节点拒绝时抛出 JsonRpcError
+        """
+        if self._closed:
+            raise ValueError('发送队列已关闭')
+        future = Future()
+        self._queue.put((raw, future), timeout=timeout)
+        with self._lock:
+            self.submitted += 1
+            orphaned = self._exited == len(self._threads)
+        if orphaned:
+            # put 阻塞期间队列被关闭且发送线程已退出, 没有线程会再处理队列
+            self._fail_pending()
+        return future
+
+    def submit_many(self, raws: list, timeout: float = None) -> list:
+        return [self.submit(raw, timeout) for raw in raws]
+
+    @property
+    def depth(self) -> int:
+        """队列中等待发送的笔数"""
+        return self._queue.qsize()
+
+    def _take_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch: list):
+        with self._lock:
+            self.in_flight += len(batch)
+        start = time.monotonic()
+        try:
+            results = self.rpc.send_raw_transactions([raw for raw, _ in batch])
+        except Exception as e:
+            self.rpc.logger.error('批量发送 {} 笔交易异常: {}'.format(len(batch), e))
+            results = [(None, e)] * len(batch)
+        now = time.monotonic()
+        accepted = sum(1 for tx_hash, _ in results if tx_hash)
+        with self._lock:
+            self.in_flight -= len(batch)
+            self.batches += 1
+            self.sent += accepted
+            self.failed += len(batch) - accepted
+            elapsed = now - start
+            self.latency = elapsed if self.latency is None else self.latency * 0.7 + elapsed * 0.3
+            self._recent.append((now, accepted))
+            while self._recent and now - self._recent[0][0] > self._default_rate_window:
+                self._recent.popleft()
+        for (raw, future), (tx_hash, error) in zip(batch, results):
+            if tx_hash:
+                if self.tracker is not None:
+                    self.tracker.track(tx_hash)
+                future.set_result(tx_hash)
+            else:
+                future.set_exception(error or JsonRpcError(message='发送交易失败'))
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if self._stop.is_set() and self._queue.empty():
+                    self._exited += 1
+                    return
+            batch = self._take_batch()
+            if batch:
+                self._send(batch)
+
+    def _fail_pending(self):
+        while True:
+            try:
+                _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self.failed += 1
+            future.set_exception(ValueError('发送队列已关闭'))
+
+    def sends_per_second(self) -> float:
+        """最近 rate_window 秒内节点接受的交易数/秒"""
+        with self._lock:
+            now = time.monotonic()
+            accepted = sum(n for t, n in self._recent if now - t <= self._default_rate_window)
+        return accepted / max(min(now - self._started, self._default_rate_window), 1e-3)
+
+    def close(self, wait=True):
+        """不再接受新交易, 队列中已有的交易发送完后线程退出, 关闭后才入队的交易 Future 抛出 ValueError"""
+        self._closed = True
+        self._stop.set()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def stats(self) -> dict:
+        return {'depth': self.depth, 'inFlight': self.in_flight, 'submitted': self.submitted, 'sent': self.sent,
+                'failed': self.failed, 'batches': self.batches, 'latency': self.latency,
+                'sendsPerSecond': self.sends_per_second()}
@@ -1,8 +1,100 @@
-import json
+from contextlib import contextmanager
 import logging
 import re
+import threading
+import time
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from httplibs.codec import JsonCodec, get_codec
+
+
+class HttpSessionPool(object):
+    """
+    按 host 复用的长连接池, 每个 host(scheme + netloc) 对应一个常驻 requests.Session,
+    连接保持 keep-alive, 可在多线程间共享.
+    超过 idle_timeout 秒未使用且没有请求在使用的 session 会被关闭, 下次使用时重建.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, idle_timeout=60, max_retries=0):
+        """
+        :param pool_connections: 每个 session 缓存的连接池数量
+        :param pool_maxsize: 每个连接池最大连接数, 一般与并发线程数一致
+        :param idle_timeout: 空闲多少秒后回收 session, None 表示不回收
+        :param max_retries: urllib3 连接失败重试次数
+        """
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._idle_timeout = idle_timeout
+        self._max_retries = max_retries
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_key(cls, url):
+        split = urlsplit(url)
+        return '{}://{}'.format(split.scheme, split.netloc)
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize,
+                              max_retries=self._max_retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _checkout(self, key, now, in_use):
+        self._evict_idle(now)
+        item = self._sessions.get(key)
+        if item is None:
+            item = [self._new_session(), now, 0]
+            self._sessions[key] = item
+        else:
+            item[1] = now
+        item[2] += in_use
+        return item
+
+    def get(self, url) -> requests.Session:
+        """只取 session 不登记使用中, 长时间请求应使用 use(url), 避免请求过程中被回收"""
+        with self._lock:
+            return self._checkout(self.get_key(url), time.monotonic(), 0)[0]
+
+    @contextmanager
+    def use(self, url):
+        """请求期间 session 登记为使用中, 不会被空闲回收关闭; 结束时刷新最后使用时间"""
+        key = self.get_key(url)
+        with self._lock:
+            item = self._checkout(key, time.monotonic(), 1)
+        try:
+            yield item[0]
+        finally:
+            with self._lock:
+                item[1] = time.monotonic()
+                item[2] -= 1
+
+    def _evict_idle(self, now):
+        if self._idle_timeout is None:
+            return
+        for key, (session, last_used, in_use) in list(self._sessions.items()):
+            if not in_use and now - last_used > self._idle_timeout:
+                self._sessions.pop(key)
+                session.close()
+
+    def evict_idle(self):
+        """主动回收空闲 session"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def close(self):
+        with self._lock:
+            for session, _, _ in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
 
 
 class Http(object):
@@ -11,13 +103,19 @@ class Http(object):
     _default_is_pre_request = False
     _default_timeout = (60, 60)
     _default_is_json = False
+    _default_pool_connections = 10
+    _default_pool_maxsize = 10
+    _default_pool_idle_timeout = 60
+    _default_codec = None
+    _default_stream_chunk_size = 64 * 1024
 
     _CHECK_HOST = re.compile(
         r'httplibs[s]://.*?[/]|(?<![.\d])(?:(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d?)(?![.\d])')
 
     def __init__(self, host, **kwargs):
         self._host = host
-        self._headers = self._default_headers
+        # 复制一份, 避免多个实例共用并修改类属性
+        self._headers = dict(self._default_headers)
         self._headers.update(kwargs.get('headers', {}))
         self._basic_auth = kwargs.get('auth', self._default_basic_auth)
         self._basic_auth_str = self._default_basic_auth and ''.join(self._basic_auth)
@@ -29,51 +127,75 @@ class Http(object):
             self.set_header('content-type', 'application/json')
 
         self.logger = kwargs.get('logger', logging)
+        # json 编解码, 可传入 'orjson' / 'json' 或 JsonCodec 实例, 默认为标准库 json
+        codec = kwargs.get('codec', self._default_codec)
+        self._codec = codec if isinstance(codec, JsonCodec) else get_codec(codec)
 
         self.logger.debug('host: {} header: {} auth:{} timeout: {}'.format(
             self._host, self._headers, self._basic_auth_str, self._timeout))
 
-        self.session = requests.session
+        self._session_pool = kwargs.get('session_pool') or HttpSessionPool(
+            pool_connections=kwargs.get('pool_connections', self._default_pool_connections),
+            pool_maxsize=kwargs.get('pool_maxsize', self._default_pool_maxsize),
+            idle_timeout=kwargs.get('pool_idle_timeout', self._default_pool_idle_timeout))
+
+    def session(self, url=None) -> requests.Session:
+        """获取 url 所属 host 的常驻 session, 默认为当前 host"""
+        return self._session_pool.get(url or self._host)
+
+    def close(self):
+        self._session_pool.close()
+
+    @property
+    def codec(self) -> JsonCodec:
+        return self._codec
 
     def format_params(self, params):
+        """dict/list 通过 codec 预先编码为 bytes, 其他类型(str/bytes)原样发送"""
         _data, _json = None, None
-        if self._is_json:
-            if not isinstance(params, (dict, list)):
-                try:
-                    _json = json.loads(params)
-                except Exception:
-                    _data = params
-            else:
-                _json = params
+        if isinstance(params, (dict, list)):
+            try:
+                _data = self._codec.dumps(params)
+            except Exception as e:
+                raise ValueError("参数无法转换为data请求数据, 请确认数据: {}".format(params))
         else:
-            if isinstance(params, (dict, list)):
-                try:
-                    _data = json.dumps(params)
-                except Exception as e:
-                    raise ValueError("参数无法转换为data请求数据, 请确认数据: {}".format(params))
-            else:
-                _data = params
+            _data = params
         return _data, _json
 
     def _request(self, method, url, **kwargs):
 
-        headers = kwargs.get('headers') or self.get_headers()
-        auth = kwargs.get('auth') or self._basic_auth
-        timeout = kwargs.get('auth') or self._timeout
+        headers = kwargs.pop('headers', None) or self.get_headers()
+        auth = kwargs.pop('auth', None) or self._basic_auth
+        timeout = kwargs.pop('timeout', None) or self._timeout
         self.logger.debug('url: {} header: {} auth:{} timeout: {}'.format(
             url, self._headers, self._basic_auth_str, self._timeout))
-        with self.session().request(method, url, headers=headers, auth=auth, timeout=timeout, **kwargs) as rsp:
-            return rsp
+        with self._session_pool.use(url) as session:
+            with session.request(method, url, headers=headers, auth=auth, timeout=timeout, **kwargs) as rsp:
+                return rsp
 
     def get(self, url, params, **kwargs):
         method = 'GET'
-        return self._request(method, url, params=params **kwargs)
+        return self._request(method, url, params=params, **kwargs)
 
     def post(self, url, params, **kwargs):
         method = 'POST'
         _data, _json = self.format_params(params)
         return self._request(method, url, data=_data, json=_json, **kwargs)
 
+    def post_stream(self, url, params, chunk_size=None, **kwargs):
+        """
+        发送 POST 请求, 以生成器方式逐段返回返回体, 不把整个返回体读入内存
+        :param chunk_size: 每段字节数, 默认 64K
+        """
+        _data, _json = self.format_params(params)
+        headers = kwargs.pop('headers', None) or self.get_headers()
+        auth = kwargs.pop('auth', None) or self._basic_auth
+        timeout = kwargs.pop('timeout', None) or self._timeout
+        with self._session_pool.use(url) as session:
+            with session.request('POST', url, headers=headers, auth=auth, timeout=timeout, data=_data,
+                                 json=_json, stream=True, **kwargs) as rsp:
+                yield from rsp.iter_content(chunk_size or self._default_stream_chunk_size)
+
     @property
     def host(self):
         return self._host
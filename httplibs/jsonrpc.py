@@ -1,13 +1,69 @@
-from json import JSONDecodeError
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import traceback
 
 from exceptions import JsonRpcError
 from httplibs.httplib import Http
+from httplibs.jsonstream import JsonArrayStream
+from httplibs.singleflight import SingleFlight
+from httplibs.template import RequestTemplate
+
+
+class JsonRpcId(object):
+    """
+    线程安全的 jsonrpc id 生成器.
+    id 单调递增, 超过 max_id 后回到 start, 多线程共用同一个 rpc 实例时同一批次内不会出现重复 id.
+    """
+
+    def __init__(self, start=0, max_id=2 ** 31 - 1):
+        self._start = start
+        self._max_id = max_id
+        self._id = start
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            _id = self._id
+            self._id = self._start if _id >= self._max_id else _id + 1
+            return _id
+
+    def take(self, count: int):
+        """一次取 count 个连续 id, 用于批量请求"""
+        with self._lock:
+            start = self._id
+            if start + count - 1 <= self._max_id:
+                self._id = self._start if start + count > self._max_id else start + count
+                return range(start, start + count)
+            ids = []
+            for _ in range(count):
+                ids.append(self._id)
+                self._id = self._start if self._id >= self._max_id else self._id + 1
+            return ids
+
+    def reset(self):
+        with self._lock:
+            self._id = self._start
+
+    @property
+    def current(self) -> int:
+        return self._id
 
 
 class JsonRpcBatchMixin(object):
-    def _many_post(self, method: str, params, ignore_err=True):
+    """
+    批量请求. 超过 max_batch_size 条或 max_batch_bytes 字节的批量请求会自动拆分,
+    拆分后的各批次通过线程池并发发送, 结果按输入顺序返回.
+    """
+    _default_max_batch_size = 100
+    _default_max_batch_bytes = 4 * 1024 * 1024
+    _default_batch_workers = 8
+
+    _max_batch_size = _default_max_batch_size
+    _max_batch_bytes = _default_max_batch_bytes
+    _batch_workers = _default_batch_workers
+    _batch_executor = None
 
+    def _get_batch_processor(self, ignore_err):
         def processor(data):
             """JSONRPC协议中, result与error互斥, 两者不可能同时拥有值."""
             results = [d.get('result') for d in data]
@@ -16,24 +72,189 @@ class JsonRpcBatchMixin(object):
             if not all(results):
                 self.logger.debug('many post中返回数据错误: {}'.format(data))
                 raise JsonRpcError(-1, "many post中返回数据中错误.")
+            return results
+
+        return processor
 
+    def _get_stream_processor(self, ignore_err):
+        def processor(data):
+            err = data.get('error')
+            if not err or ignore_err:
+                return data.get('result')
+            raise JsonRpcError(code=err.get('code', -32603), message=err.get('message', ''))
+
+        return processor
+
+    def _many_post(self, method: str, params, ignore_err=True, stream=False):
+        """
+        :param stream: 流式模式, 返回生成器, 边接收边解析, 按请求顺序逐条产出结果, 内存只占用约一条返回.
+            拆分后的批次依次发送, 不经过缓存与在途请求合并; ignore_err 为 False 时遇到错误的那一条抛出 JsonRpcError
+        """
         payload = [{'jsonrpc': "2.0", "id": next(self.get_id()),
                     'method': method, "params": self.right_params(p)} for p in params]
-        return self._send_data(payload, processor)
+        if stream:
+            return self._send_stream(payload, self._get_stream_processor(ignore_err))
+        return self._send_batch(payload, self._get_batch_processor(ignore_err))
 
     def _diff_post(self, methods: list, params: list, ignore_err=True):
-        def processor(data):
-            """JSONRPC协议中, result与error互斥, 两者不可能同时拥有值."""
-            results = [d.get('result') for d in data]
-            if ignore_err:
-                return results
-            if not all(results):
-                self.logger.debug('many post中返回数据错误: {}'.format(data))
-                raise JsonRpcError(-1, "many post中返回数据中错误.")
-
         payload = [{'jsonrpc': "2.0", "id": next(self.get_id()),
                     'method': methods[k], "params": self.right_params(p)} for k, p in enumerate(params)]
-        return self._send_data(payload, processor)
+        return self._send_batch(payload, self._get_batch_processor(ignore_err))
+
+    def split_batch(self, payload: list) -> list:
+        """
+        按 max_batch_size 与 max_batch_bytes 拆分批量请求, 单条超过字节上限的请求单独成批.
+        :param payload: 批量请求体
+        :return: [[request, ...], ...]
+        """
+        max_size = self._max_batch_size or len(payload)
+        max_bytes = self._max_batch_bytes
+        if not max_bytes:
+            return [payload[s:s + max_size] for s in range(0, len(payload), max_size)]
+
+        chunks, chunk, chunk_bytes = [], [], 2
+        for item in payload:
+            # 每条请求额外算上分隔符 ','
+            item_bytes = len(self._codec.dumps(item)) + 1
+            if chunk and (len(chunk) >= max_size or chunk_bytes + item_bytes > max_bytes):
+                chunks.append(chunk)
+                chunk, chunk_bytes = [], 2
+            chunk.append(item)
+            chunk_bytes += item_bytes
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    @classmethod
+    def merge_batch(cls, payload: list, data) -> list:
+        """
+        JSONRPC 协议中批量返回的顺序不一定与请求一致, 按 id 还原为请求顺序.
+        data 不是 list 时(请求失败), 每条请求都填充同样的 error.
+        """
+        return cls.merge_ids([p['id'] for p in payload], data)
+
+    @classmethod
+    def merge_ids(cls, ids, data) -> list:
+        """同 merge_batch, 按 ids 顺序还原"""
+        if not isinstance(data, list):
+            error = data.get('error') if isinstance(data, dict) else None
+            error = error or {"code": -32603, "message": "批量请求返回数据错误: {}".format(data)}
+            return [{'jsonrpc': "2.0", 'id': _id, 'error': error} for _id in ids]
+        by_id = {d.get('id'): d for d in data if isinstance(d, dict)}
+        return [by_id.get(_id) or {'jsonrpc': "2.0", 'id': _id,
+                                   'error': {"code": -32603, "message": "批量请求中缺少该 id 的返回"}}
+                for _id in ids]
+
+    def _get_batch_executor(self) -> ThreadPoolExecutor:
+        if self._batch_executor is None:
+            with self._batch_lock:
+                if self._batch_executor is None:
+                    self._batch_executor = ThreadPoolExecutor(max_workers=self._batch_workers,
+                                                              thread_name_prefix='jsonrpc-batch')
+        return self._batch_executor
+
+    def _send_chunk(self, chunk):
+        return self.merge_batch(chunk, self._send_data(chunk, lambda data: data))
+
+    def _send_batch(self, payload: list, processor):
+        if not payload:
+            return processor([])
+        chunks = self.split_batch(payload)
+        if len(chunks) == 1 or self._batch_workers <= 1:
+            responses = [self._send_chunk(chunk) for chunk in chunks]
+        else:
+            responses = list(self._get_batch_executor().map(self._send_chunk, chunks))
+        return processor([d for response in responses for d in response])
+
+
+    def split_values(self, template: RequestTemplate, values: list, **fixed) -> list:
+        """按 max_batch_size 与 max_batch_bytes 拆分模板请求的值, 每条请求的字节数按最长的值估算"""
+        max_size = self._max_batch_size or len(values) or 1
+        if self._max_batch_bytes:
+            value_size = max((len(str(value)) for value in values), default=0)
+            item_size = template.item_size(value_size, **fixed) + 1
+            max_size = max(1, min(max_size, self._max_batch_bytes // item_size))
+        return [values[s:s + max_size] for s in range(0, len(values), max_size)]
+
+    def _send_template_chunk(self, template: RequestTemplate, values: list, fixed: dict):
+        ids = self._id.take(len(values))
+        body = template.render(ids, values, **fixed)
+        return self.merge_ids(ids, self._send_data(body, lambda data: data))
+
+    def _template_post(self, template: RequestTemplate, values: list, ignore_err=True, **fixed):
+        """
+        使用预编码的请求模板发送批量请求, 结果与 _many_post 相同.
+        请求体直接写入 bytes, 不经过缓存与在途请求合并.
+        :param template: httplibs.template.RequestTemplate
+        :param values: 每条请求可变占位的值
+        :param fixed: 固定占位的值
+        """
+        values = list(values)
+        chunks = self.split_values(template, values, **fixed)
+        if len(chunks) <= 1 or self._batch_workers <= 1:
+            responses = [self._send_template_chunk(template, chunk, fixed) for chunk in chunks]
+        else:
+            responses = list(self._get_batch_executor().map(
+                lambda chunk: self._send_template_chunk(template, chunk, fixed), chunks))
+        return self._get_batch_processor(ignore_err)([d for response in responses for d in response])
+
+    def _stream_chunk(self, chunk, processor):
+        order = BatchOrder(chunk)
+        try:
+            for data in self._fetch_stream(chunk):
+                for response in order.push(data):
+                    yield processor(response)
+        except JsonRpcError:
+            raise
+        except Exception as e:
+            self.logger.warning(traceback.format_exc())
+            order.fail({"code": 0, "message": "不可预知的错误: {}".format(e)})
+        for response in order.finish():
+            yield processor(response)
+
+    def _send_stream(self, payload: list, processor):
+        for chunk in self.split_batch(payload):
+            yield from self._stream_chunk(chunk, processor)
+
+
+class BatchOrder(object):
+    """
+    流式接收批量返回时按请求顺序产出, 先到的返回暂存, 节点按顺序返回时不占用额外内存.
+    """
+
+    def __init__(self, payload: list):
+        self._ids = [p['id'] for p in payload]
+        self._index = set(self._ids)
+        self._next = 0
+        self._early = {}
+        self._error = None
+
+    def push(self, data) -> list:
+        """收到一条返回, 返回可以按顺序产出的返回列表"""
+        if not isinstance(data, dict) or data.get('id') not in self._index:
+            # 整个批量请求失败时节点只返回一个错误
+            error = data.get('error') if isinstance(data, dict) else None
+            self.fail(error or {"code": -32603, "message": "批量请求返回数据错误: {}".format(data)})
+            return []
+        self._early[data['id']] = data
+        ready = []
+        while self._next < len(self._ids) and self._ids[self._next] in self._early:
+            ready.append(self._early.pop(self._ids[self._next]))
+            self._next += 1
+        return ready
+
+    def fail(self, error: dict):
+        if self._error is None:
+            self._error = error
+
+    def finish(self) -> list:
+        """数据结束, 剩余未收到的请求填充 error"""
+        error = self._error or {"code": -32603, "message": "批量请求中缺少该 id 的返回"}
+        ready = []
+        for _id in self._ids[self._next:]:
+            ready.append(self._early.pop(_id, None) or {'jsonrpc': "2.0", 'id': _id, 'error': error})
+        self._next = len(self._ids)
+        return ready
 
 
 class JsonRpcSingleMixin(object):
@@ -58,19 +279,20 @@ class JsonRpcV1(Http, JsonRpcSingleMixin):
     _default_is_json = True
 
     def __init__(self, host, **kwargs):
-        self._id = 0
+        self._id = JsonRpcId()
         super().__init__(host, **kwargs)
 
     def get_id(self):
-        _id = self._id
-        self._id += 1
-        yield _id
+        yield self._id.next()
 
     def reset_id(self):
-        self._id = 0
+        """
+        重置 id. 多线程共用实例时不要在请求过程中调用, 否则并发中的批量请求可能拿到重复 id.
+        """
+        self._id.reset()
 
     def build_payload(self, method, params, id=None):
-        _id = id or self._id
+        _id = self._id.next() if id is None else id
         return {"id": _id, 'method': method, 'params': params, 'jsonrpc': self.__version}
 
     def choice_post_func(self, params, diff=False):
@@ -105,28 +327,111 @@ class JsonRpcV1(Http, JsonRpcSingleMixin):
             return []
         return [p]
 
+    def _fetch(self, params):
+        """发送请求并解析返回数据, 网络等异常直接抛出, 由调用方处理"""
+        rsp = Http.post(self, self.host, params=params)
+        if self._is_json:
+            try:
+                # 直接从 bytes 解码, 不经过 rsp.text
+                return self._codec.loads(rsp.content)
+            except ValueError as e:
+                self.logger.warning("rsp json decode error: {}".format(e))
+        return rsp.text
+
+    def _fetch_stream(self, params):
+        """流式发送请求, 逐个产出返回数组中解析完成的元素"""
+        stream = JsonArrayStream(self._codec.loads)
+        for chunk in Http.post_stream(self, self.host, params=params):
+            yield from stream.feed(chunk)
+        stream.close()
+
     def _send_data(self, params, processor):
         try:
-            rsp = super().post(self.host, params=params)
-            if self._is_json:
-                try:
-                    rsp_result = rsp.json()
-                except JSONDecodeError as e:
-                    self.logger.warning("rsp json decode error: {}".format(e))
-                    rsp_result = rsp.text
-            else:
-                rsp_result = rsp.text
+            rsp_result = self._fetch(params)
         except Exception as e:
             rsp_result = {'error': {"code": 0, "message": "不可预知的错误: {}".format(e)}}
             self.logger.warning(traceback.format_exc())
-        result = processor(rsp_result)
-        self.reset_id()
-        return result
+        return processor(rsp_result)
 
 
 class JsonRpcV2(JsonRpcV1, JsonRpcBatchMixin):
     __version = '2.0'
 
+    def __init__(self, host, **kwargs):
+        """
+        :param max_batch_size: 单次批量请求最大条数, None 表示不限制
+        :param max_batch_bytes: 单次批量请求体最大字节数, None 表示不限制
+        :param batch_workers: 并发发送拆分后批次的线程数
+        :param cache: httplibs.cache.RpcCache, 结果缓存, 默认不缓存
+        :param single_flight: httplibs.singleflight.SingleFlight 或 True, 合并相同的在途只读请求,
+            仅同步客户端支持, 默认不合并
+        """
+        super().__init__(host, **kwargs)
+        self._cache = kwargs.get('cache')
+        self._single_flight = kwargs.get('single_flight')
+        if self._single_flight is True:
+            self._single_flight = SingleFlight()
+        self._max_batch_size = kwargs.get('max_batch_size', self._default_max_batch_size)
+        self._max_batch_bytes = kwargs.get('max_batch_bytes', self._default_max_batch_bytes)
+        self._batch_workers = kwargs.get('batch_workers', self._default_batch_workers)
+        self._batch_lock = threading.Lock()
+        self._batch_executor = None
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def single_flight(self):
+        return self._single_flight
+
+    def _send_data(self, params, processor):
+        """单条请求依次经过: 缓存 -> 在途请求合并 -> 发送"""
+        if not isinstance(params, dict) or (self._cache is None and self._single_flight is None):
+            return super()._send_data(params, processor)
+        response = self._cache.get_response(params) if self._cache is not None else None
+        if response is not None:
+            return processor(response)
+
+        def fetch():
+            return super(JsonRpcV2, self)._send_data(params, lambda data: data)
+
+        if self._single_flight is None:
+            response = fetch()
+        else:
+            response = self._single_flight.do(params, fetch)
+        if self._cache is not None:
+            self._cache.set_response(params, response)
+        return processor(response)
+
+    def _send_batch(self, payload: list, processor):
+        """批量请求依次经过: 缓存(只请求未命中部分) -> 在途请求合并 -> 拆分并发发送"""
+        if self._cache is None and self._single_flight is None:
+            return super()._send_batch(payload, processor)
+        if self._cache is not None:
+            responses, misses = self._cache.lookup(payload)
+        else:
+            responses, misses = [None] * len(payload), payload
+
+        def fetch(requests):
+            return super(JsonRpcV2, self)._send_batch(requests, lambda data: data)
+
+        if not misses:
+            fetched = []
+        elif self._single_flight is None:
+            fetched = fetch(misses)
+        else:
+            fetched = self._single_flight.do_many(misses, fetch)
+        if self._cache is not None:
+            return processor(self._cache.store(misses, fetched, responses))
+        return processor(fetched)
+
+    def close(self):
+        if self._batch_executor is not None:
+            self._batch_executor.shutdown(wait=False)
+            self._batch_executor = None
+        super().close()
+
     def choice_post_func(self, params, diff=False):
         """
         选择一个合适的 post 方法, 主要用于 many_post 与 single_post 之间自动选择.
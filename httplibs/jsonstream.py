@@ -0,0 +1,69 @@
+import re
+
+
+class JsonArrayStream(object):
+    """
+    增量解析 json 数组, 每收到一段数据调用 feed(), 返回其中已经完整的数组元素.
+    只缓存当前未完成的元素, 内存占用约为一个元素加一段数据, 不需要等整个返回体到达.
+    元素需为 object 或 array(jsonrpc 批量返回满足); 顶层不是数组时整体作为一个元素返回.
+        stream = JsonArrayStream(codec.loads)
+        for chunk in chunks:
+            for item in stream.feed(chunk):
+                ...
+        stream.close()
+    """
+    # 跳过字符串与非括号字符, 停在下一个括号或未结束的字符串开头
+    _SKIP = re.compile(rb'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+    _OPEN = frozenset(b'{[')
+
+    def __init__(self, loads):
+        """
+        :param loads: bytes -> object, 如 httplibs.codec.JsonCodec().loads
+        """
+        self._loads = loads
+        self._buffer = bytearray()
+        self._pos = 0
+        self._depth = 0
+        # 当前元素在 buffer 中的起始位置, None 表示不在元素中
+        self._start = None
+        # 顶层是否为数组, None 表示还未读到
+        self._array = None
+        self.count = 0
+
+    def feed(self, data: bytes) -> list:
+        buffer = self._buffer
+        buffer += data
+        items = []
+        pos, depth, start = self._pos, self._depth, self._start
+        skip = self._SKIP.match
+        while True:
+            pos = skip(buffer, pos).end()
+            if pos >= len(buffer) or buffer[pos] == 0x22:
+                # 数据用完, 或字符串还没有结束, 等待下一段数据
+                break
+            if buffer[pos] in self._OPEN:
+                depth += 1
+                if depth == 1:
+                    self._array = buffer[pos] == 0x5b
+                if depth == (2 if self._array else 1):
+                    start = pos
+            else:
+                depth -= 1
+                if depth < 0:
+                    raise ValueError('json 数据格式错误, 括号不匹配')
+                if start is not None and depth == (1 if self._array else 0):
+                    items.append(self._loads(bytes(buffer[start:pos + 1])))
+                    self.count += 1
+                    start = None
+            pos += 1
+            if start is None:
+                # 不在元素中时丢弃已扫描的数据
+                del buffer[:pos]
+                pos = 0
+        self._pos, self._depth, self._start = pos, depth, start
+        return items
+
+    def close(self):
+        """数据结束时调用, 数组没有完整结束时抛出 ValueError"""
+        if self._depth != 0 or self._array is None:
+            raise ValueError('json 数据不完整, 已解析 {} 个元素'.format(self.count))
@@ -0,0 +1,123 @@
+import threading
+
+from httplibs.cache import request_key
+
+
+class _Flight(object):
+    __slots__ = ('event', 'response', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    在途请求合并. 多个线程同时发起相同 (method, params) 的只读请求时, 只有第一个请求(leader)真正发送,
+    其他请求等待并共享 leader 的返回或异常. 通过 JsonRpcV2(host, single_flight=SingleFlight()) 使用.
+    批量请求按条合并, 只有没有在途的请求会被发送.
+    """
+    _default_methods = frozenset({
+        'eth_blockNumber', 'eth_syncing', 'eth_gasPrice', 'eth_chainId', 'net_version',
+        'eth_getBalance', 'eth_getTransactionCount', 'eth_call', 'eth_estimateGas', 'eth_getLogs',
+        'eth_getBlockByNumber', 'eth_getBlockByHash', 'eth_getTransactionByHash', 'eth_getTransactionReceipt',
+    })
+
+    def __init__(self, methods=None):
+        """
+        :param methods: 可合并的方法, 默认只合并只读方法, 发送交易、创建地址等方法不能合并
+        """
+        self.methods = frozenset(methods) if methods is not None else self._default_methods
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counter = {'requests': 0, 'leaders': 0, 'shared': 0}
+
+    def get_key(self, request: dict):
+        if request.get('method') not in self.methods:
+            return None
+        return request_key(request['method'], request['params'])
+
+    def _acquire(self, key) -> tuple:
+        with self._lock:
+            self._counter['requests'] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counter['shared'] += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self._counter['leaders'] += 1
+            return flight, True
+
+    def _finish(self, key, flight, response=None, error=None):
+        flight.response = response
+        flight.error = error
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.event.set()
+
+    @classmethod
+    def _follow(cls, flight, request):
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        if isinstance(flight.response, dict) and 'id' in flight.response:
+            return dict(flight.response, id=request['id'])
+        return flight.response
+
+    def do(self, request: dict, fetch):
+        """
+        :param request: jsonrpc 请求体
+        :param fetch: 无参函数, 真正发送请求并返回 jsonrpc 返回体
+        """
+        key = self.get_key(request)
+        if key is None:
+            return fetch()
+        flight, leader = self._acquire(key)
+        if not leader:
+            return self._follow(flight, request)
+        try:
+            response = fetch()
+        except Exception as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, response=response)
+        return response
+
+    def do_many(self, payload: list, fetch) -> list:
+        """
+        :param payload: 批量请求体
+        :param fetch: fetch(requests) -> responses, 按顺序返回 requests 的 jsonrpc 返回体
+        :return: 按 payload 顺序的返回体
+        """
+        lead, follow = [], []
+        for k, request in enumerate(payload):
+            key = self.get_key(request)
+            if key is None:
+                lead.append((k, None, None))
+                continue
+            flight, leader = self._acquire(key)
+            (lead if leader else follow).append((k, key, flight))
+
+        responses = [None] * len(payload)
+        try:
+            fetched = fetch([payload[k] for k, _, _ in lead]) if lead else []
+        except Exception as e:
+            for _, key, flight in lead:
+                if flight is not None:
+                    self._finish(key, flight, error=e)
+            raise
+        for (k, key, flight), response in zip(lead, fetched):
+            responses[k] = response
+            if flight is not None:
+                self._finish(key, flight, response=response)
+        for k, _, flight in follow:
+            responses[k] = self._follow(flight, payload[k])
+        return responses
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counter)
+            stats['inFlight'] = len(self._flights)
+        stats['dedupRatio'] = stats['shared'] / stats['requests'] if stats['requests'] else 0
+        return stats
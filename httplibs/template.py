@@ -0,0 +1,92 @@
+import json
+import re
+
+
+class RequestTemplate(object):
+    """
+    预编码的 jsonrpc 请求模板. 把 (method, 参数结构) 编码一次为 bytes 片段, 批量请求时只把 id 与变化的字段
+    直接写入 bytearray, 不再为每条请求构建 dict 并整体 json 编码.
+    参数中用 RequestTemplate.slot(name) 表示占位, 占位可以是整个字符串, 也可以是字符串的一部分:
+        template = RequestTemplate('eth_getBalance', [RequestTemplate.slot('address'), RequestTemplate.slot('height')])
+        body = template.render(ids, addresses, height='latest')
+    每次 render 只允许一个占位随请求变化(values), 其他占位通过关键字参数固定.
+    """
+    ID = 'id'
+    _MARK = '__tpl_{}__'
+    _MARK_RE = re.compile(rb'"__tpl_id__"|__tpl_(\w+?)__')
+
+    def __init__(self, method: str, params):
+        """
+        :param method: jsonrpc 方法
+        :param params: 请求参数, 包含 slot 占位
+        """
+        self.method = method
+        request = {'jsonrpc': "2.0", "id": self.slot(self.ID), 'method': method, "params": params}
+        encoded = json.dumps(request, separators=(',', ':')).encode()
+        self.parts = []
+        self.slots = []
+        last = 0
+        for m in self._MARK_RE.finditer(encoded):
+            self.parts.append(encoded[last:m.start()])
+            self.slots.append(m.group(1).decode() if m.group(1) else self.ID)
+            last = m.end()
+        self.parts.append(encoded[last:])
+
+    @classmethod
+    def slot(cls, name: str) -> str:
+        return cls._MARK.format(name)
+
+    @classmethod
+    def encode_value(cls, value) -> bytes:
+        """占位的值写在 json 字符串内部, 只有字母数字(如 hex 地址)可以直接写入, 其他需要转义"""
+        value = str(value)
+        if value.isalnum() and value.isascii():
+            return value.encode()
+        return json.dumps(value)[1:-1].encode()
+
+    def compile(self, **fixed) -> tuple:
+        """
+        固定的占位合并进前后片段
+        :return: (pieces, variables), 请求 = pieces[0] + variables[0] + pieces[1] + ... + pieces[-1]
+        """
+        pieces, variables = [self.parts[0]], []
+        for slot, part in zip(self.slots, self.parts[1:]):
+            if slot in fixed:
+                pieces[-1] += self.encode_value(fixed[slot]) + part
+            else:
+                variables.append(slot)
+                pieces.append(part)
+        variable_slots = set(variables) - {self.ID}
+        if len(variable_slots) > 1:
+            raise ValueError('请求模板只允许一个可变占位, 其余需要固定: {}'.format(variable_slots))
+        return pieces, variables
+
+    def item_size(self, value_size: int, **fixed) -> int:
+        """单条请求编码后的大约字节数, 用于按字节数拆分批次"""
+        pieces, variables = self.compile(**fixed)
+        return sum(len(piece) for piece in pieces) + 11 * variables.count(self.ID) + value_size * (
+            len(variables) - variables.count(self.ID))
+
+    def render(self, ids, values, **fixed) -> bytes:
+        """
+        :param ids: 每条请求的 id
+        :param values: 每条请求可变占位的值, 与 ids 一一对应
+        :param fixed: 固定占位的值
+        :return: 批量请求体 bytes
+        """
+        pieces, variables = self.compile(**fixed)
+        # 片段拼成 bytes 格式串, 每条请求一次 % 格式化
+        fmt = b'%s'.join(piece.replace(b'%', b'%%') for piece in pieces)
+        encode = self.encode_value
+        is_id = [variable == self.ID for variable in variables]
+        buffer = bytearray(b'[')
+        for _id, value in zip(ids, values):
+            _id = b'%d' % _id
+            value = encode(value)
+            buffer += fmt % tuple([_id if k else value for k in is_id])
+            buffer += b','
+        if len(buffer) > 1:
+            buffer[-1:] = b']'
+        else:
+            buffer += b']'
+        return bytes(buffer)
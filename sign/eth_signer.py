@@ -0,0 +1,303 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import hmac
+import logging
+import threading
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+from coin.resolver.eth_rlp import EthereumRlp
+from digit import digit
+from sha3 import keccak_256
+
+# secp256k1
+_P = 2 ** 256 - 2 ** 32 - 977
+_N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
+_G = (0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798,
+      0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8)
+
+
+def _jacobian_double(p):
+    x, y, z = p
+    if not y:
+        return 0, 0, 0
+    ysq = y * y % _P
+    s = 4 * x * ysq % _P
+    m = 3 * x * x % _P
+    nx = (m * m - 2 * s) % _P
+    ny = (m * (s - nx) - 8 * ysq * ysq) % _P
+    return nx, ny, 2 * y * z % _P
+
+
+def _jacobian_add(p, q):
+    if not p[1]:
+        return q
+    if not q[1]:
+        return p
+    z1z1, z2z2 = p[2] * p[2] % _P, q[2] * q[2] % _P
+    u1, u2 = p[0] * z2z2 % _P, q[0] * z1z1 % _P
+    s1, s2 = p[1] * z2z2 * q[2] % _P, q[1] * z1z1 * p[2] % _P
+    if u1 == u2:
+        return _jacobian_double(p) if s1 == s2 else (0, 0, 1)
+    h, r = u2 - u1, s2 - s1
+    h2 = h * h % _P
+    h3 = h * h2 % _P
+    u1h2 = u1 * h2 % _P
+    nx = (r * r - h3 - 2 * u1h2) % _P
+    ny = (r * (u1h2 - nx) - s1 * h3) % _P
+    return nx, ny, h * p[2] * q[2] % _P
+
+
+def _point_mul(k: int, point=_G) -> tuple:
+    result, addend = (0, 0, 1), (point[0], point[1], 1)
+    while k:
+        if k & 1:
+            result = _jacobian_add(result, addend)
+        addend = _jacobian_double(addend)
+        k >>= 1
+    z = pow(result[2], _P - 2, _P)
+    return result[0] * z * z % _P, result[1] * z * z * z % _P
+
+
+def _rfc6979_nonce(secret: bytes, msg_hash: bytes) -> int:
+    """RFC 6979 确定性 k, 与 libsecp256k1 默认的 nonce 函数结果一致"""
+    h1 = (int.from_bytes(msg_hash, 'big') % _N).to_bytes(32, 'big')
+    v, k = b'\x01' * 32, b'\x00' * 32
+    k = hmac.new(k, v + b'\x00' + secret + h1, hashlib.sha256).digest()
+    v = hmac.new(k, v, hashlib.sha256).digest()
+    k = hmac.new(k, v + b'\x01' + secret + h1, hashlib.sha256).digest()
+    v = hmac.new(k, v, hashlib.sha256).digest()
+    while True:
+        v = hmac.new(k, v, hashlib.sha256).digest()
+        nonce = int.from_bytes(v, 'big')
+        if 1 <= nonce < _N:
+            return nonce
+        k = hmac.new(k, v + b'\x00', hashlib.sha256).digest()
+        v = hmac.new(k, v, hashlib.sha256).digest()
+
+
+def ecdsa_sign(secret: bytes, msg_hash: bytes) -> tuple:
+    """
+    secp256k1 签名, 安装 coincurve 时使用 libsecp256k1, 否则为纯 python 实现(慢约两个数量级, 结果相同).
+    纯 python 的标量乘法不是常数时间, 耗时与私钥相关, 不能用于真实钱包
+    :return: (recovery_id, r, s), s 为 low-s
+    """
+    if coincurve is not None:
+        sig = coincurve.PrivateKey(secret).sign_recoverable(msg_hash, hasher=None)
+        return sig[64], int.from_bytes(sig[:32], 'big'), int.from_bytes(sig[32:64], 'big')
+    d = int.from_bytes(secret, 'big')
+    z = int.from_bytes(msg_hash, 'big')
+    k = _rfc6979_nonce(secret, msg_hash)
+    x, y = _point_mul(k)
+    r = x % _N
+    s = pow(k, _N - 2, _N) * (z + r * d) % _N
+    recovery_id = (y & 1) | (2 if x >= _N else 0)
+    if s > _N // 2:
+        s = _N - s
+        recovery_id ^= 1
+    return recovery_id, r, s
+
+
+def public_key(secret: bytes) -> bytes:
+    """未压缩公钥, 不带 0x04 前缀"""
+    if coincurve is not None:
+        return coincurve.PrivateKey(secret).public_key.format(compressed=False)[1:]
+    x, y = _point_mul(int.from_bytes(secret, 'big'))
+    return x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+
+
+class SignedTx(object):
+    FIELDS = ('raw', 'tx_hash', 'sender', 'nonce')
+    __slots__ = FIELDS
+
+    def __init__(self, raw, tx_hash, sender, nonce):
+        self.raw = raw
+        self.tx_hash = tx_hash
+        self.sender = sender
+        self.nonce = nonce
+
+    def __getstate__(self):
+        return self.raw, self.tx_hash, self.sender, self.nonce
+
+    def __setstate__(self, state):
+        self.raw, self.tx_hash, self.sender, self.nonce = state
+
+    def to_dict(self) -> dict:
+        return {
+            "raw": self.raw,
+            "txHash": self.tx_hash,
+            "sender": self.sender,
+            "nonce": self.nonce,
+        }
+
+
+# 进程池中每个进程的签名器, 由 _init_worker 创建, 私钥只在进程启动时传入一次
+_worker_signer = None
+
+
+def _init_worker(chain_id, secrets, allow_slow_insecure):
+    global _worker_signer
+    _worker_signer = EthereumSigner(chain_id, secrets, allow_slow_insecure=allow_slow_insecure)
+
+
+def _sign_chunk(txs: list) -> list:
+    return [_worker_signer.sign_transaction(tx) for tx in txs]
+
+
+class EthereumSigner(object):
+    """
+    离线签名, 生成 send_raw_transaction 使用的原始交易, 不需要节点解锁账户.
+    交易格式与 EthereumResolver.get_transfer_body 相同(from, to, value, gas, gasPrice, data), 另需 nonce;
+    带 maxFeePerGas 或 type 为 0x2 时为 EIP-1559 交易(maxFeePerGas, maxPriorityFeePerGas, accessList),
+    否则为 EIP-155 legacy 交易. 数值字段可以是 int 或 hex str.
+    sign_many 使用进程池批量签名, 私钥在进程启动时传入, 之后每批只传交易.
+    需要安装 coincurve(libsecp256k1, 常数时间); 纯 python 实现有计时侧信道, 只能通过 allow_slow_insecure 显式启用.
+        signer = EthereumSigner(chain_id=1, keys=[private_key])
+        signed = signer.sign_transaction(dict(body, nonce=nonce))
+        rpc.send_raw_transaction(signed.raw)
+    """
+    LEGACY = 0
+    EIP1559 = 2
+    # 每个进程每次签名的交易数
+    _default_chunk_size = 500
+    # 少于该数量时在当前进程签名
+    _default_pool_threshold = 1000
+
+    def __init__(self, chain_id: int, keys=None, processes=None, chunk_size=None, allow_slow_insecure=False):
+        """
+        :param chain_id: 链 id, 主网为 1
+        :param keys: 私钥列表, hex str 或 32 字节 bytes
+        :param processes: sign_many 的进程数, 默认为 cpu 数
+        :param chunk_size: sign_many 每个进程每次签名的交易数, 默认 500
+        :param allow_slow_insecure: 没有安装 coincurve 时允许使用纯 python 实现, 非常数时间, 只用于测试
+        """
+        if coincurve is None:
+            if not allow_slow_insecure:
+                raise ImportError('EthereumSigner 需要安装 coincurve, 纯 python 签名有计时侧信道, '
+                                  '测试时可设置 allow_slow_insecure=True')
+            logging.warning('没有安装 coincurve, 使用纯 python 签名, 耗时与私钥相关, 不能用于真实钱包')
+        self.allow_slow_insecure = allow_slow_insecure
+        self.chain_id = chain_id
+        self.processes = processes
+        self.chunk_size = chunk_size or self._default_chunk_size
+        self._keys = {}
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        for key in keys or []:
+            self.add_key(key)
+
+    @classmethod
+    def to_secret(cls, private_key: str or bytes) -> bytes:
+        secret = private_key if isinstance(private_key, bytes) else bytes.fromhex(digit.del_0x(private_key))
+        if len(secret) != 32 or not 0 < int.from_bytes(secret, 'big') < _N:
+            raise ValueError('无效的私钥')
+        return secret
+
+    @classmethod
+    def private_to_address(cls, private_key: str or bytes) -> str:
+        return '0x' + keccak_256(public_key(cls.to_secret(private_key))).hexdigest()[-40:]
+
+    def add_key(self, private_key: str or bytes) -> str:
+        """:return: 私钥对应的地址(小写)"""
+        secret = self.to_secret(private_key)
+        address = self.private_to_address(secret)
+        self._keys[address] = secret
+        return address
+
+    @property
+    def addresses(self) -> list:
+        return list(self._keys)
+
+    def __contains__(self, address):
+        return address is not None and digit.add_0x(address).lower() in self._keys
+
+    @classmethod
+    def tx_type(cls, tx: dict) -> int:
+        if 'type' in tx:
+            return digit.hex_to_int(tx['type']) if isinstance(tx['type'], str) else tx['type']
+        return cls.EIP1559 if 'maxFeePerGas' in tx else cls.LEGACY
+
+    @classmethod
+    def _field(cls, tx: dict, name: str, default=0) -> int:
+        value = tx.get(name, default)
+        if value is None:
+            raise ValueError('交易缺少 {}'.format(name))
+        return digit.hex_to_int(value) if isinstance(value, str) else value
+
+    @classmethod
+    def _access_list(cls, tx: dict) -> list:
+        return [[item['address'], item.get('storageKeys', [])] for item in tx.get('accessList') or []]
+
+    @classmethod
+    def signing_fields(cls, tx: dict, chain_id: int) -> list:
+        """需要签名的 rlp 字段, 不含签名"""
+        nonce = cls._field(tx, 'nonce', None)
+        to = tx.get('to') or b''
+        value = cls._field(tx, 'value')
+        gas = cls._field(tx, 'gas', None)
+        data = tx.get('data') or tx.get('input') or b''
+        if cls.tx_type(tx) == cls.EIP1559:
+            return [chain_id, nonce, cls._field(tx, 'maxPriorityFeePerGas', None), cls._field(tx, 'maxFeePerGas', None),
+                    gas, to, value, data, cls._access_list(tx)]
+        return [nonce, cls._field(tx, 'gasPrice', None), gas, to, value, data]
+
+    @classmethod
+    def signing_hash(cls, tx: dict, chain_id: int) -> bytes:
+        fields = cls.signing_fields(tx, chain_id)
+        if cls.tx_type(tx) == cls.EIP1559:
+            return keccak_256(bytes((cls.EIP1559,)) + EthereumRlp.encode(fields)).digest()
+        # EIP-155
+        return keccak_256(EthereumRlp.encode(fields + [chain_id, 0, 0])).digest()
+
+    @classmethod
+    def serialize(cls, tx: dict, chain_id: int, recovery_id: int, r: int, s: int) -> bytes:
+        fields = cls.signing_fields(tx, chain_id)
+        if cls.tx_type(tx) == cls.EIP1559:
+            return bytes((cls.EIP1559,)) + EthereumRlp.encode(fields + [recovery_id, r, s])
+        return EthereumRlp.encode(fields + [recovery_id + 35 + chain_id * 2, r, s])
+
+    def sign_transaction(self, tx: dict) -> SignedTx:
+        """
+        :param tx: 交易, from 必须是已添加私钥的地址; 带 chainId 时必须与签名器一致
+        """
+        sender = digit.add_0x(tx.get('from') or '').lower()
+        secret = self._keys.get(sender)
+        if secret is None:
+            raise ValueError('没有 {} 的私钥'.format(tx.get('from')))
+        if 'chainId' in tx and self._field(tx, 'chainId') != self.chain_id:
+            raise ValueError('交易的 chainId {} 与签名器 {} 不一致'.format(tx['chainId'], self.chain_id))
+        tx_type = self.tx_type(tx)
+        if tx_type not in (self.LEGACY, self.EIP1559):
+            raise ValueError('不支持的交易类型: {}'.format(tx_type))
+        raw = self.serialize(tx, self.chain_id, *ecdsa_sign(secret, self.signing_hash(tx, self.chain_id)))
+        return SignedTx('0x' + raw.hex(), '0x' + keccak_256(raw).hexdigest(), sender, self._field(tx, 'nonce'))
+
+    def _get_pool(self, processes) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                                 initargs=(self.chain_id, list(self._keys.values()),
+                                                           self.allow_slow_insecure))
+            return self._pool
+
+    def sign_many(self, txs: list, processes: int = None) -> list:
+        """
+        批量签名, 数量超过 1000 时分块交给进程池, 返回与 txs 一一对应.
+        进程池在第一次使用时创建并复用, 之后 add_key 添加的私钥需要 close() 后才会传入进程池.
+        :param processes: 进程数, 默认为初始化时的 processes
+        """
+        txs = list(txs)
+        processes = processes or self.processes
+        if len(txs) < self._default_pool_threshold or processes == 1:
+            return [self.sign_transaction(tx) for tx in txs]
+        chunks = [txs[i:i + self.chunk_size] for i in range(0, len(txs), self.chunk_size)]
+        return [signed for chunk in self._get_pool(processes).map(_sign_chunk, chunks) for signed in chunk]
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None